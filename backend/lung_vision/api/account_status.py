@@ -0,0 +1,100 @@
+"""
+Set-based account status changes for the admin's bulk actions.
+A bulk approval, rejection or reset is one UPDATE over the selected users still in a status the
+change applies to, plus one insert each for the audit trail and the notification emails and a
+count adjustment per role, all in a single transaction, instead of a save() (and its queries)
+per user.
+"""
+
+import logging
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .authentication import invalidate_users
+from .models import AccountStatusEvent
+from .outbox import enqueue_account_emails
+from .user_counts import adjust_counts
+
+logger = logging.getLogger(__name__)
+
+# Statuses each target status can be reached from
+TRANSITIONS = {
+    'approved': ('pending', 'rejected'),
+    'rejected': ('pending', 'approved'),
+    'pending': ('approved', 'rejected'),
+}
+EMAIL_KINDS = {
+    'approved': 'account_approved',
+    'rejected': 'account_rejected',
+}
+
+
+def bulk_transition(queryset, to_status, actor=None, reason=None, send_email=True):
+    """
+    Move every user in ``queryset`` that can make the change to ``to_status``
+
+    Users already in ``to_status`` are left alone. Approvals and rejections record the actor and
+    time like User.approve()/reject(); a reset to pending clears them.
+
+    Args:
+        queryset: Users to change
+        to_status: ``approved``, ``rejected`` or ``pending``
+        actor: Admin user making the change (optional)
+        reason: Rejection reason (optional)
+        send_email: Queue the approval/rejection notifications
+
+    Returns:
+        list: Ids of the users that were changed
+    """
+    from_statuses = TRANSITIONS[to_status]
+    now = timezone.now()
+    if to_status == 'pending':
+        changes = {'approved_by': None, 'approved_date': None, 'rejection_reason': None}
+    else:
+        changes = {
+            'approved_by': actor,
+            'approved_date': now,
+            'rejection_reason': reason if to_status == 'rejected' else None,
+        }
+
+    with transaction.atomic():
+        users = list(
+            queryset.filter(account_status__in=from_statuses)
+            .select_related(None)
+            .select_for_update()
+            .only('pk', 'email', 'role', 'account_status')
+        )
+        if not users:
+            return []
+        user_ids = [user.pk for user in users]
+        # update() bypasses save(), and with it auto_now
+        get_user_model().objects.filter(pk__in=user_ids, account_status__in=from_statuses).update(
+            account_status=to_status, updated_at=now, **changes,
+        )
+
+        deltas = Counter()
+        for user in users:
+            deltas[(user.role, user.account_status)] -= 1
+            deltas[(user.role, to_status)] += 1
+        adjust_counts(deltas)
+
+        AccountStatusEvent.objects.bulk_create(
+            AccountStatusEvent(
+                user_id=user.pk, actor=actor, from_status=user.account_status, to_status=to_status,
+                reason=changes['rejection_reason'], created_at=now,
+            )
+            for user in users
+        )
+        if send_email and to_status in EMAIL_KINDS:
+            for user in users:
+                user.approved_date = now
+            enqueue_account_emails(EMAIL_KINDS[to_status], users, actor=actor, reason=reason)
+
+        # ...and the post_save invalidation; drop the users once the change is visible
+        transaction.on_commit(lambda: invalidate_users(user_ids))
+
+    logger.info(f"Moved {len(user_ids)} user(s) to {to_status}")
+    return user_ids
@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils import timezone
-from .models import User
+from .account_status import bulk_transition
+from .models import AccountStatusEvent, EmailOutbox, User
+from .user_counts import get_user_counts
+from .user_search import SEARCH_FIELDS, search_users
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -14,7 +18,7 @@ class UserAdmin(BaseUserAdmin):
         'role', 'account_status', 'country', 'specialization', 
         'affiliation_type', 'date_joined', 'approved_date'
     ]
-    search_fields = ['email', 'full_name', 'medical_license_number', 'research_institution']
+    search_fields = list(SEARCH_FIELDS)
     readonly_fields = ['date_joined', 'terms_accepted_date', 'last_login', 'approved_by', 'approved_date']
     
     fieldsets = (
@@ -57,6 +61,19 @@ class UserAdmin(BaseUserAdmin):
     )
     
     ordering = ['-date_joined']
+    # The totals above the list come from the maintained counts instead of a COUNT(*) of the table
+    show_full_result_count = False
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Search through the user search index when it can answer the search"""
+        results = search_users(queryset, search_term) if search_term else None
+        if results is None:
+            return super().get_search_results(request, queryset, search_term)
+        return results, False
+    
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'user_counts': get_user_counts()}
+        return super().changelist_view(request, extra_context=extra_context)
     
     def account_status_display(self, obj):
         """Display account status with color coding"""
@@ -88,26 +105,29 @@ class UserAdmin(BaseUserAdmin):
     
     def save_model(self, request, obj, form, change):
         """Auto-populate approval fields when status is changed"""
-        if change:  # Only for existing objects
-            # Get the original object from database to compare
-            try:
-                original = User.objects.get(pk=obj.pk)
-                
-                # Check if account_status has changed
-                if original.account_status != obj.account_status:
-                    if obj.account_status == 'approved':
-                        obj.approve(approved_by_user=request.user)
-                        return  # approve() method already saves the object
-                    elif obj.account_status == 'rejected':
-                        obj.reject(reason=obj.rejection_reason, rejected_by_user=request.user)
-                        return  # reject() method already saves the object
-                    elif obj.account_status == 'pending':
-                        # Reset approval fields when marking as pending
-                        obj.approved_by = None
-                        obj.approved_date = None
-                        obj.rejection_reason = None
-            except User.DoesNotExist:
-                pass
+        # Only for existing objects; the status they were loaded with tells us whether it changed
+        dirty = obj.get_dirty_fields() if change else {}
+        if 'account_status' in dirty:
+            # approve()/reject() record the change from the stored status
+            new_status, obj.account_status = obj.account_status, dirty['account_status']
+            if new_status == 'approved':
+                obj.approve(approved_by_user=request.user)
+                return  # approve() method already saves the object
+            elif new_status == 'rejected':
+                obj.reject(reason=obj.rejection_reason, rejected_by_user=request.user)
+                return  # reject() method already saves the object
+            elif new_status == 'pending':
+                # Reset approval fields when marking as pending
+                obj.account_status = new_status
+                obj.approved_by = None
+                obj.approved_date = None
+                obj.rejection_reason = None
+                with transaction.atomic():
+                    super().save_model(request, obj, form, change)
+                    AccountStatusEvent.objects.create(
+                        user=obj, actor=request.user, from_status=dirty['account_status'], to_status='pending',
+                    )
+                return
         
         # Call the original save method
         super().save_model(request, obj, form, change)
@@ -116,75 +136,30 @@ class UserAdmin(BaseUserAdmin):
     
     def approve_users(self, request, queryset):
         """Bulk approve users with email notifications"""
-        approved_count = 0
-        email_success_count = 0
-        email_failures = []
-        
-        for user in queryset.filter(account_status__in=['pending', 'rejected']):
-            try:
-                user.approve(approved_by_user=request.user, send_email=True)
-                approved_count += 1
-                email_success_count += 1
-            except Exception as e:
-                # Still approve the user but track email failure
-                user.approve(approved_by_user=request.user, send_email=False)
-                approved_count += 1
-                email_failures.append(f"{user.email} ({user.full_name})")
-        
-        # Create comprehensive message
-        message = f'{approved_count} user(s) have been approved.'
-        if email_success_count > 0:
-            message += f' {email_success_count} approval email(s) sent successfully.'
-        if email_failures:
-            message += f' Failed to send email to: {", ".join(email_failures[:3])}'
-            if len(email_failures) > 3:
-                message += f' and {len(email_failures) - 3} others.'
-        
+        user_ids = bulk_transition(queryset, 'approved', actor=request.user)
+        message = f'{len(user_ids)} user(s) have been approved.'
+        if user_ids:
+            message += f' {len(user_ids)} approval email(s) queued for delivery.'
         self.message_user(request, message)
     approve_users.short_description = "Approve selected users and send email notifications"
     
     def reject_users(self, request, queryset):
         """Bulk reject users with email notifications"""
-        rejected_count = 0
-        email_success_count = 0
-        email_failures = []
         rejection_reason = "Bulk rejection by administrator"
-        
-        for user in queryset.filter(account_status__in=['pending', 'approved']):
-            try:
-                user.reject(reason=rejection_reason, rejected_by_user=request.user, send_email=True)
-                rejected_count += 1
-                email_success_count += 1
-            except Exception as e:
-                # Still reject the user but track email failure
-                user.reject(reason=rejection_reason, rejected_by_user=request.user, send_email=False)
-                rejected_count += 1
-                email_failures.append(f"{user.email} ({user.full_name})")
-        
-        # Create comprehensive message
-        message = f'{rejected_count} user(s) have been rejected.'
-        if email_success_count > 0:
-            message += f' {email_success_count} rejection email(s) sent successfully.'
-        if email_failures:
-            message += f' Failed to send email to: {", ".join(email_failures[:3])}'
-            if len(email_failures) > 3:
-                message += f' and {len(email_failures) - 3} others.'
-        
+        user_ids = bulk_transition(queryset, 'rejected', actor=request.user, reason=rejection_reason)
+        message = f'{len(user_ids)} user(s) have been rejected.'
+        if user_ids:
+            message += f' {len(user_ids)} rejection email(s) queued for delivery.'
         self.message_user(request, message)
     reject_users.short_description = "Reject selected users and send email notifications"
     
     def mark_pending(self, request, queryset):
         """Mark users as pending (useful for re-review)"""
-        count = queryset.exclude(account_status='pending').update(
-            account_status='pending',
-            approved_by=None,
-            approved_date=None,
-            rejection_reason=None
-        )
+        user_ids = bulk_transition(queryset, 'pending', actor=request.user)
         
         self.message_user(
             request,
-            f'{count} user(s) marked as pending approval. Previous approval/rejection details have been cleared.'
+            f'{len(user_ids)} user(s) marked as pending approval. Previous approval/rejection details have been cleared.'
         )
     mark_pending.short_description = "Mark as pending approval"
     
@@ -218,4 +193,34 @@ class UserAdmin(BaseUserAdmin):
 # Custom admin site configuration
 admin.site.site_header = "LungVision Administration"
 admin.site.site_title = "LungVision Admin"
-admin.site.index_title = "Welcome to LungVision Administration"
\ No newline at end of file
+admin.site.index_title = "Welcome to LungVision Administration"
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('to_email', 'idempotency_key')
+    readonly_fields = ('idempotency_key', 'claim_token', 'claimed_at', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        """Send dead-lettered or backed-off messages on the worker's next pass"""
+        # Messages being sent stay with the worker that claimed them, or they could go out twice
+        count = queryset.filter(status__in=('pending', 'dead')).update(
+            status='pending', next_attempt_at=timezone.now(), attempts=0,
+        )
+        self.message_user(request, f'{count} email(s) queued for another delivery attempt.')
+    retry_now.short_description = "Retry selected emails now"
+
+
+@admin.register(AccountStatusEvent)
+class AccountStatusEventAdmin(admin.ModelAdmin):
+    list_display = ('user', 'from_status', 'to_status', 'actor', 'created_at')
+    list_filter = ('to_status', 'from_status')
+    search_fields = ('user__email', 'user__full_name')
+    list_select_related = ('user', 'actor')
+    readonly_fields = ('user', 'actor', 'from_status', 'to_status', 'reason', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
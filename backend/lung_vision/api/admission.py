@@ -0,0 +1,221 @@
+"""
+Admission control for the synchronous predict endpoint.
+Caps how many predictions are in flight globally and per user, lets a short queue absorb
+bursts, and turns everything beyond that into an immediate 429/503 instead of a pile of
+requests that all time out together.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_MAX_PER_USER = 2
+DEFAULT_MAX_QUEUED = 8
+DEFAULT_QUEUE_TIMEOUT = 10
+DEFAULT_RETRY_AFTER = 15
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted"""
+
+    def __init__(self, reason, status_code, retry_after, detail):
+        super().__init__(detail)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class AdmissionController:
+    """
+    Counting gate with a global cap, a per-user cap and a bounded wait queue.
+
+    A user's queued requests count against their cap, so one client cannot fill the queue.
+    Threads wait on a condition variable; coroutines wait on the event loop via aacquire(), so
+    a queued async request holds no thread.
+    """
+
+    def __init__(self, max_in_flight=None, max_per_user=None, max_queued=None, queue_timeout=None, retry_after=None):
+        self.max_in_flight = max_in_flight or getattr(settings, 'PREDICT_ADMISSION_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)
+        self.max_per_user = max_per_user or getattr(settings, 'PREDICT_ADMISSION_MAX_PER_USER', DEFAULT_MAX_PER_USER)
+        self.max_queued = getattr(settings, 'PREDICT_ADMISSION_MAX_QUEUED', DEFAULT_MAX_QUEUED) if max_queued is None else max_queued
+        self.queue_timeout = getattr(settings, 'PREDICT_ADMISSION_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT) if queue_timeout is None else queue_timeout
+        self.retry_after = retry_after or getattr(settings, 'PREDICT_ADMISSION_RETRY_AFTER', DEFAULT_RETRY_AFTER)
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self._per_user = {}
+        # (loop, event) pairs of coroutines waiting in aacquire()
+        self._async_waiters = set()
+
+        # Metrics
+        self.admitted = 0
+        self.peak_queue_depth = 0
+        self.rejections = {'per_user_limit': 0, 'queue_full': 0, 'queue_timeout': 0}
+
+    def _reject(self, reason, status_code, detail):
+        self.rejections[reason] += 1
+        logger.warning(f"Predict admission rejected ({reason}): {self.in_flight} in flight, {self.queued} queued")
+        raise AdmissionRejected(reason, status_code, self.retry_after, detail)
+
+    def _enter(self, user_key):
+        """
+        Apply the caps and count a request in, with the lock held
+
+        Returns:
+            bool: True if the request was queued and must wait for a slot
+        """
+        if self._per_user.get(user_key, 0) >= self.max_per_user:
+            self._reject('per_user_limit', 429, 'You already have the maximum number of predictions running.')
+
+        if self.in_flight >= self.max_in_flight or self.queued:
+            if self.queued >= self.max_queued:
+                self._reject('queue_full', 503, 'The prediction service is busy. Please try again shortly.')
+            self._per_user[user_key] = self._per_user.get(user_key, 0) + 1
+            self.queued += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queued)
+            return True
+
+        self._per_user[user_key] = self._per_user.get(user_key, 0) + 1
+        self._admit()
+        return False
+
+    def _admit(self):
+        self.in_flight += 1
+        self.admitted += 1
+
+    def _leave_queue(self, user_key, admitted):
+        self.queued -= 1
+        if not admitted:
+            self._per_user[user_key] -= 1
+            self._drop_user(user_key)
+
+    def acquire(self, user_key):
+        """
+        Admit a request, waiting in the queue if the global cap is reached
+
+        Args:
+            user_key: Identifier the per-user cap is applied to (user id or client address)
+
+        Raises:
+            AdmissionRejected: 429 when the user is at their cap, 503 when the queue is full
+            or the wait exceeds the queue timeout
+        """
+        with self._condition:
+            if not self._enter(user_key):
+                return
+            deadline = time.monotonic() + self.queue_timeout
+            admitted = False
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject('queue_timeout', 503, 'The prediction service is busy. Please try again shortly.')
+                    self._condition.wait(remaining)
+                self._admit()
+                admitted = True
+            finally:
+                self._leave_queue(user_key, admitted)
+
+    async def aacquire(self, user_key):
+        """acquire() for coroutines: a queued request waits on the event loop, not in a thread"""
+        with self._condition:
+            if not self._enter(user_key):
+                return
+            deadline = time.monotonic() + self.queue_timeout
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        admitted = False
+        try:
+            while True:
+                with self._condition:
+                    if self.in_flight < self.max_in_flight:
+                        self._admit()
+                        admitted = True
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject('queue_timeout', 503, 'The prediction service is busy. Please try again shortly.')
+                    waiter[1].clear()
+                    self._async_waiters.add(waiter)
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+                self._leave_queue(user_key, admitted)
+
+    def release(self, user_key):
+        with self._condition:
+            self.in_flight -= 1
+            self._per_user[user_key] -= 1
+            self._drop_user(user_key)
+            self._condition.notify()
+            # Every waiting coroutine re-checks; the ones that lose the race wait again
+            for loop, event in self._async_waiters:
+                loop.call_soon_threadsafe(event.set)
+
+    def _drop_user(self, user_key):
+        if not self._per_user.get(user_key):
+            self._per_user.pop(user_key, None)
+
+    @contextmanager
+    def slot(self, user_key):
+        """Context manager around acquire()/release()"""
+        self.acquire(user_key)
+        try:
+            yield
+        finally:
+            self.release(user_key)
+
+    def stats(self):
+        """Current load and rejection counters"""
+        with self._condition:
+            return {
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'peak_queue_depth': self.peak_queue_depth,
+                'max_in_flight': self.max_in_flight,
+                'max_per_user': self.max_per_user,
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'rejections': dict(self.rejections),
+            }
+
+
+def get_user_key(request):
+    """Key a request by authenticated user, falling back to the client address"""
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f"ip:{request.META.get('REMOTE_ADDR', 'unknown')}"
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Get the process-wide predict admission controller"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
+
+
+@receiver(setting_changed)
+def _reset_admission_controller(*, setting, **kwargs):
+    global _controller
+    if setting.startswith('PREDICT_ADMISSION_'):
+        with _controller_lock:
+            _controller = None
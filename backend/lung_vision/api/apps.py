@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connect the user receivers (cache invalidation, counts, search index) in every process,
+        # including ones that never authenticate a request (admin, management commands)
+        from . import authentication  # noqa: F401
+        from . import user_counts  # noqa: F401
+        from . import user_search  # noqa: F401
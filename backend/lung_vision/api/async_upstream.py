@@ -0,0 +1,71 @@
+"""
+Async HTTP client for the FastAPI inference upstream, used by the ASGI predict path.
+A waiting prediction is a suspended coroutine rather than a blocked thread, so one process can
+hold as many in-flight upstream calls as the connection pool allows.
+"""
+
+import asyncio
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .upstream import DEFAULT_BASE_URL, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, DEFAULT_RETRIES
+
+DEFAULT_ASYNC_POOL_SIZE = 100
+
+
+class AsyncUpstreamClient:
+    """
+    Pooled httpx.AsyncClient bound to one upstream base URL.
+
+    Only connection failures are retried, matching UpstreamClient's policy for POSTs: the
+    request never reached the server, so a prediction is never run twice.
+    """
+
+    def __init__(self, base_url, pool_size=None, connect_timeout=None, read_timeout=None, retries=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size or getattr(settings, 'INFERENCE_ASYNC_POOL_SIZE', DEFAULT_ASYNC_POOL_SIZE)
+        self.connect_timeout = connect_timeout or getattr(settings, 'INFERENCE_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = read_timeout or getattr(settings, 'INFERENCE_TIMEOUT', DEFAULT_READ_TIMEOUT)
+        retries = getattr(settings, 'INFERENCE_RETRIES', DEFAULT_RETRIES) if retries is None else retries
+
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            transport=httpx.AsyncHTTPTransport(retries=retries, limits=limits),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=self.read_timeout),
+        )
+
+    async def post(self, path, **kwargs):
+        return await self.client.post(path, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# httpx clients are tied to the event loop they were first used on, so keep one set per loop
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_async_upstream_client(base_url=None):
+    """Get the async client for ``base_url`` on the running event loop"""
+    base_url = base_url or getattr(settings, 'INFERENCE_BASE_URL', DEFAULT_BASE_URL)
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _clients.setdefault(loop, {})
+        if base_url not in clients:
+            clients[base_url] = AsyncUpstreamClient(base_url)
+        return clients[base_url]
+
+
+@receiver(setting_changed)
+def _reset_async_upstream_clients(*, setting, **kwargs):
+    # Dropped clients close their connections when garbage collected
+    if setting.startswith('INFERENCE_'):
+        with _clients_lock:
+            _clients.clear()
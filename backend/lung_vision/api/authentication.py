@@ -0,0 +1,214 @@
+"""
+JWT authentication that resolves the token's user from a cache instead of the database.
+Users are cached per process (and optionally in a shared Django cache) under their id and a
+version stamp; any save of the user bumps the stamp, so approvals, rejections, deactivations and
+password changes take effect on the next request in every process sharing the stamp. Without a
+shared cache the stamps are process-local, and a change saved by another process applies here
+once the local copy expires, after AUTH_USER_CACHE_LOCAL_TTL seconds. Cache hits never query
+the database either way.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import BOOKKEEPING_FIELDS
+
+DEFAULT_MAX_ENTRIES = 10000
+# Matches the access token lifetime
+DEFAULT_TTL = 5 * 60
+# Bounds how stale a user can be when no shared cache carries the stamps
+DEFAULT_LOCAL_TTL = 30
+VERSION_KEY = 'auth-user-version:{}'
+USER_KEY = 'auth-user:{}:{}'
+# Attribute set on authenticated users: the version stamp they were loaded under
+AUTH_VERSION_ATTR = '_auth_version'
+
+
+class UserAuthCache:
+    """
+    Thread-safe LRU of user objects keyed by user id and version stamp.
+
+    Without a shared cache the stamps are process-local, so a change made in another process
+    doesn't bump them; users are then only trusted for ``local_ttl`` seconds. With ``alias`` set,
+    stamps and users live in that Django cache too, and every process sees a bump on its next
+    lookup.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, alias=None, local_ttl=None):
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'AUTH_USER_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'AUTH_USER_CACHE_TTL', DEFAULT_TTL)
+        self.local_ttl = local_ttl if local_ttl is not None else getattr(settings, 'AUTH_USER_CACHE_LOCAL_TTL', DEFAULT_LOCAL_TTL)
+        alias = alias if alias is not None else getattr(settings, 'AUTH_USER_CACHE_ALIAS', None)
+        self.shared = caches[alias] if alias else None
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id):
+        """Current version stamp of a user"""
+        if self.shared is None:
+            with self._lock:
+                return self._versions.get(user_id, 0)
+        key = VERSION_KEY.format(user_id)
+        version = self.shared.get(key)
+        if version is None:
+            # Start from a fresh stamp rather than 0, so an evicted counter can never
+            # resurrect users cached under an older one
+            self.shared.add(key, time.time_ns(), None)
+            version = self.shared.get(key)
+        return version
+
+    def get(self, user_id, version):
+        """Return a copy of the cached user at ``version``, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] >= time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return copy.copy(entry[2])
+
+        user = self.shared.get(USER_KEY.format(user_id, version)) if self.shared is not None else None
+        with self._lock:
+            if user is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store(user_id, version, user)
+        return copy.copy(user)
+
+    def set(self, user_id, version, user):
+        """Cache a user loaded from the database at ``version``"""
+        self._store(user_id, version, user)
+        if self.shared is not None:
+            self.shared.set(USER_KEY.format(user_id, version), user, self.ttl)
+
+    def _store(self, user_id, version, user):
+        ttl = self.ttl if self.shared is not None else min(self.ttl, self.local_ttl)
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Bump a user's version stamp so no cached copy of them is served again"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            if self.shared is None:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        if self.shared is not None:
+            try:
+                self.shared.incr(VERSION_KEY.format(user_id))
+            except ValueError:
+                # No stamp yet; the next lookup starts a fresh one
+                pass
+
+    def clear(self):
+        """Drop all local entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Get the process-wide authentication user cache"""
+    global _user_cache
+    with _user_cache_lock:
+        if _user_cache is None:
+            _user_cache = UserAuthCache()
+        return _user_cache
+
+
+@receiver(setting_changed)
+def _reset_user_cache(*, setting, **kwargs):
+    global _user_cache
+    if setting.startswith('AUTH_USER_CACHE_'):
+        with _user_cache_lock:
+            _user_cache = None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Drop-in replacement for simplejwt's JWTAuthentication that skips the per-request user query.
+
+    Token validation is unchanged; only the lookup of the token's user is served from
+    UserAuthCache, with the same active and revoked-password checks applied to cached users.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        # Token claims and model ids differ in type (str vs int), so key everything by str
+        user_id = str(user_id)
+        cache = get_user_cache()
+        version = cache.version(user_id)
+        user = cache.get(user_id, version)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(user_id, version, user)
+            user = copy.copy(user)
+        setattr(user, AUTH_VERSION_ATTR, version)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+def _invalidate(user_id):
+    get_user_cache().invalidate(user_id)
+    # Bump again once the change commits: a request that read the old row while the
+    # transaction was still open may have cached it under the first bump
+    transaction.on_commit(lambda: get_user_cache().invalidate(user_id))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _invalidate_saved_user(sender, instance, update_fields=None, **kwargs):
+    # Recording a login changes nothing authentication depends on
+    if update_fields is not None and set(update_fields) <= BOOKKEEPING_FIELDS:
+        return
+    _invalidate(str(getattr(instance, api_settings.USER_ID_FIELD)))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _invalidate_deleted_user(sender, instance, **kwargs):
+    _invalidate(str(getattr(instance, api_settings.USER_ID_FIELD)))
+
+
+def invalidate_users(user_ids):
+    """Invalidate users changed without a save(), e.g. by QuerySet.update()"""
+    cache = get_user_cache()
+    for user_id in user_ids:
+        cache.invalidate(str(user_id))
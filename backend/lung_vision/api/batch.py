@@ -0,0 +1,280 @@
+"""
+Batch predictions for multi-patient submissions.
+A batch is split into one archive per patient, and the patients are run through the normal
+prediction path on a small thread pool, each taking its own predict admission slot. A patient's archive is only extracted when its
+prediction starts, so memory stays bounded by the pool size rather than the batch size. Results are yielded in completion order so the view can
+stream them while the rest of the batch is still running.
+"""
+
+import csv
+import json
+import logging
+import posixpath
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+
+from .admission import AdmissionRejected, get_admission_controller
+from .circuit_breaker import CircuitOpen
+from .history import record_prediction
+from .inference import run_prediction
+from .preflight import IGNORED_PREFIXES, PreflightError, preflight_archive
+from .routing import NoBackendAvailable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 2
+DEFAULT_MAX_PATIENTS = 100
+# Per-patient archives larger than this spill from memory to disk
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+CSV_COLUMNS = (
+    'patient_id', 'status', 'predicted_class', 'confidence', 'class_probabilities',
+    'cache_status', 'duration_ms', 'error',
+)
+
+
+class BatchError(Exception):
+    """A batch that cannot be split into patients, with the HTTP status to report"""
+
+    def __init__(self, detail, status_code=400, **extra):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.extra = extra
+
+    def as_dict(self):
+        return {'detail': self.detail, **self.extra}
+
+
+class PatientArchive:
+    """
+    One patient's archive, as a named, seekable file object
+
+    Pass either ``fileobj`` or ``extract``, a callable building the file on first access.
+    """
+
+    def __init__(self, patient_id, fileobj=None, name=None, extract=None):
+        self.patient_id = patient_id
+        self.name = name or f'{patient_id}.zip'
+        self._file = fileobj
+        self._extract = extract
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = self._extract()
+        return self._file
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def get_max_patients():
+    return getattr(settings, 'BATCH_PREDICT_MAX_PATIENTS', DEFAULT_MAX_PATIENTS)
+
+
+def _check_patient_count(count):
+    if not count:
+        raise BatchError('The batch does not contain any patients.')
+    if count > get_max_patients():
+        raise BatchError(f'A batch may contain at most {get_max_patients()} patients.', status_code=413, patients=count)
+
+
+def split_patient_folders(fileobj):
+    """
+    Split an archive of patient folders into one archive per patient
+
+    Each top-level folder is a patient, named after the folder. A single wrapping folder
+    (``batch/P001/..., batch/P002/...``) is looked through. The caller is expected to have
+    preflighted the archive, so sizes and paths are already known to be safe.
+
+    Only the folder layout is read here; each patient is extracted when its file is first
+    used, so ``fileobj`` must stay open until the batch has run.
+
+    Args:
+        fileobj: Seekable binary file object holding the batch archive
+
+    Returns:
+        list: PatientArchive objects, sorted by patient id
+
+    Raises:
+        BatchError: If the archive has no patient folders or too many of them
+    """
+    fileobj.seek(0)
+    archive = zipfile.ZipFile(fileobj)
+    infos = [
+        info for info in archive.infolist()
+        if not info.is_dir() and not info.filename.startswith(IGNORED_PREFIXES)
+    ]
+    parts = [info.filename.replace('\\', '/').split('/') for info in infos]
+    # Look through a single folder wrapping all the patient folders
+    while parts and all(len(p) > 2 for p in parts) and len({p[0] for p in parts}) == 1:
+        parts = [p[1:] for p in parts]
+    if any(len(p) < 2 for p in parts):
+        raise BatchError('Expected one folder per patient at the top of the archive.')
+
+    members = {}
+    for info, path in zip(infos, parts):
+        members.setdefault(path[0], []).append((info, posixpath.join(*path[1:])))
+    _check_patient_count(len(members))
+
+    # Pool threads extract one at a time: every patient reads from the same upload
+    lock = threading.Lock()
+
+    def extract(patient_members):
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        with lock, zipfile.ZipFile(spool, 'w', compression=zipfile.ZIP_STORED) as out:
+            for info, name in patient_members:
+                with archive.open(info) as src, out.open(name, 'w') as dst:
+                    while chunk := src.read(1024 * 1024):
+                        dst.write(chunk)
+        spool.seek(0)
+        return spool
+
+    return [
+        PatientArchive(patient_id, extract=lambda m=members[patient_id]: extract(m))
+        for patient_id in sorted(members)
+    ]
+
+
+def patients_from_manifest(manifest, files):
+    """
+    Pair manifest entries with the uploaded archives they name
+
+    Args:
+        manifest: JSON text or decoded object: ``[{"patient_id": "P001", "file": "p001.zip"}, ...]``
+            (or ``{"patients": [...]}``)
+        files: Mapping of uploaded filename to UploadedFile
+
+    Returns:
+        list: PatientArchive objects, in manifest order
+
+    Raises:
+        BatchError: If the manifest is malformed or names a file that was not uploaded
+    """
+    if isinstance(manifest, (str, bytes)):
+        try:
+            manifest = json.loads(manifest)
+        except ValueError:
+            raise BatchError('The manifest is not valid JSON.')
+    if isinstance(manifest, dict):
+        manifest = manifest.get('patients')
+    if not isinstance(manifest, list):
+        raise BatchError('The manifest must be a list of {"patient_id", "file"} entries.')
+    _check_patient_count(len(manifest))
+
+    patients = []
+    seen = set()
+    for index, entry in enumerate(manifest):
+        if not isinstance(entry, dict) or not entry.get('patient_id') or not entry.get('file'):
+            raise BatchError('Every manifest entry needs a patient_id and a file.', entry=index)
+        patient_id = str(entry['patient_id'])
+        if patient_id in seen:
+            raise BatchError(f'Patient {patient_id} appears more than once in the manifest.', entry=index)
+        seen.add(patient_id)
+        upload = files.get(entry['file'])
+        if upload is None:
+            raise BatchError(f"No uploaded file named {entry['file']}.", entry=index)
+        patients.append(PatientArchive(patient_id, upload, name=upload.name))
+    return patients
+
+
+def _run_patient(patient, user_key):
+    started = time.monotonic()
+    row = {'patient_id': patient.patient_id}
+    outcome = None
+    try:
+        preflight_archive(patient.file)
+        with get_admission_controller().slot(user_key):
+            outcome = run_prediction(patient.file, filename=patient.name)
+    except PreflightError as e:
+        row.update(status='failed', error=e.detail, code=e.code)
+    except AdmissionRejected as e:
+        row.update(status='failed', error=e.detail, reason=e.reason, retry_after=e.retry_after)
+    except CircuitOpen:
+        row.update(status='failed', error='The inference service is currently unavailable.', upstream_status=503)
+    except NoBackendAvailable:
+        row.update(status='failed', error='No inference backend is available.', upstream_status=503)
+    except requests.RequestException as e:
+        row.update(status='failed', error=f'Upstream error contacting FastAPI: {str(e)}', upstream_status=502)
+    except Exception:
+        logger.exception(f"Batch prediction crashed for patient {patient.patient_id}")
+        row.update(status='failed', error='Internal error while running this prediction.')
+    else:
+        data = outcome.data if isinstance(outcome.data, dict) else {}
+        if 200 <= outcome.status_code < 300 and data.get('success', True):
+            row.update(
+                status='completed',
+                predicted_class=data.get('predicted_class'),
+                confidence=data.get('confidence'),
+                class_probabilities=data.get('class_probabilities'),
+                cache_status=outcome.cache_status,
+                result=data,
+            )
+        else:
+            row.update(status='failed', error=data.get('detail') or data.get('message'), upstream_status=outcome.status_code)
+    finally:
+        patient.close()
+    row['duration_ms'] = int((time.monotonic() - started) * 1000)
+    return row, outcome
+
+
+def run_batch(patients, user_key, user=None, concurrency=None):
+    """
+    Run every patient's prediction with at most ``concurrency`` in flight
+
+    Each upstream call is admitted like a single predict request for ``user_key``, so a batch
+    never runs more predictions than the user's admission cap allows. Completed predictions
+    are recorded in the history from the consuming thread, so the pool threads never open
+    database connections of their own. Closing the generator early drops the patients that
+    have not started.
+
+    Yields:
+        dict: One result row per patient, in completion order
+    """
+    concurrency = concurrency or getattr(settings, 'BATCH_PREDICT_CONCURRENCY', DEFAULT_CONCURRENCY)
+    # More threads than the per-user cap would only have their own patients rejected
+    concurrency = min(concurrency, get_admission_controller().max_per_user)
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-predict')
+    try:
+        futures = [pool.submit(_run_patient, patient, user_key) for patient in patients]
+        for future in as_completed(futures):
+            row, outcome = future.result()
+            if row['status'] == 'completed':
+                record_prediction(outcome, user=user, duration=row['duration_ms'] / 1000)
+            yield row
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def ndjson_lines(rows):
+    """Encode rows as newline-delimited JSON, ending with a summary line"""
+    counts = {'total': 0, 'completed': 0, 'failed': 0}
+    for row in rows:
+        counts['total'] += 1
+        counts[row['status']] += 1
+        yield json.dumps(row, default=str) + '\n'
+    yield json.dumps({'summary': counts}) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Encode rows as CSV with a header line; class probabilities are a JSON column"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        values = dict(row, class_probabilities=json.dumps(row['class_probabilities']) if row.get('class_probabilities') else '')
+        yield writer.writerow([values.get(column, '') if values.get(column) is not None else '' for column in CSV_COLUMNS])
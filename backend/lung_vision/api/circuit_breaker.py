@@ -0,0 +1,191 @@
+"""
+Circuit breaker around the inference upstream.
+After repeated failures (or responses slower than the latency threshold) the breaker opens and
+predictions fail fast instead of waiting on a dead or wedged model server. Once the reset timeout
+passes, a limited number of trial requests decide whether it closes again.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_SLOW_CALL_SECONDS = 120
+DEFAULT_RESET_TIMEOUT = 30
+DEFAULT_HALF_OPEN_CALLS = 1
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling the upstream while the breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__('Inference service circuit is open')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive failures or slow calls.
+    Open -> half-open once ``reset_timeout`` seconds have passed.
+    Half-open -> closed when a trial call succeeds, or back to open when it fails.
+    """
+
+    def __init__(self, failure_threshold=None, slow_call_seconds=None, reset_timeout=None, half_open_calls=None):
+        self.failure_threshold = failure_threshold or getattr(settings, 'INFERENCE_BREAKER_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD)
+        self.slow_call_seconds = slow_call_seconds or getattr(settings, 'INFERENCE_BREAKER_SLOW_CALL_SECONDS', DEFAULT_SLOW_CALL_SECONDS)
+        self.reset_timeout = getattr(settings, 'INFERENCE_BREAKER_RESET_TIMEOUT', DEFAULT_RESET_TIMEOUT) if reset_timeout is None else reset_timeout
+        self.half_open_calls = half_open_calls or getattr(settings, 'INFERENCE_BREAKER_HALF_OPEN_CALLS', DEFAULT_HALF_OPEN_CALLS)
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trials = 0
+
+        # Metrics
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._trials = 0
+        logger.warning(f"Inference circuit opened after {self.consecutive_failures} consecutive failure(s)")
+
+    def before_call(self):
+        """
+        Check whether a call may proceed
+
+        Returns:
+            bool: True if the call is a half-open trial, whose outcome decides the breaker's state
+
+        Raises:
+            CircuitOpen: If the breaker is open, or half-open with all trial slots taken
+        """
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self.short_circuited += 1
+                    raise CircuitOpen(retry_after=max(1, int(remaining + 0.999)))
+                self.state = HALF_OPEN
+                self._trials = 0
+                logger.info("Inference circuit half-open, sending trial request")
+            if self.state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    self.short_circuited += 1
+                    raise CircuitOpen(retry_after=1)
+                self._trials += 1
+                return True
+            return False
+
+    def record(self, success, duration=0.0, trial=False):
+        """
+        Record a call outcome; calls slower than ``slow_call_seconds`` count as failures.
+        While half-open only trial calls decide the state: a call admitted before the breaker
+        opened says nothing about whether the upstream has recovered.
+        """
+        failed = not success or duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not trial:
+                    return
+                self._trials = max(0, self._trials - 1)
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._trials = 0
+                    self.consecutive_failures = 0
+                    logger.info("Inference circuit closed after a successful trial request")
+                return
+            if failed:
+                self.consecutive_failures += 1
+                if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                    self._open()
+            else:
+                self.consecutive_failures = 0
+
+    def _release_trial(self, trial):
+        with self._lock:
+            if trial and self.state == HALF_OPEN:
+                self._trials = max(0, self._trials - 1)
+
+    @contextmanager
+    def call(self, ignore=()):
+        """
+        Guard an upstream call. Raising inside the block records a failure; set
+        ``guard.failed = True`` to record one without raising (e.g. on a 5xx response).
+        Exceptions listed in ``ignore`` (local conditions such as no free backend) record nothing,
+        and neither does a call abandoned by cancellation; either way a trial slot is given back.
+        """
+        trial = self.before_call()
+        guard = _Guard()
+        started = time.monotonic()
+        success = None
+        try:
+            yield guard
+            success = not guard.failed
+        except ignore:
+            raise
+        except Exception:
+            success = False
+            raise
+        finally:
+            if success is None:
+                self._release_trial(trial)
+            else:
+                self.record(success, time.monotonic() - started, trial=trial)
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'slow_call_seconds': self.slow_call_seconds,
+                'reset_timeout': self.reset_timeout,
+                'half_open_in': retry_in,
+                'times_opened': self.times_opened,
+                'short_circuited': self.short_circuited,
+            }
+
+
+class _Guard:
+    def __init__(self):
+        self.failed = False
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """Get the process-wide inference circuit breaker"""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker()
+        return _breaker
+
+
+@receiver(setting_changed)
+def _reset_circuit_breaker(*, setting, **kwargs):
+    global _breaker
+    if setting.startswith('INFERENCE_'):
+        with _breaker_lock:
+            _breaker = None
@@ -4,12 +4,15 @@ Handles sending professional email notifications for account approval/rejection.
 """
 
 import logging
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+import smtplib
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
+from django.template.defaultfilters import date as format_date, time as format_time
 from django.utils import timezone
 from typing import Optional
 
+from .email_templates import EmailShells, get_email_template
+
 logger = logging.getLogger(__name__)
 
 class EmailService:
@@ -21,6 +24,54 @@ class EmailService:
         # This should be configured in settings
         return getattr(settings, 'FRONTEND_LOGIN_URL', 'http://localhost:3000/role-selection')
     
+    @staticmethod
+    def format_timestamp(value):
+        """Format a decision time for an email, e.g. "March 04, 2025 at 2:30 PM" in the current time zone"""
+        value = timezone.template_localtime(value)
+        return f'{format_date(value, "F d, Y")} at {format_time(value, "g:i A")}'
+
+    @staticmethod
+    def build_account_approved_email(user, approved_by=None, connection=None, shells=None):
+        """
+        Render the account approval notification for a user
+
+        Args:
+            user: User instance that was approved
+            approved_by: Admin user who approved the account (optional)
+            connection: Mail backend connection to send through (optional)
+            shells: EmailShells of the batch this message belongs to (optional)
+
+        Returns:
+            EmailMultiAlternatives: The message, ready to send
+        """
+        # Prepare context for email templates
+        context = {
+            'user': user,
+            'approved_by': approved_by,
+            'approved_on': EmailService.format_timestamp(user.approved_date or timezone.now()),
+            'login_url': EmailService.get_login_url(),
+        }
+
+        # Render email templates
+        html_content, text_content = (shells or get_email_template('account_approved')).render(context)
+
+        # Create subject line
+        subject = f'🎉 Your {user.get_role_display()} Account has been Approved - LungVision'
+
+        # Create email message
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_content,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email],
+            reply_to=[settings.DEFAULT_FROM_EMAIL],
+            connection=connection,
+        )
+
+        # Attach HTML version
+        email.attach_alternative(html_content, "text/html")
+        return email
+
     @staticmethod
     def send_account_approved_email(user, approved_by=None):
         """
@@ -34,35 +85,7 @@ class EmailService:
             bool: True if email was sent successfully, False otherwise
         """
         try:
-            # Prepare context for email templates
-            context = {
-                'user': user,
-                'approved_by': approved_by,
-                'approval_date': user.approved_date or timezone.now(),
-                'login_url': EmailService.get_login_url(),
-            }
-            
-            # Render email templates
-            html_content = render_to_string('emails/account_approved.html', context)
-            text_content = render_to_string('emails/account_approved.txt', context)
-            
-            # Create subject line
-            subject = f'🎉 Your {user.get_role_display()} Account has been Approved - LungVision'
-            
-            # Create email message
-            email = EmailMultiAlternatives(
-                subject=subject,
-                body=text_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[user.email],
-                reply_to=[settings.DEFAULT_FROM_EMAIL],
-            )
-            
-            # Attach HTML version
-            email.attach_alternative(html_content, "text/html")
-            
-            # Send email
-            email.send()
+            EmailService.build_account_approved_email(user, approved_by).send()
             
             logger.info(f"Account approval email sent successfully to {user.email} ({user.full_name})")
             return True
@@ -71,6 +94,50 @@ class EmailService:
             logger.error(f"Failed to send account approval email to {user.email}: {str(e)}")
             return False
     
+    @staticmethod
+    def build_account_rejected_email(user, rejection_reason=None, rejected_by=None, connection=None, shells=None):
+        """
+        Render the account rejection notification for a user
+
+        Args:
+            user: User instance that was rejected
+            rejection_reason: Reason for rejection (optional)
+            rejected_by: Admin user who rejected the account (optional)
+            connection: Mail backend connection to send through (optional)
+            shells: EmailShells of the batch this message belongs to (optional)
+
+        Returns:
+            EmailMultiAlternatives: The message, ready to send
+        """
+        # Prepare context for email templates
+        context = {
+            'user': user,
+            'rejected_by': rejected_by,
+            # approved_date is used for both approval and rejection timestamps
+            'reviewed_on': EmailService.format_timestamp(user.approved_date or timezone.now()),
+            'rejection_reason': rejection_reason or user.rejection_reason,
+        }
+
+        # Render email templates
+        html_content, text_content = (shells or get_email_template('account_rejected')).render(context)
+
+        # Create subject line
+        subject = f'Account Application Update - LungVision {user.get_role_display()} Application'
+
+        # Create email message
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_content,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email],
+            reply_to=[settings.DEFAULT_FROM_EMAIL],
+            connection=connection,
+        )
+
+        # Attach HTML version
+        email.attach_alternative(html_content, "text/html")
+        return email
+
     @staticmethod
     def send_account_rejected_email(user, rejection_reason=None, rejected_by=None):
         """
@@ -85,35 +152,7 @@ class EmailService:
             bool: True if email was sent successfully, False otherwise
         """
         try:
-            # Prepare context for email templates
-            context = {
-                'user': user,
-                'rejected_by': rejected_by,
-                'rejection_date': user.approved_date or timezone.now(),  # approved_date is used for both approval and rejection timestamps
-                'rejection_reason': rejection_reason or user.rejection_reason,
-            }
-            
-            # Render email templates
-            html_content = render_to_string('emails/account_rejected.html', context)
-            text_content = render_to_string('emails/account_rejected.txt', context)
-            
-            # Create subject line
-            subject = f'Account Application Update - LungVision {user.get_role_display()} Application'
-            
-            # Create email message
-            email = EmailMultiAlternatives(
-                subject=subject,
-                body=text_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[user.email],
-                reply_to=[settings.DEFAULT_FROM_EMAIL],
-            )
-            
-            # Attach HTML version
-            email.attach_alternative(html_content, "text/html")
-            
-            # Send email
-            email.send()
+            EmailService.build_account_rejected_email(user, rejection_reason, rejected_by).send()
             
             logger.info(f"Account rejection email sent successfully to {user.email} ({user.full_name})")
             return True
@@ -123,32 +162,101 @@ class EmailService:
             return False
     
     @staticmethod
-    def send_bulk_approval_emails(users, approved_by=None):
+    def send_messages_in_chunks(messages, chunk_size=None):
         """
-        Send approval emails to multiple users
-        
+        Send prepared messages, reusing one mail connection for each chunk of them
+
+        Messages go out one at a time over the open connection so each failure is attributed to
+        its own message. A failed message does not stop the chunk: the session is reopened (unless
+        the server merely refused the recipient) and sending continues.
+
         Args:
-            users: QuerySet or list of User instances
-            approved_by: Admin user who approved the accounts
-        
+            messages: List of EmailMessage instances
+            chunk_size: Messages per connection (defaults to EMAIL_BULK_CHUNK_SIZE)
+
         Returns:
-            dict: Summary of email sending results
+            list: Per message, None if it was sent or the error message if it was not
         """
+        chunk_size = chunk_size or getattr(settings, 'EMAIL_BULK_CHUNK_SIZE', 100)
+        errors = []
+        for start in range(0, len(messages), chunk_size):
+            chunk = messages[start:start + chunk_size]
+            connection = get_connection()
+            try:
+                connection.open()
+            except Exception as e:
+                logger.error(f"Could not open a mail connection for {len(chunk)} message(s): {str(e)}")
+                errors.extend(str(e) for _ in chunk)
+                continue
+            try:
+                for message in chunk:
+                    message.connection = connection
+                    try:
+                        if not connection.send_messages([message]):
+                            raise RuntimeError('The mail backend did not accept the message.')
+                        errors.append(None)
+                    except Exception as e:
+                        errors.append(str(e))
+                        if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                            # The session may be unusable after an error; continue on a fresh one
+                            connection.close()
+                            try:
+                                connection.open()
+                            except Exception:
+                                pass
+            finally:
+                connection.close()
+        return errors
+
+    @staticmethod
+    def _send_bulk(users, build, label):
         results = {
             'success_count': 0,
             'failure_count': 0,
-            'failed_emails': []
+            'failed_emails': [],
+            'errors': {},
         }
-        
+
+        # Render everything before the first connection is opened; messages of one batch share
+        # everything but the recipient, so most are filled in from pre-rendered shells
+        messages, recipients = [], []
         for user in users:
-            if EmailService.send_account_approved_email(user, approved_by):
+            try:
+                messages.append(build(user))
+                recipients.append(user.email)
+            except Exception as e:
+                results['failure_count'] += 1
+                results['failed_emails'].append(user.email)
+                results['errors'][user.email] = str(e)
+
+        for email, error in zip(recipients, EmailService.send_messages_in_chunks(messages)):
+            if error is None:
                 results['success_count'] += 1
             else:
                 results['failure_count'] += 1
-                results['failed_emails'].append(user.email)
-        
-        logger.info(f"Bulk approval emails: {results['success_count']} sent, {results['failure_count']} failed")
+                results['failed_emails'].append(email)
+                results['errors'][email] = error
+
+        logger.info(f"Bulk {label} emails: {results['success_count']} sent, {results['failure_count']} failed")
         return results
+
+    @staticmethod
+    def send_bulk_approval_emails(users, approved_by=None):
+        """
+        Send approval emails to multiple users
+        
+        Args:
+            users: QuerySet or list of User instances
+            approved_by: Admin user who approved the accounts
+        
+        Returns:
+            dict: Summary of email sending results, with ``errors`` mapping each failed address
+                to its error
+        """
+        shells = EmailShells(get_email_template('account_approved'), per_recipient=('approved_on',))
+        return EmailService._send_bulk(
+            users, lambda user: EmailService.build_account_approved_email(user, approved_by, shells=shells), 'approval',
+        )
     
     @staticmethod
     def send_bulk_rejection_emails(users, rejection_reason=None, rejected_by=None):
@@ -161,23 +269,15 @@ class EmailService:
             rejected_by: Admin user who rejected the accounts
         
         Returns:
-            dict: Summary of email sending results
+            dict: Summary of email sending results, with ``errors`` mapping each failed address
+                to its error
         """
-        results = {
-            'success_count': 0,
-            'failure_count': 0,
-            'failed_emails': []
-        }
-        
-        for user in users:
-            if EmailService.send_account_rejected_email(user, rejection_reason, rejected_by):
-                results['success_count'] += 1
-            else:
-                results['failure_count'] += 1
-                results['failed_emails'].append(user.email)
-        
-        logger.info(f"Bulk rejection emails: {results['success_count']} sent, {results['failure_count']} failed")
-        return results
+        shells = EmailShells(get_email_template('account_rejected'), per_recipient=('reviewed_on',))
+        return EmailService._send_bulk(
+            users,
+            lambda user: EmailService.build_account_rejected_email(user, rejection_reason, rejected_by, shells=shells),
+            'rejection',
+        )
 
 
 # Convenience functions for easy import
@@ -0,0 +1,161 @@
+"""
+Compiled notification email templates.
+Each email is an HTML and a text template, compiled once per process and rendered together from
+one context. Bulk sends go through EmailShells, which renders each variant of a template once
+with placeholders for the user's fields and only substitutes those fields for every recipient.
+"""
+
+import logging
+import threading
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template import Context
+from django.template.base import render_value_in_context
+from django.template.loader import get_template
+from django.utils.autoreload import file_changed
+from django.utils.safestring import mark_safe
+
+logger = logging.getLogger(__name__)
+
+# Separates static text from field names in a rendered shell; never appears in a template
+MARKER = '\x00'
+DEFAULT_MAX_SHELLS = 16
+
+
+class EmailTemplate:
+    """The HTML and text templates of one email, e.g. ``account_approved``"""
+
+    def __init__(self, name):
+        self.name = name
+        self.html = get_template(f'emails/{name}.html').template
+        self.text = get_template(f'emails/{name}.txt').template
+
+    def render(self, context):
+        """
+        Render both parts from one context
+
+        Returns:
+            tuple: (html, text)
+        """
+        context = Context(context, autoescape=self.html.engine.autoescape)
+        return self.html.render(context), self.text.render(context)
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_email_template(name):
+    """Get the process-wide compiled EmailTemplate for an email"""
+    with _templates_lock:
+        template = _templates.get(name)
+        if template is None:
+            template = _templates[name] = EmailTemplate(name)
+        return template
+
+
+def _clear_templates():
+    with _templates_lock:
+        _templates.clear()
+
+
+@receiver(setting_changed)
+def _reset_templates(*, setting, **kwargs):
+    if setting == 'TEMPLATES':
+        _clear_templates()
+
+
+@receiver(file_changed)
+def _reload_templates(*, file_path, **kwargs):
+    # The dev server reloads edited templates without restarting; drop the compiled copies too
+    if file_path.suffix in ('.html', '.txt'):
+        _clear_templates()
+
+
+class _ShellUser:
+    """Stands in for the user while a shell is rendered: every field renders as a placeholder"""
+
+    def __init__(self, role):
+        # Templates branch on the role, so shells are rendered per role with the real value
+        self.role = role
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return mark_safe(f'{MARKER}{name}{MARKER}')
+
+
+class EmailShells:
+    """
+    Pre-rendered variants of one email for messages that differ only in their recipient.
+
+    A shell is the email rendered with placeholders for the ``user`` fields and for the context
+    values named in ``per_recipient`` (e.g. a pre-formatted decision date), split into static
+    text and field names; each variant (role plus every other context value) is rendered once.
+    Per-recipient values are substituted as they are, so they must be strings the template
+    prints without filters or tests. The first message of a variant is rendered normally too
+    and compared with its shell, and any variant the placeholders can't reproduce (e.g. a filter
+    applied to a user field) falls back to normal rendering. Keep one instance per batch: shells
+    hold the batch's shared values.
+    """
+
+    def __init__(self, template, max_shells=DEFAULT_MAX_SHELLS, per_recipient=()):
+        self.template = template
+        self.max_shells = max_shells
+        self.per_recipient = frozenset(per_recipient)
+        self._shells = {}
+        self._escape_context = Context(autoescape=template.html.engine.autoescape)
+
+    def _build(self, context):
+        placeholders = {key: mark_safe(f'{MARKER}@{key}{MARKER}') for key in self.per_recipient if key in context}
+        html, text = self.template.render(dict(context, user=_ShellUser(context['user'].role), **placeholders))
+        return tuple(part.split(MARKER) for part in (html, text))
+
+    def _fill(self, shell, context):
+        user = context['user']
+        rendered = []
+        for parts in shell:
+            values = []
+            for name in parts[1::2]:
+                if name.startswith('@'):
+                    value = context[name[1:]]
+                else:
+                    value = getattr(user, name)
+                    if callable(value):
+                        value = value()
+                values.append(render_value_in_context(value, self._escape_context))
+            out = [parts[0]]
+            for value, static in zip(values, parts[2::2]):
+                out.append(value)
+                out.append(static)
+            rendered.append(''.join(out))
+        return tuple(rendered)
+
+    def render(self, context):
+        """
+        Render an email for ``context['user']``, from a shell when possible
+
+        Returns:
+            tuple: (html, text)
+        """
+        user = context['user']
+        try:
+            shared = ((k, v) for k, v in context.items() if k != 'user' and k not in self.per_recipient)
+            key = (user.role, tuple(sorted(shared)))
+            shell = self._shells.get(key, False)
+        except TypeError:
+            # Unhashable shared values, e.g. an unsaved actor
+            return self.template.render(context)
+        if shell is False:
+            rendered = self.template.render(context)
+            if len(self._shells) < self.max_shells:
+                shell = self._build(context)
+                if self._fill(shell, context) != rendered:
+                    logger.debug(f"Email {self.template.name} can't be rendered from a shell; rendering it normally")
+                    shell = None
+                self._shells[key] = shell
+            return rendered
+        if shell is None:
+            return self.template.render(context)
+        return self._fill(shell, context)
@@ -0,0 +1,61 @@
+"""
+Prediction history.
+Every successful prediction, synchronous or queued, is recorded as a Prediction row so past
+results can be listed and reopened instead of re-running the model.
+"""
+
+import logging
+
+from django.db import DatabaseError
+
+from .models import Prediction
+from .prediction_cache import get_model_version
+
+logger = logging.getLogger(__name__)
+
+
+def record_prediction(outcome, user=None, duration=None, job=None, queued=None):
+    """
+    Persist a completed prediction
+
+    Failures are logged rather than raised: losing a history row must never fail the prediction
+    the user is waiting for.
+
+    Args:
+        outcome: PredictionOutcome returned by run_prediction()
+        user: Requesting user (anonymous users are stored as NULL)
+        duration: Wall-clock seconds spent producing the result
+        job: PredictionJob the result belongs to, for queued predictions
+        queued: Seconds the job waited before a worker picked it up
+
+    Returns:
+        Prediction or None: The new row, or None if the outcome is not a successful prediction
+    """
+    data = outcome.data
+    if not 200 <= outcome.status_code < 300 or not isinstance(data, dict) or not data.get('success', True):
+        return None
+
+    try:
+        return Prediction.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            job=job,
+            source='job' if job is not None else 'sync',
+            patient_id=str(data.get('patient_id') or '')[:255],
+            archive_hash=outcome.digest or '',
+            predicted_class=str(data.get('predicted_class') or '')[:100],
+            predicted_class_index=data.get('predicted_class_index'),
+            confidence=data.get('confidence'),
+            class_probabilities=data.get('class_probabilities') or {},
+            result=data,
+            model_version=get_model_version(),
+            cache_status=outcome.cache_status,
+            queued_ms=_to_ms(queued),
+            duration_ms=_to_ms(duration),
+        )
+    except DatabaseError:
+        logger.exception("Failed to record prediction history")
+        return None
+
+
+def _to_ms(seconds):
+    return None if seconds is None else max(0, int(seconds * 1000))
@@ -0,0 +1,276 @@
+"""
+Inference service client for LungVision predictions.
+Forwards uploaded DICOM archives to the FastAPI model server without buffering them in memory.
+"""
+
+import logging
+import uuid
+from collections import namedtuple
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .async_upstream import get_async_upstream_client
+from .circuit_breaker import get_circuit_breaker
+from .prediction_cache import PredictionResultCache, archive_digest, get_result_cache, is_cache_enabled
+from .routing import NoBackendAvailable, get_backend_pool
+from .upstream import DEFAULT_READ_TIMEOUT
+from .visualizations import offload_visualizations
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREDICT_PATH = '/predict'
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def get_predict_path():
+    """Get the inference service predict path, relative to INFERENCE_BASE_URL"""
+    return getattr(settings, 'INFERENCE_PREDICT_PATH', DEFAULT_PREDICT_PATH)
+
+
+def get_timeout():
+    """Get the upstream read timeout in seconds"""
+    return getattr(settings, 'INFERENCE_TIMEOUT', DEFAULT_READ_TIMEOUT)
+
+
+def get_chunk_size():
+    """Get the number of bytes read from the upload per streamed chunk"""
+    return getattr(settings, 'INFERENCE_STREAM_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def _quote_filename(filename):
+    """Escape a filename for use inside a Content-Disposition header"""
+    return filename.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartFileStream:
+    """
+    Lazily generated multipart/form-data body wrapping a single file field.
+
+    The file is read ``chunk_size`` bytes at a time while the body is being sent,
+    so peak memory stays bounded regardless of the archive size. The total length
+    is known up front, which lets ``requests`` send a regular Content-Length body
+    instead of chunked transfer encoding.
+    """
+
+    def __init__(self, fileobj, filename, field_name='file', content_type='application/zip',
+                 chunk_size=None, size=None):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size or get_chunk_size()
+        self.boundary = uuid.uuid4().hex
+        self.size = size if size is not None else self._measure(fileobj)
+
+        self._head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{_quote_filename(filename)}"\r\n'
+            f'Content-Type: {content_type}\r\n'
+            '\r\n'
+        ).encode('utf-8')
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+    @staticmethod
+    def _measure(fileobj):
+        fileobj.seek(0, 2)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        return size
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self._head) + self.size + len(self._tail)
+
+    def __iter__(self):
+        # Rewind so the body can be replayed if the connection is retried
+        self.fileobj.seek(0)
+        yield self._head
+        while True:
+            chunk = self.fileobj.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        yield self._tail
+
+    async def aiter_chunks(self):
+        """Async version of iteration; file reads run in a worker thread so a slow disk never stalls the event loop"""
+        chunks = iter(self)
+        read = sync_to_async(next, thread_sensitive=False)
+        while True:
+            chunk = await read(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def parse_upstream_response(resp):
+    """Decode an upstream response body, falling back to the raw text"""
+    try:
+        return resp.json()
+    except ValueError:
+        return {'detail': resp.text}
+
+
+def forward_prediction(upload, timeout=None, chunk_size=None, filename=None):
+    """
+    Stream an uploaded archive to the least loaded healthy inference backend
+
+    Args:
+        upload: Django UploadedFile (or any seekable file object with a ``name``)
+        timeout: Upstream read timeout in seconds (defaults to settings.INFERENCE_TIMEOUT)
+        chunk_size: Bytes read per chunk (defaults to settings.INFERENCE_STREAM_CHUNK_SIZE)
+        filename: Filename reported to the inference service (defaults to ``upload.name``)
+
+    Returns:
+        tuple: (status_code, decoded response payload)
+
+    Raises:
+        requests.RequestException: If the inference service cannot be reached
+        NoBackendAvailable: If every backend is ejected or at its concurrency cap
+        CircuitOpen: If the upstream circuit breaker is open
+    """
+    body = MultipartFileStream(
+        upload,
+        filename or upload.name,
+        chunk_size=chunk_size,
+        size=getattr(upload, 'size', None),
+    )
+    with get_circuit_breaker().call(ignore=(NoBackendAvailable,)) as guard:
+        with get_backend_pool().lease() as lease:
+            client = lease.backend.client
+            resp = client.post(
+                get_predict_path(),
+                data=body,
+                headers={'Content-Type': body.content_type},
+                timeout=(client.connect_timeout, timeout or client.read_timeout),
+            )
+            if resp.status_code >= 500:
+                lease.failed = guard.failed = True
+    return resp.status_code, parse_upstream_response(resp)
+
+
+async def _acquire_backend(pool):
+    try:
+        return pool.acquire(timeout=0)
+    except NoBackendAvailable:
+        # Every backend is busy: wait for a slot in a worker thread, not on the event loop
+        return await sync_to_async(pool.acquire, thread_sensitive=False)()
+
+
+async def aforward_prediction(upload, timeout=None, chunk_size=None, filename=None):
+    """
+    Async counterpart of forward_prediction() for the ASGI predict view
+
+    Shares the backend pool and circuit breaker with the synchronous path, but sends the
+    request with httpx so the caller awaits the upstream instead of blocking a thread.
+
+    Returns:
+        tuple: (status_code, decoded response payload)
+
+    Raises:
+        httpx.HTTPError: If the inference service cannot be reached
+        NoBackendAvailable: If every backend is ejected or at its concurrency cap
+        CircuitOpen: If the upstream circuit breaker is open
+    """
+    body = MultipartFileStream(
+        upload,
+        filename or upload.name,
+        chunk_size=chunk_size,
+        size=getattr(upload, 'size', None),
+    )
+    pool = get_backend_pool()
+    with get_circuit_breaker().call(ignore=(NoBackendAvailable,)) as guard:
+        backend = await _acquire_backend(pool)
+        success = False
+        try:
+            client = get_async_upstream_client(backend.url)
+            resp = await client.post(
+                get_predict_path(),
+                content=body.aiter_chunks(),
+                # An explicit length keeps httpx from falling back to chunked encoding
+                headers={'Content-Type': body.content_type, 'Content-Length': str(len(body))},
+                timeout=httpx.Timeout(timeout or client.read_timeout, connect=client.connect_timeout),
+            )
+            success = resp.status_code < 500
+        finally:
+            pool.release(backend, success)
+        guard.failed = not success
+    return resp.status_code, parse_upstream_response(resp)
+
+
+PredictionOutcome = namedtuple('PredictionOutcome', ['status_code', 'data', 'cache_status', 'digest'])
+
+
+def run_prediction(upload, filename=None):
+    """
+    Run a prediction for an archive, serving repeated archives from the result cache
+
+    Args:
+        upload: Seekable file object holding the archive
+        filename: Filename reported to the inference service (defaults to ``upload.name``)
+
+    Successful payloads have their base64 visualizations offloaded to content-addressed files
+    (see api.visualizations) before they are cached or returned.
+
+    Returns:
+        PredictionOutcome: Upstream status code and payload, plus ``cache_status``
+        (``'HIT'``, ``'MISS'`` or ``'BYPASS'``) and the archive digest
+
+    Raises:
+        requests.RequestException: If the inference service cannot be reached
+        NoBackendAvailable: If every backend is ejected or at its concurrency cap
+        CircuitOpen: If the upstream circuit breaker is open
+    """
+    if not is_cache_enabled():
+        status_code, data = forward_prediction(upload, filename=filename)
+        if 200 <= status_code < 300:
+            data = offload_visualizations(data)
+        return PredictionOutcome(status_code, data, 'BYPASS', None)
+
+    digest = archive_digest(upload)
+    cache = get_result_cache()
+    key = PredictionResultCache.make_key(digest)
+    cached = cache.get(key)
+    if cached is not None:
+        logger.info(f"Prediction cache hit for archive {digest}")
+        return PredictionOutcome(200, cached, 'HIT', digest)
+
+    status_code, data = forward_prediction(upload, filename=filename)
+    if 200 <= status_code < 300:
+        data = offload_visualizations(data)
+        if isinstance(data, dict) and data.get('success', True):
+            cache.set(key, data)
+    return PredictionOutcome(status_code, data, 'MISS', digest)
+
+
+async def arun_prediction(upload, filename=None):
+    """
+    Async counterpart of run_prediction(): same caching and offloading, with hashing and file
+    writes moved off the event loop
+
+    Returns:
+        PredictionOutcome: See run_prediction()
+    """
+    offload = sync_to_async(offload_visualizations, thread_sensitive=False)
+    if not is_cache_enabled():
+        status_code, data = await aforward_prediction(upload, filename=filename)
+        if 200 <= status_code < 300:
+            data = await offload(data)
+        return PredictionOutcome(status_code, data, 'BYPASS', None)
+
+    digest = await sync_to_async(archive_digest, thread_sensitive=False)(upload)
+    cache = get_result_cache()
+    key = PredictionResultCache.make_key(digest)
+    cached = cache.get(key)
+    if cached is not None:
+        logger.info(f"Prediction cache hit for archive {digest}")
+        return PredictionOutcome(200, cached, 'HIT', digest)
+
+    status_code, data = await aforward_prediction(upload, filename=filename)
+    if 200 <= status_code < 300:
+        data = await offload(data)
+        if isinstance(data, dict) and data.get('success', True):
+            cache.set(key, data)
+    return PredictionOutcome(status_code, data, 'MISS', digest)
@@ -0,0 +1,314 @@
+"""
+Background prediction job queue for LungVision.
+Uploads are persisted as PredictionJob rows and forwarded to the inference service by a pool of
+worker threads, so API workers are never held for the duration of a model run.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .circuit_breaker import CircuitOpen
+from .history import record_prediction
+from .inference import run_prediction
+from .models import PredictionJob
+from .progress import get_progress_broker
+from .routing import NoBackendAvailable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 20
+DEFAULT_HEARTBEAT_INTERVAL = 10
+# A running job whose heartbeat is this many intervals old has lost its worker
+HEARTBEAT_MISSES = 3
+
+
+class QueueFull(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+
+def process_job(job_id):
+    """
+    Claim a queued job and forward its archive to the inference service
+
+    Args:
+        job_id: Primary key of the PredictionJob to run
+
+    Returns:
+        PredictionJob or None: The finished job, or None if another worker already claimed it
+    """
+    now = timezone.now()
+    claimed = PredictionJob.objects.filter(pk=job_id, status='queued').update(
+        status='running',
+        started_at=now,
+        heartbeat_at=now,
+        attempts=F('attempts') + 1,
+    )
+    if not claimed:
+        return None
+    # Wakes this job's stream and moves everyone still queued up one place
+    get_progress_broker().publish()
+
+    job = PredictionJob.objects.get(pk=job_id)
+    try:
+        with job.archive.open('rb') as archive:
+            outcome = run_prediction(archive, filename=job.original_filename)
+        status_code, data = outcome.status_code, outcome.data
+        job.upstream_status = status_code
+        job.result = data
+        if 200 <= status_code < 300:
+            job.status = 'completed'
+        else:
+            job.status = 'failed'
+            job.error = data.get('detail') if isinstance(data, dict) else None
+    except CircuitOpen:
+        job.status = 'failed'
+        job.upstream_status = 503
+        job.error = 'The inference service is currently unavailable.'
+    except NoBackendAvailable:
+        job.status = 'failed'
+        job.upstream_status = 503
+        job.error = 'No inference backend is available.'
+    except requests.RequestException as e:
+        job.status = 'failed'
+        job.upstream_status = 502
+        job.error = f'Upstream error contacting FastAPI: {str(e)}'
+    except Exception as e:
+        logger.exception(f"Prediction job {job_id} crashed")
+        job.status = 'failed'
+        job.error = str(e)
+
+    # The archive is only needed until the model has seen it
+    if job.archive:
+        job.archive.delete(save=False)
+    job.completed_at = timezone.now()
+    job.save(update_fields=['status', 'upstream_status', 'result', 'error', 'archive', 'completed_at'])
+
+    if job.status == 'completed':
+        record_prediction(
+            outcome, user=job.user, job=job,
+            duration=(job.completed_at - job.started_at).total_seconds(),
+            queued=(job.started_at - job.created_at).total_seconds(),
+        )
+
+    get_progress_broker().publish(job_id)
+
+    logger.info(f"Prediction job {job_id} finished with status {job.status}")
+    return job
+
+
+class PredictionJobQueue:
+    """
+    Bounded in-process queue with a fixed pool of worker threads.
+
+    Job state lives in the database, so jobs left queued by a previous process are picked up
+    again when the queue starts. Running jobs carry a heartbeat that a separate thread keeps
+    fresh; the same thread hands running jobs whose heartbeat has expired (their worker died,
+    in this process or another) back to the queue.
+    """
+
+    def __init__(self, workers=None, maxsize=None, heartbeat_interval=None):
+        self.workers = getattr(settings, 'PREDICTION_JOB_WORKERS', DEFAULT_WORKERS) if workers is None else workers
+        self.maxsize = getattr(settings, 'PREDICTION_JOB_QUEUE_SIZE', DEFAULT_QUEUE_SIZE) if maxsize is None else maxsize
+        self.heartbeat_interval = heartbeat_interval or getattr(settings, 'PREDICTION_JOB_HEARTBEAT_INTERVAL', DEFAULT_HEARTBEAT_INTERVAL)
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._threads = []
+        self._started = False
+        self._lock = threading.Lock()
+        # Jobs this process's workers are running, kept alive by the heartbeat thread
+        self._running = set()
+
+    def start(self):
+        """Start worker threads and re-enqueue unfinished jobs"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'prediction-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self.workers:
+                # Without workers there is nothing to keep alive and nobody to hand lost jobs to
+                thread = threading.Thread(target=self._heartbeat, name='prediction-heartbeat', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._recover()
+
+    def _stale_jobs(self):
+        cutoff = timezone.now() - timedelta(seconds=self.heartbeat_interval * HEARTBEAT_MISSES)
+        return PredictionJob.objects.filter(status='running').filter(
+            Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+        )
+
+    def _recover(self):
+        try:
+            self._stale_jobs().update(status='queued')
+            pending = list(
+                PredictionJob.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)
+            )
+        except DatabaseError:
+            # e.g. a dev server started before migrating; don't take the process down with it
+            logger.exception("Couldn't re-enqueue unfinished prediction jobs")
+            return
+        if pending:
+            # More jobs than the queue holds wait for free slots without holding up startup
+            threading.Thread(target=self._enqueue, args=(pending,), name='prediction-recovery', daemon=True).start()
+            logger.info(f"Re-enqueuing {len(pending)} unfinished prediction job(s)")
+
+    def _enqueue(self, job_ids):
+        for job_id in job_ids:
+            self._queue.put(job_id)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                self._running.add(job_id)
+            try:
+                process_job(job_id)
+            except Exception:
+                logger.exception(f"Prediction worker failed on job {job_id}")
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+                close_old_connections()
+                self._queue.task_done()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.beat()
+            except Exception:
+                logger.exception("Prediction job heartbeat failed")
+            finally:
+                close_old_connections()
+
+    def beat(self):
+        """
+        Refresh the heartbeat of the jobs running here, then re-queue running jobs whose
+        heartbeat has expired
+
+        Returns:
+            list: Ids of the jobs handed back to the queue
+        """
+        with self._lock:
+            running = list(self._running)
+        if running:
+            PredictionJob.objects.filter(pk__in=running, status='running').update(heartbeat_at=timezone.now())
+
+        stale = self._stale_jobs()
+        reclaimed = [
+            job_id for job_id in stale.order_by('started_at').values_list('pk', flat=True)
+            # Conditional, so two processes sweeping at once don't both take the job
+            if stale.filter(pk=job_id).update(status='queued')
+        ]
+        if reclaimed:
+            logger.warning(f"Re-enqueuing {len(reclaimed)} prediction job(s) whose worker stopped responding")
+            threading.Thread(target=self._enqueue, args=(reclaimed,), name='prediction-recovery', daemon=True).start()
+        return reclaimed
+
+    def depth(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def submit(self, upload, user=None):
+        """
+        Persist an upload as a new job and enqueue it
+
+        Args:
+            upload: Django UploadedFile containing the DICOM archive
+            user: Submitting user (optional)
+
+        Returns:
+            PredictionJob: The queued job
+
+        Raises:
+            QueueFull: If the queue is at capacity
+        """
+        self.start()
+        if self._queue.full():
+            raise QueueFull()
+
+        job = PredictionJob(
+            user=user if user is not None and user.is_authenticated else None,
+            original_filename=upload.name,
+        )
+        job.archive.save(f'{job.id}.zip', upload, save=False)
+        job.save()
+
+        try:
+            self._queue.put_nowait(job.pk)
+        except queue.Full:
+            job.archive.delete(save=False)
+            job.delete()
+            raise QueueFull()
+        return job
+
+    def submit_file(self, path, filename, user=None):
+        """
+        Queue an archive that is already on disk under MEDIA_ROOT, moving it into job storage
+        instead of copying it
+
+        Args:
+            path: Absolute path of the assembled archive
+            filename: Original filename reported to the inference service
+            user: Submitting user (optional)
+
+        Returns:
+            PredictionJob: The queued job
+
+        Raises:
+            QueueFull: If the queue is at capacity (the file is left where it was)
+        """
+        self.start()
+        if self._queue.full():
+            raise QueueFull()
+
+        job = PredictionJob(user=user, original_filename=filename)
+        job.archive.name = f'prediction_jobs/{job.id}.zip'
+        target = job.archive.path
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        job.save()
+
+        try:
+            self._queue.put_nowait(job.pk)
+        except queue.Full:
+            os.replace(target, path)
+            job.delete()
+            raise QueueFull()
+        return job
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Get the process-wide prediction job queue"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = PredictionJobQueue()
+        return _job_queue
+
+
+def start_job_queue():
+    """
+    Start the process-wide queue when a server process boots, so jobs left by a previous
+    process run without waiting for the next submission. Called from the WSGI and ASGI entry
+    points rather than AppConfig.ready() so management commands don't start workers.
+    """
+    get_job_queue().start()
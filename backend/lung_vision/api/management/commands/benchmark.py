@@ -0,0 +1,475 @@
+"""
+Django management command to benchmark performance-sensitive code paths against local stubs
+"""
+
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.admin import UserAdmin
+from api.authentication import CachedJWTAuthentication, get_user_cache
+from api.email_service import EmailService
+from api.email_templates import EmailShells, get_email_template
+from api.views import CustomTokenObtainPairView
+from api.testing import StubInferenceServer, StubSMTPServer, make_dicom_zip
+from api.upstream import UpstreamClient
+from api.user_search import rebuild_search_index
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {
+        'mean': statistics.fmean(ordered) * 1000,
+        'p50': pick(0.50),
+        'p99': pick(0.99),
+    }
+
+
+def run_timed(func, count, concurrency):
+    """Call ``func`` ``count`` times across ``concurrency`` threads, returning per-call durations and wall time"""
+    def timed(_):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(timed, range(count)))
+    return samples, time.perf_counter() - started
+
+
+@contextmanager
+def scratch_database():
+    """Point the default connection at a throwaway SQLite copy of the schema for the duration"""
+    if connection.vendor != 'sqlite':
+        raise CommandError('This benchmark creates a scratch SQLite database and needs the sqlite3 backend.')
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+class _QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """wsgiref server that hands connections to a fixed pool of threads, like gunicorn --threads"""
+
+    request_queue_size = 1024
+
+    def __init__(self, address, app, threads):
+        super().__init__(address, _QuietWSGIRequestHandler)
+        self.set_app(app)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+@contextmanager
+def serve_wsgi(threads):
+    """Serve the project's WSGI application with ``threads`` worker threads"""
+    from lung_vision.wsgi import application
+
+    server = ThreadPoolWSGIServer(('127.0.0.1', 0), application, threads)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.pool.shutdown(wait=True)
+        server.server_close()
+
+
+@contextmanager
+def serve_asgi():
+    """Serve the project's ASGI application (lung_vision.asgi) with uvicorn on one event loop"""
+    try:
+        import uvicorn
+    except ImportError:
+        raise CommandError('The ASGI load test needs uvicorn (pip install uvicorn).')
+    from lung_vision.asgi import application
+
+    config = uvicorn.Config(
+        application, host='127.0.0.1', port=0, log_level='warning', access_log=False, lifespan='off', backlog=1024,
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+async def _load(url, body, count, concurrency):
+    """Send ``count`` multipart POSTs with at most ``concurrency`` in flight"""
+    gate = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=300) as client:
+        async def one(_):
+            async with gate:
+                started = time.perf_counter()
+                try:
+                    resp = await client.post(url, files={'file': ('study.zip', body, 'application/zip')})
+                    status_code = resp.status_code
+                except httpx.HTTPError:
+                    status_code = None
+                return time.perf_counter() - started, status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(count)))
+    return results, time.perf_counter() - started
+
+
+def _run_load(url, body, count, concurrency):
+    return asyncio.run(_load(url, body, count, concurrency))
+
+
+def load_from_subprocess(url, body, count, concurrency):
+    """Drive the load from a separate process, so the client never competes with the server for the GIL"""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_run_load, (url, body, count, concurrency))
+
+
+def benchmark_users(count):
+    """Unsaved doctors and researchers approved at the same moment, as by one bulk approval"""
+    User = get_user_model()
+    approved_date = timezone.now()
+    return [
+        User(
+            pk=i, email=f'user{i}@example.com', full_name=f'User {i}', role=('doctor', 'researcher')[i % 2],
+            account_status='approved', approved_date=approved_date, country='PK',
+            specialization='radiologist', hospital_affiliation=f'Hospital {i}',
+            research_institution=f'Institute {i}', affiliation_type='academic',
+        )
+        for i in range(count)
+    ]
+
+
+FIRST_NAMES = ('Amina', 'Bilal', 'Chen', 'Diego', 'Elena', 'Fatima', 'Gregory', 'Hiroshi', 'Ines', 'Jonas', 'Kofi', 'Leila')
+LAST_NAMES = ('Ahmed', 'Brown', 'Curie', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Hassan', 'Ivanova', 'Khan', 'Lopez', 'Novak')
+INSTITUTIONS = ('Sorbonne', 'Karolinska Institutet', 'Aga Khan University', 'Johns Hopkins', 'ETH Zurich', 'University of Lagos')
+
+
+def create_synthetic_users(count, batch_size=5000):
+    """Insert ``count`` users with varied names, emails and credentials, bypassing save() and signals"""
+    User = get_user_model()
+    rng = random.Random(42)
+    password = make_password(None)
+    for start in range(0, count, batch_size):
+        users = []
+        for i in range(start, min(start + batch_size, count)):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            doctor = i % 2 == 0
+            users.append(User(
+                email=f'{first.lower()}.{last.lower()}{i}@example.com', full_name=f'{first} {last}', password=password,
+                role='doctor' if doctor else 'researcher', account_status=rng.choice(('pending', 'approved', 'rejected')),
+                medical_license_number=f'LIC-{i:07d}' if doctor else None,
+                research_institution=None if doctor else rng.choice(INSTITUTIONS),
+            ))
+        User.objects.bulk_create(users)
+
+
+class BenchmarkPasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 at a cost fixed by --hash-iterations, so Django's hasher upgrades don't move the numbers"""
+
+    algorithm = 'pbkdf2_sha256_benchmark'
+    iterations = 100000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark LungVision hot paths against local stub services'
+
+    subjects = ('upstream', 'deployments', 'auth', 'login', 'email', 'email-render', 'user-search')
+
+    def add_arguments(self, parser):
+        parser.add_argument('subject', choices=self.subjects, help='Code path to benchmark')
+        parser.add_argument('--requests', dest='count', type=int, help='Number of operations to run (default depends on subject)')
+        parser.add_argument('--concurrency', type=int, help='Number of concurrent clients (default depends on subject)')
+        parser.add_argument('--latency', type=float, default=1.0, help='deployments: stub model latency in seconds')
+        parser.add_argument('--threads', type=int, default=8, help='deployments: WSGI worker threads')
+        parser.add_argument('--hash-iterations', type=int, default=100000, help='login: PBKDF2 iterations per password check')
+        parser.add_argument('--smtp-latency', type=float, default=0.005, help='email: stub SMTP connection setup latency in seconds')
+        parser.add_argument('--chunk-size', type=int, help='email: messages per SMTP connection (default EMAIL_BULK_CHUNK_SIZE)')
+        parser.add_argument('--users', type=int, default=100000, help='user-search: synthetic users to search')
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['subject'].replace('-', '_')}")(**options)
+
+    def report(self, label, samples, wall):
+        stats = summarize(samples)
+        self.stdout.write(
+            f"   {label:<28} mean {stats['mean']:7.2f} ms   p50 {stats['p50']:7.2f} ms   "
+            f"p99 {stats['p99']:7.2f} ms   {len(samples) / wall:8.1f} ops/s"
+        )
+
+    def bench_upstream(self, count, concurrency, **options):
+        """Fresh connection per call (module-level requests.post) vs the pooled keep-alive client"""
+        count, concurrency = count or 500, concurrency or 8
+        self.stdout.write(f"Upstream client: {count} small POSTs, {concurrency} threads")
+
+        with StubInferenceServer() as stub:
+            url = stub.predict_url
+            samples, wall = run_timed(lambda: requests.post(url, data=b'ping', timeout=10), count, concurrency)
+            fresh_connections = len(stub.connections)
+            self.report('requests.post (no pool)', samples, wall)
+
+            stub.connections.clear()
+            client = UpstreamClient(base_url=stub.base_url, pool_size=concurrency)
+            samples, wall = run_timed(lambda: client.post('/predict', data=b'ping'), count, concurrency)
+            client.close()
+            self.report('UpstreamClient (pooled)', samples, wall)
+
+        self.stdout.write(f"   TCP connections opened: {fresh_connections} without pool, {len(stub.connections)} pooled")
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def bench_deployments(self, count, concurrency, latency, threads, **options):
+        """
+        Concurrent capacity of the predict proxy under WSGI (fixed thread pool, sync view) vs
+        ASGI (uvicorn, async view), both in front of the same slow stub model server
+        """
+        count, concurrency = count or 600, concurrency or 200
+        self.stdout.write(
+            f"Predict proxy: {count} uploads, {concurrency} concurrent clients, "
+            f"stub latency {latency * 1000:.0f} ms, WSGI with {threads} threads"
+        )
+        body = make_dicom_zip({'slice.dcm': os.urandom(32 * 1024)})
+
+        with StubInferenceServer(latency=latency) as stub, scratch_database():
+            # Let the proxy itself be the bottleneck: no cache hits, no admission or backend caps
+            limits = override_settings(
+                INFERENCE_BACKENDS=[{'url': stub.base_url, 'max_concurrency': concurrency}],
+                INFERENCE_ASYNC_POOL_SIZE=concurrency,
+                INFERENCE_HEALTH_CHECK_INTERVAL=0,
+                PREDICTION_CACHE_ENABLED=False,
+                PREDICT_ADMISSION_MAX_IN_FLIGHT=concurrency,
+                PREDICT_ADMISSION_MAX_PER_USER=concurrency,
+                PREDICT_ADMISSION_MAX_QUEUED=count,
+                PREDICT_ADMISSION_QUEUE_TIMEOUT=300,
+            )
+            with limits:
+                for label, server, path in (
+                    (f'WSGI ({threads} threads)', serve_wsgi(threads), '/api/predict/'),
+                    ('ASGI (uvicorn, async view)', serve_asgi(), '/api/predict/async/'),
+                ):
+                    stub.peak_active = 0
+                    with server as base_url:
+                        results, wall = load_from_subprocess(base_url + path, body, count, concurrency)
+                    errors = sum(1 for _, status_code in results if status_code != 200)
+                    self.report(label, [duration for duration, _ in results], wall)
+                    self.stdout.write(f"      peak in-flight upstream calls: {stub.peak_active}")
+                    if errors:
+                        self.stdout.write(self.style.WARNING(f"      {errors} request(s) failed"))
+
+        self.stdout.write(f"   Stub served {stub.request_count} predictions")
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def bench_auth(self, count, concurrency, **options):
+        """Per-request cost of resolving a JWT's user: simplejwt's DB lookup vs the cached class"""
+        count, concurrency = count or 5000, concurrency or 1
+        self.stdout.write(f"JWT authentication: {count} requests, {concurrency} thread(s)")
+
+        with scratch_database():
+            user = get_user_model().objects.create_user(
+                'bench@example.com', 'pass12345', full_name='Bench', account_status='approved',
+            )
+            request = RequestFactory().get('/api/user/me/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+            for label, authentication, alias in (
+                ('JWTAuthentication (DB)', JWTAuthentication(), None),
+                ('Cached (local stamps)', CachedJWTAuthentication(), None),
+                ('Cached (shared locmem)', CachedJWTAuthentication(), 'default'),
+            ):
+                with override_settings(AUTH_USER_CACHE_ALIAS=alias):
+                    get_user_cache().clear()
+                    samples, wall = run_timed(lambda: authentication.authenticate(request), count, concurrency)
+                    self.report(label, samples, wall)
+                    # Query counts are per connection, so sample them on this thread
+                    with CaptureQueriesContext(connection) as queries:
+                        for _ in range(100):
+                            authentication.authenticate(request)
+                    self.stdout.write(
+                        f"      {summarize(samples)['mean'] * 1000:.0f} us/request, {len(queries) / 100:.2f} queries/request"
+                    )
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def bench_login(self, count, concurrency, hash_iterations, **options):
+        """
+        Login latency under concurrent load: simplejwt's stock token view vs the login view, both
+        against the same password hasher cost
+        """
+        count, concurrency = count or 200, concurrency or 4
+        self.stdout.write(f"Login: {count} logins, {concurrency} threads, PBKDF2 with {hash_iterations} iterations")
+        BenchmarkPasswordHasher.iterations = hash_iterations
+        hashers = override_settings(PASSWORD_HASHERS=[f'{__name__}.BenchmarkPasswordHasher'])
+
+        with hashers, scratch_database():
+            user = get_user_model().objects.create_user(
+                'bench@example.com', 'pass12345', full_name='Bench', account_status='approved',
+                medical_license_number='LIC-1', specialization='radiologist',
+            )
+            samples, wall = run_timed(lambda: user.check_password('pass12345'), count, concurrency)
+            self.report('password check alone', samples, wall)
+
+            factory = RequestFactory()
+            body = {'email': 'bench@example.com', 'password': 'pass12345'}
+            for label, view in (
+                ('simplejwt token view', TokenObtainPairView.as_view()),
+                ('login view', CustomTokenObtainPairView.as_view()),
+            ):
+                def login():
+                    resp = view(factory.post('/api/login/', body, content_type='application/json'))
+                    if resp.status_code != 200:
+                        raise CommandError(f'{label} answered {resp.status_code}: {resp.data}')
+
+                samples, wall = run_timed(login, count, concurrency)
+                self.report(label, samples, wall)
+                # Query counts are per connection, so sample them on this thread
+                with CaptureQueriesContext(connection) as queries:
+                    login()
+                self.stdout.write(f"      {len(queries)} queries per login")
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def bench_email(self, count, smtp_latency, chunk_size, **options):
+        """
+        Approval emails to many recipients: one SMTP session per message (send_account_approved_email
+        in a loop) vs send_bulk_approval_emails over reused, chunked sessions
+        """
+        count = count or 1000
+        self.stdout.write(
+            f"Bulk email: {count} recipients, stub SMTP connect latency {smtp_latency * 1000:.0f} ms, "
+            f"chunks of {chunk_size or 'EMAIL_BULK_CHUNK_SIZE'}"
+        )
+        users = benchmark_users(count)
+
+        with StubSMTPServer(connect_latency=smtp_latency) as stub, override_settings(**stub.email_settings()):
+            for label, send in (
+                ('per-message connections', lambda: [EmailService.send_account_approved_email(user) for user in users]),
+                ('bulk, reused connections', lambda: EmailService.send_bulk_approval_emails(users)),
+            ):
+                stub.connection_count = stub.message_count = 0
+                with override_settings(EMAIL_BULK_CHUNK_SIZE=chunk_size or settings.EMAIL_BULK_CHUNK_SIZE):
+                    started = time.perf_counter()
+                    send()
+                    wall = time.perf_counter() - started
+                self.stdout.write(
+                    f"   {label:<28} {wall:7.2f} s   {stub.message_count / wall:8.1f} messages/s   "
+                    f"{stub.connection_count} SMTP connection(s)"
+                )
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def bench_email_render(self, count, **options):
+        """
+        Render cost per approval email (HTML and text): render_to_string per part vs the compiled
+        pair vs shells filled in per recipient
+        """
+        count = count or 10000
+        self.stdout.write(f"Email rendering: {count} recipients")
+        users = benchmark_users(count)
+        template = get_email_template('account_approved')
+        shells = EmailShells(template, per_recipient=('approved_on',))
+        context = lambda user: {
+            'user': user, 'approved_by': None, 'approved_on': EmailService.format_timestamp(user.approved_date),
+            'login_url': EmailService.get_login_url(),
+        }
+
+        for label, render in (
+            ('render_to_string x2', lambda c: (
+                render_to_string('emails/account_approved.html', c), render_to_string('emails/account_approved.txt', c),
+            )),
+            ('compiled pair, one context', template.render),
+            ('shells', shells.render),
+        ):
+            samples = []
+            started = time.perf_counter()
+            for user in users:
+                rendered = time.perf_counter()
+                render(context(user))
+                samples.append(time.perf_counter() - rendered)
+            self.report(label, samples, time.perf_counter() - started)
+            self.stdout.write(f"      {summarize(samples)['mean'] * 1000:.0f} us/message")
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def bench_user_search(self, count, users, **options):
+        """
+        Admin user search: the stock icontains search (LIKE '%q%' over every search field) vs the
+        FTS5 trigram index, each fetching the match count and the first changelist page
+        """
+        count = count or 5
+        self.stdout.write(f"Admin user search: {users} synthetic users, {count} runs per term")
+
+        with scratch_database():
+            started = time.perf_counter()
+            create_synthetic_users(users)
+            rebuild_search_index()
+            self.stdout.write(f"   Created and indexed the users in {time.perf_counter() - started:.1f} s")
+
+            model_admin = UserAdmin(get_user_model(), admin.site)
+            request = RequestFactory().get('/admin/api/user/')
+            queryset = get_user_model().objects.all()
+            stock = lambda term: super(UserAdmin, model_admin).get_search_results(request, queryset, term)[0]
+            indexed = lambda term: model_admin.get_search_results(request, queryset, term)[0]
+
+            for term in (f'{users // 2 - 1}@', 'LIC-00012', 'karolinska', 'curie'):
+                self.stdout.write(f"   '{term}'")
+                for label, search in (('icontains (stock)', stock), ('FTS5 trigram index', indexed)):
+                    def run():
+                        results = search(term)
+                        results.count()
+                        list(results.order_by('-date_joined')[:100])
+
+                    samples, wall = run_timed(run, count, 1)
+                    self.report(label, samples, wall)
+                self.stdout.write(f"      {search(term).count()} match(es)")
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,22 @@
+"""
+Django management command to garbage collect abandoned chunked uploads
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.uploads import cleanup_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete open upload sessions (and their partial files) with no recent activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            help='Inactivity in seconds before a session is removed (defaults to UPLOAD_SESSION_TTL)',
+        )
+
+    def handle(self, *args, **options):
+        removed = cleanup_stale_sessions(options.get('max_age'))
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} stale upload session(s).'))
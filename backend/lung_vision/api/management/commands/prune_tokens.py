@@ -0,0 +1,52 @@
+"""
+Django management command to delete expired refresh tokens and their blacklist entries
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.revocation import prune_expired_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted refresh tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Tokens deleted per transaction (defaults to TOKEN_PRUNE_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, pruning every --interval seconds (for a scheduler-less deployment)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            help='Seconds between runs with --loop (defaults to TOKEN_PRUNE_INTERVAL)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options.get('interval') or getattr(settings, 'TOKEN_PRUNE_INTERVAL', 60 * 60)
+        while True:
+            try:
+                removed = prune_expired_tokens(batch_size=options.get('batch_size'))
+            except Exception:
+                if not options['loop']:
+                    raise
+                # Batches already deleted stay deleted; the rest go on the next run
+                logger.exception("Token pruning failed; retrying after the interval")
+            else:
+                self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired token(s).'))
+                if not options['loop']:
+                    break
+            close_old_connections()
+            time.sleep(interval)
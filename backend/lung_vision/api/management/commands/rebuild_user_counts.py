@@ -0,0 +1,17 @@
+"""
+Django management command to recompute the per-role, per-status user counts
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.user_counts import get_user_counts, rebuild_user_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-role, per-status user counts from the user table'
+
+    def handle(self, *args, **options):
+        rebuild_user_counts()
+        counts = get_user_counts()
+        summary = ', '.join(f'{n} {status}' for status, n in counts['by_status'].items())
+        self.stdout.write(self.style.SUCCESS(f"Counted {counts['total']} user(s): {summary}."))
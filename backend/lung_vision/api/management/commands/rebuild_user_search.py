@@ -0,0 +1,17 @@
+"""
+Django management command to refill the user search index from the user table
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.user_search import rebuild_search_index, search_index_enabled
+
+
+class Command(BaseCommand):
+    help = 'Refill the SQLite full-text user search index from the user table'
+
+    def handle(self, *args, **options):
+        if not search_index_enabled():
+            raise CommandError('The user search index is only used with SQLite (PostgreSQL uses pg_trgm indexes).')
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the user search index.'))
@@ -0,0 +1,63 @@
+"""
+Django management command to deliver queued account notification emails
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.outbox import process_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Send due emails from the outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Messages claimed per batch (defaults to EMAIL_OUTBOX_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running as a worker, polling every --interval seconds when the outbox is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Seconds between polls with --loop (defaults to EMAIL_OUTBOX_POLL_INTERVAL)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options.get('interval') or getattr(settings, 'EMAIL_OUTBOX_POLL_INTERVAL', 5)
+        totals = {'sent': 0, 'retrying': 0, 'dead': 0}
+        while True:
+            try:
+                results = process_outbox(batch_size=options.get('batch_size'))
+            except Exception:
+                if not options['loop']:
+                    raise
+                # e.g. "database is locked" while the admin writes; claimed rows are reclaimed
+                # after EMAIL_OUTBOX_CLAIM_TIMEOUT, so a worker that keeps going loses nothing
+                logger.exception("Outbox pass failed; retrying after the poll interval")
+                close_old_connections()
+                time.sleep(interval)
+                continue
+            for key in totals:
+                totals[key] += results[key]
+            if any(results.values()):
+                # Drain the backlog before sleeping
+                continue
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(interval)
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} email(s); {totals['retrying']} to retry, {totals['dead']} dead-lettered."
+        ))
@@ -6,6 +6,7 @@ from django.core.management.base import BaseCommand
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
+from api.email_service import EmailService
 from api.models import User
 
 
@@ -56,7 +57,7 @@ class Command(BaseCommand):
             context = {
                 'user': user,
                 'approved_by': user,  # Using same user for testing
-                'approval_date': timezone.now(),
+                'approved_on': EmailService.format_timestamp(timezone.now()),
                 'login_url': settings.FRONTEND_LOGIN_URL,
             }
             
@@ -81,7 +82,6 @@ class Command(BaseCommand):
         if not options.get('test_template'):
             self.stdout.write("\n3. Testing email sending...")
             try:
-                from api.email_service import EmailService
                 result = EmailService.send_account_approved_email(user, user)
                 if result:
                     self.stdout.write("   ✅ Email sent successfully")
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Prediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('sync', 'Synchronous'), ('job', 'Background job')], default='sync', max_length=10)),
+                ('patient_id', models.CharField(blank=True, max_length=255)),
+                ('archive_hash', models.CharField(blank=True, help_text='Content digest of the uploaded archive', max_length=80)),
+                ('predicted_class', models.CharField(max_length=100)),
+                ('predicted_class_index', models.SmallIntegerField(blank=True, null=True)),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('class_probabilities', models.JSONField(blank=True, default=dict)),
+                ('result', models.JSONField(blank=True, default=dict, help_text='Full response payload, with visualizations as URLs')),
+                ('model_version', models.CharField(blank=True, max_length=50)),
+                ('cache_status', models.CharField(blank=True, max_length=10)),
+                ('queued_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prediction', to='api.predictionjob')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='predictions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='api_pred_user_created'), models.Index(fields=['user', 'patient_id', '-created_at', '-id'], name='api_pred_user_patient'), models.Index(fields=['user', 'predicted_class', '-created_at', '-id'], name='api_pred_user_class'), models.Index(fields=['patient_id', '-created_at', '-id'], name='api_pred_patient_created'), models.Index(fields=['-created_at', '-id'], name='api_pred_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index simplejwt's outstanding tokens by expiry, so pruning expired tokens in batches
+    does not scan the whole table for every batch
+    """
+
+    dependencies = [
+        ('api', '0006_prediction_history'),
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS api_outstanding_token_expires ON token_blacklist_outstandingtoken (expires_at)',
+            reverse_sql='DROP INDEX IF EXISTS api_outstanding_token_expires',
+        ),
+    ]
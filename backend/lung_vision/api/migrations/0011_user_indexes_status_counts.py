@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:01
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_users(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    UserStatusCount = apps.get_model('api', 'UserStatusCount')
+    rows = User.objects.values('role', 'account_status').annotate(n=Count('pk')).order_by()
+    UserStatusCount.objects.bulk_create(
+        UserStatusCount(role=row['role'], account_status=row['account_status'], count=row['n']) for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_account_status_event'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('doctor', 'Doctor'), ('researcher', 'Researcher'), ('admin', 'Admin')], max_length=20)),
+                ('account_status', models.CharField(choices=[('pending', 'Pending Approval'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['account_status', 'date_joined'], name='api_user_status_joined'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'account_status', 'date_joined'], name='api_user_role_status_joined'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined'], name='api_user_joined'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['approved_date'], name='api_user_approved_date'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['country'], name='api_user_country'),
+        ),
+        migrations.AddConstraint(
+            model_name='userstatuscount',
+            constraint=models.UniqueConstraint(fields=('role', 'account_status'), name='api_user_status_count_unique'),
+        ),
+        migrations.RunPython(count_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+SEARCH_FIELDS = ('email', 'full_name', 'medical_license_number', 'research_institution')
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    columns = ', '.join(SEARCH_FIELDS)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS api_user_search USING fts5({columns}, tokenize='trigram')")
+            cursor.execute(f"INSERT INTO api_user_search(rowid, {columns}) SELECT id, {columns} FROM api_user")
+        elif connection.vendor == 'postgresql':
+            # The admin's icontains search compiles to UPPER(column::text) LIKE UPPER(...)
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for field in SEARCH_FIELDS:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS api_user_{field}_trgm ON api_user '
+                    f'USING gin (UPPER("{field}"::text) gin_trgm_ops)'
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("DROP TABLE IF EXISTS api_user_search")
+        elif connection.vendor == 'postgresql':
+            for field in SEARCH_FIELDS:
+                cursor.execute(f'DROP INDEX IF EXISTS api_user_{field}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_user_indexes_status_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
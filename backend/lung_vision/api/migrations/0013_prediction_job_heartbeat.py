@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_user_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_prediction_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('open', 'Open'), ('finalizing', 'Finalizing'), ('finalized', 'Finalized')], default='open', max_length=20),
+        ),
+    ]
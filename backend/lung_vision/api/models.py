@@ -1,7 +1,15 @@
+import uuid
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.db import models
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
 from django.utils import timezone
 
+# User columns whose saves aren't changes to the user: they don't move updated_at or retire
+# cached copies of the user and their profile
+BOOKKEEPING_FIELDS = frozenset({'last_login', 'updated_at'})
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -98,13 +106,96 @@ class User(AbstractBaseUser, PermissionsMixin):
     terms_accepted = models.BooleanField(default=False)
     terms_accepted_date = models.DateTimeField(blank=True, null=True)
 
+    # Last change to the row; drives Last-Modified on /api/user/me/
+    updated_at = models.DateTimeField(auto_now=True)
+
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['full_name', 'role']
 
+    class Meta:
+        indexes = [
+            # The approval queue (oldest first) and its per-role view
+            models.Index(fields=['account_status', 'date_joined'], name='api_user_status_joined'),
+            models.Index(fields=['role', 'account_status', 'date_joined'], name='api_user_role_status_joined'),
+            # Admin changelist ordering and filters
+            models.Index(fields=['date_joined'], name='api_user_joined'),
+            models.Index(fields=['approved_date'], name='api_user_approved_date'),
+            models.Index(fields=['country'], name='api_user_country'),
+        ]
+
     def __str__(self):
         return f"{self.full_name} ({self.email}) - {self.get_role_display()}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Column values as loaded, to save only what changed since
+        instance._loaded_values = {
+            field.attname: instance._tracked_value(field)
+            for field in cls._meta.concrete_fields if field.attname in field_names
+        }
+        return instance
+
+    def _tracked_value(self, field):
+        value = getattr(self, field.attname)
+        # File fields hand out one mutable FieldFile; compare the stored name
+        return value.name if isinstance(value, FieldFile) else value
+
+    def _snapshot(self, attnames=None):
+        fields = [
+            field for field in self._meta.concrete_fields
+            if (attnames is None or field.attname in attnames) and field.attname in self.__dict__
+        ]
+        # Replaced rather than updated: copies of a user (e.g. from the auth cache) share the dict
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{field.attname: self._tracked_value(field) for field in fields},
+        }
+
+    def get_dirty_fields(self):
+        """
+        Fields changed since the user was loaded or last saved
+
+        Returns:
+            dict: Field name to the value it was loaded with (None for fields that weren't loaded)
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return {}
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if field.attname not in loaded:
+                # Deferred at load time, then assigned
+                dirty[field.name] = None
+            elif self._tracked_value(field) != loaded[field.attname]:
+                dirty[field.name] = loaded[field.attname]
+        return dirty
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if (
+            update_fields is None and not self._state.adding and hasattr(self, '_loaded_values')
+            and not kwargs.get('force_insert') and not kwargs.get('force_update')
+        ):
+            # Write only the columns that changed; nothing at all when none did
+            update_fields = kwargs['update_fields'] = set(self.get_dirty_fields())
+            if not update_fields:
+                return
+        # auto_now only reaches the database when the field is saved, so keep partial saves of
+        # the profile from leaving a stale updated_at behind. Bookkeeping saves (e.g. a login)
+        # and the empty, no-op save leave it alone, as they leave the cached profile alone.
+        if update_fields and not set(update_fields) <= BOOKKEEPING_FIELDS:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+        self._snapshot()
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._snapshot({self._meta.get_field(name).attname for name in fields} if fields is not None else None)
     
     def is_approved(self):
         """Check if the account is approved"""
@@ -119,42 +210,42 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.account_status == 'rejected'
     
     def approve(self, approved_by_user=None, send_email=True):
-        """Approve the account and optionally send email notification"""
+        """Approve the account and optionally queue the email notification"""
+        previous_status = self.account_status
         self.account_status = 'approved'
         self.approved_by = approved_by_user
         self.approved_date = timezone.now()
         self.rejection_reason = None  # Clear any previous rejection reason
-        self.save()
-        
-        # Send approval email notification
-        if send_email:
-            try:
-                from .email_service import send_approval_email
-                send_approval_email(self, approved_by_user)
-            except Exception as e:
-                # Log error but don't fail the approval process
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Failed to send approval email for user {self.email}: {str(e)}")
+        with transaction.atomic():
+            self.save()
+            AccountStatusEvent.objects.create(
+                user=self, actor=approved_by_user, from_status=previous_status, to_status='approved',
+                created_at=self.approved_date,
+            )
+            
+            # Queue the approval email; the outbox worker (manage.py send_emails) delivers it
+            if send_email:
+                from .outbox import enqueue_account_email
+                enqueue_account_email('account_approved', self, actor=approved_by_user)
     
     def reject(self, reason=None, rejected_by_user=None, send_email=True):
-        """Reject the account and optionally send email notification"""
+        """Reject the account and optionally queue the email notification"""
+        previous_status = self.account_status
         self.account_status = 'rejected'
         self.rejection_reason = reason
         self.approved_by = rejected_by_user  # Track who rejected it
         self.approved_date = timezone.now()  # Track when it was rejected
-        self.save()
-        
-        # Send rejection email notification
-        if send_email:
-            try:
-                from .email_service import send_rejection_email
-                send_rejection_email(self, reason, rejected_by_user)
-            except Exception as e:
-                # Log error but don't fail the rejection process
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Failed to send rejection email for user {self.email}: {str(e)}")
+        with transaction.atomic():
+            self.save()
+            AccountStatusEvent.objects.create(
+                user=self, actor=rejected_by_user, from_status=previous_status, to_status='rejected',
+                reason=reason, created_at=self.approved_date,
+            )
+            
+            # Queue the rejection email; the outbox worker (manage.py send_emails) delivers it
+            if send_email:
+                from .outbox import enqueue_account_email
+                enqueue_account_email('account_rejected', self, actor=rejected_by_user, reason=reason)
     
     def can_login(self):
         """Check if user can login (approved and active)"""
@@ -181,3 +272,226 @@ class User(AbstractBaseUser, PermissionsMixin):
             if not self.purpose_of_use:
                 raise ValidationError({'purpose_of_use': 'Purpose of use is required for researchers.'})
 
+
+class PredictionJob(models.Model):
+    """An uploaded archive waiting for, or holding the result of, an asynchronous prediction"""
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='prediction_jobs')
+    archive = models.FileField(upload_to='prediction_jobs/', blank=True, null=True)
+    original_filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+
+    # Upstream outcome
+    upstream_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Refreshed by the worker running the job; a stale one means the worker is gone
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='api_predjob_status_created'),
+        ]
+
+    def __str__(self):
+        return f"Prediction job {self.id} ({self.get_status_display()})"
+
+    def is_finished(self):
+        """Check if the job has reached a terminal state"""
+        return self.status in ('completed', 'failed')
+
+
+class UploadSession(models.Model):
+    """A resumable, chunked upload of a large archive, assembled in place under MEDIA_ROOT/uploads/"""
+
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('finalizing', 'Finalizing'),
+        ('finalized', 'Finalized'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    job = models.OneToOneField(PredictionJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session')
+
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='api_upload_status_updated'),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.filename})"
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def expected_chunk_size(self, index):
+        """Size in bytes the chunk at ``index`` must have"""
+        if index == self.total_chunks - 1:
+            return self.total_size - index * self.chunk_size
+        return self.chunk_size
+
+
+class UploadChunk(models.Model):
+    """A verified chunk of an UploadSession"""
+
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='api_uploadchunk_unique_index'),
+        ]
+
+
+class Prediction(models.Model):
+    """A completed prediction, kept so past results can be looked up without re-running the model"""
+
+    SOURCE_CHOICES = [
+        ('sync', 'Synchronous'),
+        ('job', 'Background job'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='predictions')
+    job = models.OneToOneField(PredictionJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='prediction')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='sync')
+    patient_id = models.CharField(max_length=255, blank=True)
+    archive_hash = models.CharField(max_length=80, blank=True, help_text="Content digest of the uploaded archive")
+
+    # Model output
+    predicted_class = models.CharField(max_length=100)
+    predicted_class_index = models.SmallIntegerField(blank=True, null=True)
+    confidence = models.FloatField(blank=True, null=True)
+    class_probabilities = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(default=dict, blank=True, help_text="Full response payload, with visualizations as URLs")
+    model_version = models.CharField(max_length=50, blank=True)
+
+    # Timings
+    cache_status = models.CharField(max_length=10, blank=True)
+    queued_ms = models.PositiveIntegerField(blank=True, null=True)
+    duration_ms = models.PositiveIntegerField(blank=True, null=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        # Every listing is "newest first" under an equality filter, so each index ends in created_at
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='api_pred_user_created'),
+            models.Index(fields=['user', 'patient_id', '-created_at', '-id'], name='api_pred_user_patient'),
+            models.Index(fields=['user', 'predicted_class', '-created_at', '-id'], name='api_pred_user_class'),
+            models.Index(fields=['patient_id', '-created_at', '-id'], name='api_pred_patient_created'),
+            models.Index(fields=['-created_at', '-id'], name='api_pred_created'),
+        ]
+
+    def __str__(self):
+        return f"Prediction {self.pk} for {self.patient_id or 'unknown patient'} ({self.predicted_class})"
+
+
+class EmailOutbox(models.Model):
+    """An account notification waiting to be sent, or already sent, by the outbox worker"""
+
+    KIND_CHOICES = [
+        ('account_approved', 'Account approved'),
+        ('account_rejected', 'Account rejected'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead letter'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='outbox_emails')
+    to_email = models.EmailField()
+    params = models.JSONField(default=dict, blank=True, help_text="Template inputs captured at enqueue time")
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    # Delivery attempts
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        verbose_name = 'outbox email'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='api_outbox_status_next'),
+            models.Index(fields=['claim_token'], name='api_outbox_claim'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} email to {self.to_email} ({self.get_status_display()})"
+
+
+class AccountStatusEvent(models.Model):
+    """One change of a user's account status, for the audit trail"""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='status_events')
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Admin who made the change",
+    )
+    from_status = models.CharField(max_length=20, choices=User.ACCOUNT_STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=User.ACCOUNT_STATUS_CHOICES)
+    reason = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='api_status_event_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.from_status} -> {self.to_status}"
+
+
+class UserStatusCount(models.Model):
+    """Number of users per role and account status, kept up to date as users change (see api.user_counts)"""
+
+    role = models.CharField(max_length=20, choices=User.ROLE_CHOICES)
+    account_status = models.CharField(max_length=20, choices=User.ACCOUNT_STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['role', 'account_status'], name='api_user_status_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.role}/{self.account_status}: {self.count}"
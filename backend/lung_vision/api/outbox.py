@@ -0,0 +1,167 @@
+"""
+Transactional outbox for account notification emails.
+Approvals and rejections only insert an EmailOutbox row in the transaction that changes the
+account, so admin actions never wait on the mail server. The ``send_emails`` worker delivers
+the rows with retries, exponential backoff and a dead-letter state; every row carries an
+idempotency key, so the same state change is never queued (or sent) twice.
+"""
+
+import hashlib
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .email_service import EmailService
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BACKOFF_BASE = 30
+DEFAULT_BACKOFF_MAX = 60 * 60
+DEFAULT_CLAIM_TIMEOUT = 5 * 60
+
+
+def idempotency_key(kind, user):
+    """Key identifying one account state change: the same transition always maps to the same key"""
+    changed_at = user.approved_date.isoformat() if user.approved_date else ''
+    return f'{kind}:{user.pk}:{changed_at}'
+
+
+def enqueue_account_email(kind, user, actor=None, reason=None):
+    """
+    Queue an account notification; call inside the transaction that changed the account
+
+    Enqueueing the same state change again is a no-op.
+
+    Args:
+        kind: ``account_approved`` or ``account_rejected``
+        user: The user to notify
+        actor: Admin user who made the change (optional)
+        reason: Rejection reason (optional)
+    """
+    enqueue_account_emails(kind, [user], actor=actor, reason=reason)
+
+
+def enqueue_account_emails(kind, users, actor=None, reason=None):
+    """Queue the same account notification for many users in one insert (see enqueue_account_email)"""
+    params = {'actor_id': actor.pk if actor is not None else None, 'reason': reason}
+    EmailOutbox.objects.bulk_create(
+        [
+            EmailOutbox(
+                kind=kind,
+                user=user,
+                to_email=user.email,
+                params=params,
+                idempotency_key=idempotency_key(kind, user),
+            )
+            for user in users
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retry number ``attempts``: doubling from the base, capped, with jitter"""
+    base = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_BASE', DEFAULT_BACKOFF_BASE)
+    cap = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_MAX', DEFAULT_BACKOFF_MAX)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    # Spread retries out so a mail server outage doesn't end in a synchronized burst
+    return delay * random.uniform(0.8, 1.0)
+
+
+def claim_batch(limit=None):
+    """
+    Claim due messages for this worker
+
+    Messages left in ``sending`` by a worker that died are reclaimed after EMAIL_OUTBOX_CLAIM_TIMEOUT.
+    The claim is a single UPDATE, so concurrent workers never pick the same row.
+
+    Returns:
+        list: Claimed EmailOutbox rows
+    """
+    limit = limit or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT', DEFAULT_CLAIM_TIMEOUT))
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', claimed_at__lt=stale)
+    ids = list(EmailOutbox.objects.filter(due).order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:limit])
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    EmailOutbox.objects.filter(due, pk__in=ids).update(status='sending', claim_token=token, claimed_at=now)
+    return list(EmailOutbox.objects.filter(claim_token=token).select_related('user'))
+
+
+def build_message(message, connection=None):
+    """Render an outbox row into an email, tagged with a Message-ID derived from its idempotency key"""
+    User = get_user_model()
+    actor_id = message.params.get('actor_id')
+    actor = User.objects.filter(pk=actor_id).first() if actor_id else None
+    if message.kind == 'account_approved':
+        email = EmailService.build_account_approved_email(message.user, actor, connection=connection)
+    else:
+        email = EmailService.build_account_rejected_email(message.user, message.params.get('reason'), actor, connection=connection)
+    # A retry after a lost acknowledgement reuses the Message-ID, so receiving servers can drop the duplicate
+    digest = hashlib.sha256(message.idempotency_key.encode('utf-8')).hexdigest()[:32]
+    email.extra_headers['Message-ID'] = f'<{digest}@lungvision>'
+    return email
+
+
+def _mark_failed(message, error):
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    fields = {'attempts': message.attempts + 1, 'last_error': str(error)[:2000], 'claim_token': None}
+    if fields['attempts'] >= max_attempts:
+        fields['status'] = 'dead'
+        logger.error(f"Dead-lettered {message.kind} email to {message.to_email} after {fields['attempts']} attempt(s): {error}")
+    else:
+        fields['status'] = 'pending'
+        fields['next_attempt_at'] = timezone.now() + timedelta(seconds=backoff_delay(fields['attempts']))
+        logger.warning(f"Failed to send {message.kind} email to {message.to_email} (attempt {fields['attempts']}): {error}")
+    EmailOutbox.objects.filter(pk=message.pk, claim_token=message.claim_token).update(**fields)
+    return fields['status']
+
+
+def process_outbox(batch_size=None):
+    """
+    Claim and send one batch of due messages over a single mail connection
+
+    Returns:
+        dict: Counts of ``sent``, ``retrying`` and ``dead`` messages
+    """
+    results = {'sent': 0, 'retrying': 0, 'dead': 0}
+    messages = claim_batch(batch_size)
+    if not messages:
+        return results
+
+    connection = get_connection()
+    try:
+        connection.open()
+        for message in messages:
+            try:
+                sent = connection.send_messages([build_message(message, connection=connection)])
+                if not sent:
+                    raise RuntimeError('The mail backend did not accept the message.')
+            except Exception as e:
+                results['retrying' if _mark_failed(message, e) == 'pending' else 'dead'] += 1
+                continue
+            EmailOutbox.objects.filter(pk=message.pk, claim_token=message.claim_token).update(
+                status='sent', sent_at=timezone.now(), attempts=message.attempts + 1, claim_token=None, last_error=None,
+            )
+            results['sent'] += 1
+    except Exception as e:
+        # Could not reach the mail server at all: every message still claimed goes back for a retry
+        for message in EmailOutbox.objects.filter(claim_token=messages[0].claim_token):
+            results['retrying' if _mark_failed(message, e) == 'pending' else 'dead'] += 1
+    finally:
+        connection.close()
+
+    logger.info(f"Email outbox: {results['sent']} sent, {results['retrying']} to retry, {results['dead']} dead-lettered")
+    return results
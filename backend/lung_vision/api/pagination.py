@@ -0,0 +1,102 @@
+"""
+Keyset pagination.
+Pages are addressed by the (created_at, id) (or other position field) of the last row seen
+rather than by an offset, so fetching page 10,000 costs the same index range scan as fetching
+the first page.
+"""
+
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first pagination over ``(created_at, id)``
+
+    The queryset must be ordered by ``-created_at, -id`` and backed by an index ending in those
+    columns. Responses carry an opaque ``next`` URL; there is no total count, since counting
+    would scan every matching row. Subclasses can page over another datetime ``position_field``,
+    oldest first with ``descending = False``.
+    """
+
+    position_field = 'created_at'
+    descending = True
+    page_size = 25
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, instance):
+        position = json.dumps([getattr(instance, self.position_field).isoformat(), instance.pk])
+        return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            position, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            position = parse_datetime(position)
+            if position is None:
+                raise ValueError
+            return position, int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        field, after = self.position_field, 'lt' if self.descending else 'gt'
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(**{f'{field}__{after}': position}) | Q(**{field: position, f'pk__{after}': pk}))
+
+        # One extra row tells us whether another page exists without a COUNT
+        prefix = '-' if self.descending else ''
+        rows = list(queryset.order_by(f'{prefix}{field}', f'{prefix}pk')[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class JoinedQueuePagination(KeysetPagination):
+    """Oldest-first pagination over ``(date_joined, id)``, for queues of registrations"""
+
+    position_field = 'date_joined'
+    descending = False
@@ -0,0 +1,167 @@
+"""
+Content-addressed cache of prediction results.
+Archives are identified by a SHA-256 over their member contents, so re-uploading (or re-zipping)
+the same patient study is answered without running the model again.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .preflight import IGNORED_PREFIXES
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 24 * 60 * 60
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_stream(stream, chunk_size=HASH_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_digest(fileobj):
+    """
+    Compute a content digest for an uploaded archive
+
+    The digest covers the sorted SHA-256 of every file member, so entry names, ordering,
+    timestamps and compression level do not affect it. Every file counts, not just ``.dcm``
+    ones, because preflight also accepts extensionless DICOM members; only directories and
+    ``__MACOSX/`` metadata are skipped. Empty archives (or ones that are not valid ZIPs) fall
+    back to a hash of the raw bytes.
+
+    Args:
+        fileobj: Seekable binary file object holding the archive
+
+    Returns:
+        str: Digest prefixed with the hashing scheme (``dcm:`` or ``raw:``)
+    """
+    fileobj.seek(0)
+    member_digests = []
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or info.filename.startswith(IGNORED_PREFIXES):
+                    continue
+                with archive.open(info) as member:
+                    member_digests.append(_hash_stream(member))
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError, EOFError):
+        member_digests = []
+
+    if member_digests:
+        combined = hashlib.sha256()
+        for member_digest in sorted(member_digests):
+            combined.update(member_digest.encode('ascii'))
+        result = f'dcm:{combined.hexdigest()}'
+    else:
+        fileobj.seek(0)
+        result = f'raw:{_hash_stream(fileobj)}'
+    fileobj.seek(0)
+    return result
+
+
+def get_model_version():
+    """Get the model version that cache keys are scoped to"""
+    return str(getattr(settings, 'INFERENCE_MODEL_VERSION', '1'))
+
+
+class PredictionResultCache:
+    """
+    Thread-safe LRU cache of serialized prediction payloads with a TTL and a total size bound.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'PREDICTION_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(settings, 'PREDICTION_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'PREDICTION_CACHE_TTL', DEFAULT_TTL)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(digest, model_version=None):
+        return f'{model_version or get_model_version()}:{digest}'
+
+    def _discard(self, key):
+        payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def get(self, key):
+        """Return a fresh copy of the cached payload, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            payload = entry[0]
+        return json.loads(payload)
+
+    def set(self, key, data):
+        """Store a payload, evicting least recently used entries to stay within bounds"""
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (payload, time.monotonic() + self.ttl)
+            self._bytes += len(payload)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Hit/miss counters and current occupancy"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'model_version': get_model_version(),
+            }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Get the process-wide prediction result cache"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = PredictionResultCache()
+        return _result_cache
+
+
+def is_cache_enabled():
+    """Check if prediction results should be cached"""
+    return getattr(settings, 'PREDICTION_CACHE_ENABLED', True)
@@ -0,0 +1,144 @@
+"""
+Preflight validation of uploaded DICOM archives.
+Inspects the ZIP central directory (without extracting anything) and the first bytes of each
+entry, so malformed archives, archives without DICOM files and zip bombs are rejected before
+they consume model capacity.
+"""
+
+import posixpath
+import zipfile
+from collections import namedtuple
+
+from django.conf import settings
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_UNCOMPRESSED_BYTES = 4 * 1024 * 1024 * 1024
+DEFAULT_MAX_COMPRESSION_RATIO = 100
+# Ratio checks only apply to entries large enough to matter
+RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
+DICOM_PREAMBLE_LENGTH = 128
+DICOM_MAGIC = b'DICM'
+ZIP_SIGNATURES = (b'PK\x03\x04', b'PK\x05\x06')
+IGNORED_PREFIXES = ('__MACOSX/',)
+
+PreflightReport = namedtuple('PreflightReport', ['entries', 'dicom_entries', 'compressed_bytes', 'uncompressed_bytes'])
+
+
+class PreflightError(Exception):
+    """An upload rejected by preflight, carrying a structured error payload"""
+
+    def __init__(self, code, detail, status_code=400, **extra):
+        super().__init__(detail)
+        self.code = code
+        self.detail = detail
+        self.status_code = status_code
+        self.extra = extra
+
+    def as_dict(self):
+        return {'detail': self.detail, 'code': self.code, **self.extra}
+
+
+def _is_unsafe_path(name):
+    normalized = posixpath.normpath(name.replace('\\', '/'))
+    return normalized.startswith(('/', '../')) or normalized == '..' or ':' in normalized.split('/')[0]
+
+
+def _has_dicom_magic(archive, info):
+    with archive.open(info) as member:
+        header = member.read(DICOM_PREAMBLE_LENGTH + len(DICOM_MAGIC))
+    return header[DICOM_PREAMBLE_LENGTH:] == DICOM_MAGIC
+
+
+def preflight_archive(fileobj):
+    """
+    Validate an uploaded archive before forwarding it
+
+    Checks, in order: ZIP signature, readable central directory, entry count, unsafe or
+    encrypted entries, total uncompressed size, per-entry and overall compression ratio,
+    and the ``DICM`` magic at offset 128 of ``.dcm`` (and extensionless) entries.
+
+    Args:
+        fileobj: Seekable binary file object holding the archive
+
+    Returns:
+        PreflightReport: Entry counts and sizes
+
+    Raises:
+        PreflightError: With a machine-readable ``code`` describing the first problem found
+    """
+    max_entries = getattr(settings, 'PREFLIGHT_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    max_uncompressed = getattr(settings, 'PREFLIGHT_MAX_UNCOMPRESSED_BYTES', DEFAULT_MAX_UNCOMPRESSED_BYTES)
+    max_ratio = getattr(settings, 'PREFLIGHT_MAX_COMPRESSION_RATIO', DEFAULT_MAX_COMPRESSION_RATIO)
+
+    fileobj.seek(0)
+    if fileobj.read(4) not in ZIP_SIGNATURES:
+        raise PreflightError('not_a_zip', 'The uploaded file is not a ZIP archive.')
+    fileobj.seek(0)
+
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError, EOFError):
+        raise PreflightError('corrupt_zip', 'The ZIP archive is corrupt or truncated.')
+
+    with archive:
+        infos = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith(IGNORED_PREFIXES)
+        ]
+        if len(infos) > max_entries:
+            raise PreflightError(
+                'too_many_entries', f'The archive contains more than {max_entries} files.',
+                status_code=413, entries=len(infos), limit=max_entries,
+            )
+
+        compressed = uncompressed = 0
+        candidates = []
+        for info in infos:
+            if _is_unsafe_path(info.filename):
+                raise PreflightError('unsafe_path', 'The archive contains an unsafe file path.', entry=info.filename)
+            if info.flag_bits & 0x1:
+                raise PreflightError('encrypted_entry', 'Encrypted archives are not supported.', entry=info.filename)
+            if info.file_size >= RATIO_CHECK_MIN_BYTES and info.file_size > max_ratio * max(info.compress_size, 1):
+                raise PreflightError(
+                    'suspicious_compression_ratio', 'The archive has a suspicious compression ratio.',
+                    status_code=422, entry=info.filename, limit=max_ratio,
+                )
+            compressed += info.compress_size
+            uncompressed += info.file_size
+            if uncompressed > max_uncompressed:
+                raise PreflightError(
+                    'uncompressed_too_large', 'The archive expands beyond the allowed size.',
+                    status_code=413, limit=max_uncompressed,
+                )
+            extension = posixpath.splitext(posixpath.basename(info.filename))[1].lower()
+            if extension in ('.dcm', ''):
+                candidates.append(info)
+
+        if uncompressed >= RATIO_CHECK_MIN_BYTES and uncompressed > max_ratio * max(compressed, 1):
+            raise PreflightError(
+                'suspicious_compression_ratio', 'The archive has a suspicious compression ratio.',
+                status_code=422, limit=max_ratio,
+            )
+
+        dicom_entries = 0
+        invalid = []
+        try:
+            for info in candidates:
+                if _has_dicom_magic(archive, info):
+                    dicom_entries += 1
+                elif info.filename.lower().endswith('.dcm'):
+                    invalid.append(info.filename)
+        except (zipfile.BadZipFile, NotImplementedError, OSError, EOFError):
+            raise PreflightError('corrupt_zip', 'The ZIP archive is corrupt or uses an unsupported compression method.')
+
+    fileobj.seek(0)
+    if invalid:
+        raise PreflightError(
+            'invalid_dicom', 'Some .dcm files are not valid DICOM files.',
+            status_code=422, entries=invalid[:10], invalid_count=len(invalid),
+        )
+    if not dicom_entries:
+        raise PreflightError('no_dicom_files', 'The archive does not contain any DICOM files.', status_code=422)
+
+    return PreflightReport(len(infos), dicom_entries, compressed, uncompressed)
@@ -0,0 +1,157 @@
+"""
+The serialized user payload returned at login and by /api/user/me/.
+/api/user/me/ serves a copy rendered once and cached per process under the user's
+authentication version stamp (api.authentication), so any save of the user retires it along
+with the cached user object, and revalidations are answered from its ETag without rendering.
+Login files both under the stamp, so the client's first /api/user/me/ is already a hit.
+"""
+
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import AUTH_VERSION_ATTR, get_user_cache
+
+DEFAULT_MAX_ENTRIES = 10000
+
+PROFILE_FIELDS = ('id', 'email', 'full_name', 'role', 'country', 'phone_number', 'date_joined', 'account_status')
+ROLE_PROFILE_FIELDS = {
+    'doctor': ('medical_license_number', 'specialization', 'hospital_affiliation'),
+    'researcher': ('research_institution', 'affiliation_type', 'purpose_of_use', 'orcid_id'),
+}
+
+
+def build_profile_payload(user):
+    """Common fields plus those of the user's role"""
+    fields = PROFILE_FIELDS + ROLE_PROFILE_FIELDS.get(user.role, ())
+    return {field: getattr(user, field) for field in fields}
+
+
+class RenderedProfile:
+    """A profile payload rendered to JSON once, with the validators for conditional GETs"""
+
+    def __init__(self, payload, last_modified):
+        self.body = JSONRenderer().render(payload)
+        # Derived from the content rather than the version stamp, which is only per process
+        # without a shared cache; two processes must never label different bodies alike
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.last_modified = last_modified
+
+
+class ProfilePayloadCache:
+    """Thread-safe LRU of rendered profiles keyed by user id and version stamp"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'PROFILE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, version, profile):
+        with self._lock:
+            self._entries[user_id] = (version, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_profile_cache = None
+_profile_cache_lock = threading.Lock()
+
+
+def get_profile_cache():
+    """Get the process-wide rendered profile cache"""
+    global _profile_cache
+    with _profile_cache_lock:
+        if _profile_cache is None:
+            _profile_cache = ProfilePayloadCache()
+        return _profile_cache
+
+
+@receiver(setting_changed)
+def _reset_profile_cache(*, setting, **kwargs):
+    global _profile_cache
+    if setting.startswith('PROFILE_CACHE_'):
+        with _profile_cache_lock:
+            _profile_cache = None
+
+
+def get_rendered_profile(user):
+    """
+    Get the user's rendered profile, from the cache when possible
+
+    Only users resolved by CachedJWTAuthentication are cached: they carry the version stamp that
+    was current before they were loaded, so a profile can never be filed under a newer stamp than
+    the data it was built from.
+
+    Returns:
+        RenderedProfile
+    """
+    version = getattr(user, AUTH_VERSION_ATTR, None)
+    if version is None:
+        return RenderedProfile(build_profile_payload(user), user.updated_at)
+    user_id = str(user.pk)
+    cache = get_profile_cache()
+    profile = cache.get(user_id, version)
+    if profile is None:
+        profile = RenderedProfile(build_profile_payload(user), user.updated_at)
+        cache.set(user_id, version, profile)
+    return profile
+
+
+def cache_logged_in_user(user):
+    """
+    File a user who has just been loaded to log in, and their rendered profile, under the
+    user's current version stamp
+
+    Call it right after the user is loaded: unlike CachedJWTAuthentication, the stamp is read
+    after the data here, so a save committed between the two would leave the old data filed
+    under the newer stamp until the next save.
+
+    Returns:
+        dict: The profile payload
+    """
+    user_id = str(getattr(user, api_settings.USER_ID_FIELD))
+    user_cache = get_user_cache()
+    version = user_cache.version(user_id)
+    user_cache.set(user_id, version, copy.copy(user))
+    payload = build_profile_payload(user)
+    get_profile_cache().set(user_id, version, RenderedProfile(payload, user.updated_at))
+    return payload
+
+
+def issue_tokens(user, token_class):
+    """
+    Create a refresh/access token pair for a user who has just logged in
+
+    The outstanding token row and (with UPDATE_LAST_LOGIN) the last_login update are written in
+    one transaction.
+
+    Returns:
+        RefreshToken: The new refresh token
+    """
+    with transaction.atomic():
+        refresh = token_class.for_user(user)
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
+    return refresh
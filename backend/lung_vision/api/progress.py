@@ -0,0 +1,148 @@
+"""
+Prediction progress streaming over Server-Sent Events.
+Job workers publish stage changes to an in-process broker; each waiting client holds one
+lightweight async connection that wakes on those notifications (or on a periodic re-check of
+the database, so jobs run by another process are still reported) instead of polling.
+"""
+
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import PredictionJob
+
+DEFAULT_POLL_INTERVAL = 5
+
+# Stages, in the order a client sees them
+UPLOAD_RECEIVED = 'upload_received'
+PREFLIGHT_DONE = 'preflight_done'
+QUEUED = 'queued'
+UPSTREAM_STARTED = 'upstream_started'
+COMPLETED = 'completed'
+FAILED = 'failed'
+ERROR = 'error'
+
+
+class ProgressBroker:
+    """
+    Thread-safe fan-out of job notifications to asyncio subscribers.
+
+    Notifications carry no state; they only wake subscribers, which then read the job from the
+    database. A missed or duplicated notification therefore never produces a wrong event.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, job_id):
+        """Register the running event loop for notifications about ``job_id``"""
+        subscription = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(str(job_id), set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, job_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(str(job_id))
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[str(job_id)]
+
+    def publish(self, job_id=None):
+        """
+        Wake subscribers of ``job_id``, or every subscriber when ``job_id`` is None
+        (a job leaving the queue moves everyone else's queue position)
+        """
+        with self._lock:
+            if job_id is None:
+                targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+            else:
+                targets = list(self._subscribers.get(str(job_id), ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            except RuntimeError:
+                # The client's event loop has already shut down
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+_broker = ProgressBroker()
+
+
+def get_progress_broker():
+    """Get the process-wide progress broker"""
+    return _broker
+
+
+def format_event(stage, data, event_id=None):
+    """Encode one SSE frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {stage}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def _job_state(job_id):
+    job = PredictionJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return None, None
+    position = None
+    if job.status == 'queued':
+        position = PredictionJob.objects.filter(status='queued', created_at__lt=job.created_at).count() + 1
+    return job, position
+
+
+async def job_events(job_id, present, poll_interval=None):
+    """
+    Yield SSE frames for a job until it finishes
+
+    Args:
+        job_id: PredictionJob primary key
+        present: Callable turning a finished job into the ``completed``/``failed`` payload
+        poll_interval: Seconds between database re-checks, which also serve as keepalives
+    """
+    poll_interval = poll_interval or getattr(settings, 'PREDICTION_EVENTS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    broker = get_progress_broker()
+    # Subscribe before the first read so no transition can slip between the two
+    subscription = broker.subscribe(job_id)
+    try:
+        last = None
+        while True:
+            job, position = await sync_to_async(_job_state)(job_id)
+            if job is None:
+                yield format_event(ERROR, {'detail': 'Prediction job not found.'})
+                return
+
+            if job.is_finished():
+                payload = await sync_to_async(present)(job)
+                yield format_event(COMPLETED if job.status == 'completed' else FAILED, payload, event_id=job.status)
+                return
+
+            if job.status == 'queued':
+                state = (QUEUED, position)
+                data = {'job_id': job.pk, 'position': position}
+            else:
+                state = (UPSTREAM_STARTED, None)
+                data = {'job_id': job.pk, 'started_at': job.started_at}
+            if state != last:
+                yield format_event(state[0], data, event_id=state[0])
+                last = state
+
+            try:
+                await asyncio.wait_for(subscription[1].get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                # Comment frame: keeps proxies from closing an idle connection
+                yield b': keepalive\n\n'
+    finally:
+        broker.unsubscribe(job_id, subscription)
@@ -0,0 +1,194 @@
+"""
+Refresh token revocation: an in-memory index of blacklisted token ids, and batched pruning of
+expired OutstandingToken/BlacklistedToken rows.
+With refresh token rotation every refresh blacklists a token, so both tables grow without bound
+unless expired rows are removed. Blacklist checks are answered from the index, which only reads
+rows blacklisted since its last sync instead of querying the blacklist per token. Refresh tokens
+are the exception on a miss: a token another worker rotated inside the sync window must not be
+accepted again, so a miss is confirmed against the blacklist table.
+"""
+
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKET_SECONDS = 5 * 60
+DEFAULT_SYNC_INTERVAL = 1
+DEFAULT_PRUNE_BATCH_SIZE = 1000
+# Rows below the high-water mark re-read on every sync: ids are allocated before commit, so a
+# concurrent transaction can commit a lower id after a sync has already read past it
+SYNC_OVERLAP = 32
+
+
+class RevocationIndex:
+    """
+    Set of revoked token ids grouped into expiry buckets.
+
+    A token is dropped (a whole bucket at a time) once it has expired, since an expired token is
+    rejected by its signature check anyway. Revocations made in this process are visible
+    immediately; ones made by other processes are picked up by ``sync()``, which reads only
+    blacklist rows newer than the last one seen and runs at most every ``sync_interval`` seconds.
+    """
+
+    def __init__(self, bucket_seconds=None, sync_interval=None):
+        self.bucket_seconds = bucket_seconds or getattr(settings, 'TOKEN_REVOCATION_BUCKET_SECONDS', DEFAULT_BUCKET_SECONDS)
+        self.sync_interval = sync_interval if sync_interval is not None else getattr(settings, 'TOKEN_REVOCATION_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL)
+        self._buckets = {}
+        self._bucket_of = {}
+        self._next_prune = 0
+        self._high_water = 0
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _prune(self, now):
+        # Buckets are numbered by the end of their expiry window, so at most one can expire
+        # per window; skip the scan until then
+        if now < self._next_prune:
+            return
+        for bucket in [b for b in self._buckets if b * self.bucket_seconds <= now]:
+            for jti in self._buckets.pop(bucket):
+                del self._bucket_of[jti]
+        self._next_prune = (math.floor(now / self.bucket_seconds) + 1) * self.bucket_seconds
+
+    def add(self, jti, exp):
+        """Record a revoked token id and its expiry (epoch seconds)"""
+        now = time.time()
+        if exp <= now:
+            return
+        bucket = math.ceil(exp / self.bucket_seconds)
+        with self._lock:
+            self._prune(now)
+            if jti not in self._bucket_of:
+                self._buckets.setdefault(bucket, set()).add(jti)
+                self._bucket_of[jti] = bucket
+
+    def _contains(self, jti):
+        with self._lock:
+            self._prune(time.time())
+            return jti in self._bucket_of
+
+    def is_revoked(self, jti, exact=False):
+        """
+        Check a token id, syncing from the database first if the index may be stale
+
+        With ``exact``, a miss is confirmed by looking the token up in the blacklist instead,
+        so revocations made by other processes since the last sync are seen too.
+        """
+        if self._contains(jti):
+            return True
+        if exact:
+            expires_at = BlacklistedToken.objects.filter(token__jti=jti).values_list('token__expires_at', flat=True).first()
+            if expires_at is None:
+                return False
+            self.add(jti, expires_at.timestamp())
+            return True
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+            return self._contains(jti)
+        return False
+
+    def sync(self):
+        """Load blacklist rows added (by any process) since the last sync"""
+        with self._sync_lock:
+            rows = (
+                BlacklistedToken.objects.filter(pk__gt=self._high_water - SYNC_OVERLAP)
+                .order_by('pk')
+                .values_list('pk', 'token__jti', 'token__expires_at')
+            )
+            for pk, jti, expires_at in rows:
+                self.add(jti, expires_at.timestamp())
+                self._high_water = max(self._high_water, pk)
+            self._synced_at = time.monotonic()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._bucket_of)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_revocation_index():
+    """Get the process-wide revocation index"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = RevocationIndex()
+        return _index
+
+
+@receiver(setting_changed)
+def _reset_revocation_index(*, setting, **kwargs):
+    global _index
+    if setting.startswith('TOKEN_REVOCATION_'):
+        with _index_lock:
+            _index = None
+
+
+class IndexedRefreshToken(RefreshToken):
+    """
+    RefreshToken whose blacklist checks go through the revocation index, confirming misses
+    against the database, and that can only be blacklisted (rotated) once
+    """
+
+    def check_blacklist(self):
+        if get_revocation_index().is_revoked(self.payload[api_settings.JTI_CLAIM], exact=True):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklisted, created = super().blacklist()
+        get_revocation_index().add(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        if not created:
+            # A concurrent refresh of the same token got there first; don't issue a second pair
+            raise TokenError(_("Token is blacklisted"))
+        return blacklisted, created
+
+
+def prune_expired_tokens(batch_size=None, now=None):
+    """
+    Delete expired outstanding tokens, and their blacklist entries, in batches
+
+    Each batch is its own short transaction, so SQLite's write lock is never held for long and
+    logins and refreshes can interleave with a large cleanup.
+
+    Args:
+        batch_size: Rows per batch (defaults to TOKEN_PRUNE_BATCH_SIZE)
+        now: Expiry cutoff (defaults to the current time)
+
+    Returns:
+        int: Number of outstanding tokens removed
+    """
+    batch_size = batch_size or getattr(settings, 'TOKEN_PRUNE_BATCH_SIZE', DEFAULT_PRUNE_BATCH_SIZE)
+    now = now or timezone.now()
+    removed = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(pk__in=ids).delete()
+        removed += len(ids)
+    if removed:
+        logger.info(f"Pruned {removed} expired token(s)")
+    return removed
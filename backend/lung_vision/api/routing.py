@@ -0,0 +1,238 @@
+"""
+Load-balanced routing across inference backends.
+Requests go to the healthy backend with the fewest outstanding requests, subject to a
+per-backend concurrency cap. Backends that keep failing are ejected and re-admitted once
+their health check passes again.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .upstream import DEFAULT_BASE_URL, UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_HEALTH_CHECK_PATH = '/health'
+DEFAULT_HEALTH_CHECK_INTERVAL = 10
+DEFAULT_HEALTH_CHECK_TIMEOUT = 2
+DEFAULT_EJECT_AFTER_FAILURES = 3
+DEFAULT_EJECTION_SECONDS = 30
+DEFAULT_ACQUIRE_TIMEOUT = 5
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every inference backend is ejected or at its concurrency cap"""
+
+
+class Backend:
+    """A single inference server and its live routing state"""
+
+    def __init__(self, url, max_concurrency=None):
+        self.url = url.rstrip('/')
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.client = UpstreamClient(base_url=self.url, pool_size=self.max_concurrency)
+        # Probes must report the backend's state as-is, so they are never retried
+        self.health_client = UpstreamClient(base_url=self.url, pool_size=1, retries=0)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def is_available(self, now):
+        return self.healthy and self.ejected_until <= now and self.outstanding < self.max_concurrency
+
+    def snapshot(self):
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'ejected': self.ejected_until > time.monotonic(),
+            'outstanding': self.outstanding,
+            'max_concurrency': self.max_concurrency,
+            'consecutive_failures': self.consecutive_failures,
+            'total_requests': self.total_requests,
+            'total_failures': self.total_failures,
+        }
+
+
+class BackendPool:
+    """
+    Least-outstanding-requests balancer over a fixed set of backends.
+
+    Passive ejection: ``eject_after`` consecutive failed requests remove a backend from rotation
+    for ``ejection_seconds``. Active health checks probe every backend in the background; a
+    failing probe marks it unhealthy and a passing probe re-admits it immediately.
+    """
+
+    def __init__(self, backends, health_check_path=None, health_check_interval=None,
+                 health_check_timeout=None, eject_after=None, ejection_seconds=None, acquire_timeout=None):
+        self.backends = backends
+        self.health_check_path = health_check_path or getattr(settings, 'INFERENCE_HEALTH_CHECK_PATH', DEFAULT_HEALTH_CHECK_PATH)
+        self.health_check_interval = getattr(settings, 'INFERENCE_HEALTH_CHECK_INTERVAL', DEFAULT_HEALTH_CHECK_INTERVAL) if health_check_interval is None else health_check_interval
+        self.health_check_timeout = health_check_timeout or getattr(settings, 'INFERENCE_HEALTH_CHECK_TIMEOUT', DEFAULT_HEALTH_CHECK_TIMEOUT)
+        self.eject_after = eject_after or getattr(settings, 'INFERENCE_EJECT_AFTER_FAILURES', DEFAULT_EJECT_AFTER_FAILURES)
+        self.ejection_seconds = getattr(settings, 'INFERENCE_EJECTION_SECONDS', DEFAULT_EJECTION_SECONDS) if ejection_seconds is None else ejection_seconds
+        self.acquire_timeout = getattr(settings, 'INFERENCE_BACKEND_ACQUIRE_TIMEOUT', DEFAULT_ACQUIRE_TIMEOUT) if acquire_timeout is None else acquire_timeout
+        self._condition = threading.Condition()
+        self._next = 0
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    @classmethod
+    def from_settings(cls):
+        configs = getattr(settings, 'INFERENCE_BACKENDS', None) or [
+            {'url': getattr(settings, 'INFERENCE_BASE_URL', DEFAULT_BASE_URL)}
+        ]
+        return cls([Backend(config['url'], config.get('max_concurrency')) for config in configs])
+
+    def _pick(self):
+        now = time.monotonic()
+        count = len(self.backends)
+        # Rotate the starting point so ties are spread round-robin
+        self._next = (self._next + 1) % count
+        best = None
+        for i in range(count):
+            backend = self.backends[(self._next + i) % count]
+            if backend.is_available(now) and (best is None or backend.outstanding < best.outstanding):
+                best = backend
+        return best
+
+    def acquire(self, timeout=None):
+        """
+        Reserve a slot on the least loaded available backend
+
+        Args:
+            timeout: Seconds to wait for a slot when every backend is busy (defaults to acquire_timeout)
+
+        Returns:
+            Backend: The reserved backend; pass it to release() when done
+
+        Raises:
+            NoBackendAvailable: If no backend frees up within the timeout
+        """
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        with self._condition:
+            while True:
+                backend = self._pick()
+                if backend is not None:
+                    backend.outstanding += 1
+                    backend.total_requests += 1
+                    return backend
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoBackendAvailable()
+                # Wake up at least when the soonest ejection expires
+                self._condition.wait(min(remaining, 1.0))
+
+    def release(self, backend, success):
+        """Return a slot and record the outcome for passive ejection"""
+        with self._condition:
+            backend.outstanding -= 1
+            if success:
+                backend.consecutive_failures = 0
+            else:
+                backend.consecutive_failures += 1
+                backend.total_failures += 1
+                if backend.consecutive_failures >= self.eject_after and backend.ejected_until <= time.monotonic():
+                    backend.ejected_until = time.monotonic() + self.ejection_seconds
+                    logger.warning(f"Ejected inference backend {backend.url} after {backend.consecutive_failures} consecutive failures")
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """
+        Context manager around acquire()/release(). The caller marks failures by raising, or by
+        setting ``lease.failed = True`` on the yielded lease.
+        """
+        backend = self.acquire(timeout)
+        lease = _Lease(backend)
+        try:
+            yield lease
+        except Exception:
+            lease.failed = True
+            raise
+        finally:
+            self.release(backend, success=not lease.failed)
+
+    def check_health(self):
+        """Probe every backend once, ejecting failures and re-admitting recoveries"""
+        for backend in self.backends:
+            try:
+                resp = backend.health_client.get(self.health_check_path, timeout=self.health_check_timeout)
+                healthy = resp.status_code < 500
+            except requests.RequestException:
+                healthy = False
+            with self._condition:
+                if healthy and not backend.healthy:
+                    logger.info(f"Inference backend {backend.url} passed its health check and was re-admitted")
+                elif not healthy and backend.healthy:
+                    logger.warning(f"Inference backend {backend.url} failed its health check")
+                backend.healthy = healthy
+                if healthy:
+                    backend.consecutive_failures = 0
+                    backend.ejected_until = 0.0
+                self._condition.notify_all()
+
+    def start_health_checks(self):
+        if self._health_thread is not None or not self.health_check_interval:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, name='inference-health-check', daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            try:
+                self.check_health()
+            except Exception:
+                logger.exception("Inference health check crashed")
+
+    def stop(self):
+        self._stop.set()
+        for backend in self.backends:
+            backend.client.close()
+            backend.health_client.close()
+
+    def snapshot(self):
+        with self._condition:
+            return [backend.snapshot() for backend in self.backends]
+
+
+class _Lease:
+    def __init__(self, backend):
+        self.backend = backend
+        self.failed = False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool():
+    """Get the process-wide inference backend pool, starting its health checks"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BackendPool.from_settings()
+            _pool.start_health_checks()
+        return _pool
+
+
+@receiver(setting_changed)
+def _reset_backend_pool(*, setting, **kwargs):
+    """Rebuild the pool when inference settings are overridden (e.g. in tests)"""
+    global _pool
+    if not setting.startswith('INFERENCE_'):
+        return
+    with _pool_lock:
+        if _pool is not None:
+            _pool.stop()
+        _pool = None
@@ -1,7 +1,18 @@
-from rest_framework import serializers
-from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework import exceptions, serializers
+from django.contrib.auth import authenticate, get_user_model
+from rest_framework_simplejwt.serializers import (
+    TokenBlacklistSerializer,
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+    TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 from django.utils import timezone
+from .models import Prediction, PredictionJob
+from .profiles import PROFILE_FIELDS, ROLE_PROFILE_FIELDS, cache_logged_in_user, issue_tokens
+from .revocation import IndexedRefreshToken, get_revocation_index
+from .visualizations import present_prediction
 
 User = get_user_model()
 
@@ -88,9 +99,21 @@ class ResearcherRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = IndexedRefreshToken
+
     def validate(self, attrs):
-        data = super().validate(attrs)
-        
+        # One query finds the user (ModelBackend); approval is checked before any token row is
+        # written, and the token bookkeeping then happens in a single transaction
+        self.user = authenticate(
+            request=self.context.get('request'),
+            **{self.username_field: attrs[self.username_field], 'password': attrs['password']},
+        )
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise exceptions.AuthenticationFailed(
+                self.error_messages['no_active_account'],
+                'no_active_account',
+            )
+
         # Check if account is approved
         if not self.user.can_login():
             if self.user.is_pending():
@@ -106,29 +129,91 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
                 raise serializers.ValidationError(
                     "Your account is not approved for login. Please contact support."
                 )
-        
-        data['user'] = {
-            'email': self.user.email,
-            'full_name': self.user.full_name,
-            'role': self.user.role,
-            'country': getattr(self.user, 'country', None),
-            'phone_number': getattr(self.user, 'phone_number', None),
-            'account_status': self.user.account_status,
+
+        # Seeds the caches /api/user/me/ reads, as close to the user query as possible
+        payload = cache_logged_in_user(self.user)
+        refresh = issue_tokens(self.user, self.token_class)
+        return {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'user': payload,
         }
-        
-        # Add role-specific data
-        if self.user.role == 'doctor':
-            data['user'].update({
-                'medical_license_number': self.user.medical_license_number,
-                'specialization': self.user.specialization,
-                'hospital_affiliation': self.user.hospital_affiliation,
-            })
-        elif self.user.role == 'researcher':
-            data['user'].update({
-                'research_institution': self.user.research_institution,
-                'affiliation_type': self.user.affiliation_type,
-                'purpose_of_use': self.user.purpose_of_use,
-                'orcid_id': self.user.orcid_id,
-            })
-        
+
+
+class IndexedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that checks the blacklist through the in-memory revocation index"""
+    token_class = IndexedRefreshToken
+
+
+class IndexedTokenBlacklistSerializer(TokenBlacklistSerializer):
+    """Logout that records the revoked token in the in-memory revocation index"""
+    token_class = IndexedRefreshToken
+
+
+class IndexedTokenVerifySerializer(TokenVerifySerializer):
+    """
+    Token verification that checks the blacklist through the in-memory revocation index;
+    refresh tokens are confirmed against the database on a miss, as on refresh
+    """
+
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        jti = token.get(api_settings.JTI_CLAIM)
+        exact = token.get(api_settings.TOKEN_TYPE_CLAIM) == IndexedRefreshToken.token_type
+        if api_settings.BLACKLIST_AFTER_ROTATION and jti and get_revocation_index().is_revoked(jti, exact=exact):
+            raise serializers.ValidationError("Token is blacklisted")
+        return {}
+
+
+class PredictionJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+
+    class Meta:
+        model = PredictionJob
+        fields = (
+            'job_id', 'status', 'original_filename', 'upstream_status',
+            'result', 'error', 'created_at', 'started_at', 'completed_at',
+        )
+        read_only_fields = fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        if request is not None and data.get('result'):
+            data['result'] = present_prediction(data['result'], request)
         return data
+
+
+class PredictionSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = Prediction
+        fields = (
+            'id', 'patient_id', 'archive_hash', 'predicted_class', 'predicted_class_index',
+            'confidence', 'class_probabilities', 'result', 'model_version', 'source', 'job_id',
+            'cache_status', 'queued_ms', 'duration_ms', 'created_at',
+        )
+        read_only_fields = fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        if request is not None and data.get('result'):
+            data['result'] = present_prediction(data['result'], request)
+        return data
+
+
+class PendingUserSerializer(serializers.ModelSerializer):
+    """A registration waiting for approval, with the details of every role"""
+
+    class Meta:
+        model = User
+        fields = PROFILE_FIELDS + tuple(field for fields in ROLE_PROFILE_FIELDS.values() for field in fields)
+        read_only_fields = fields
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    total_size = serializers.IntegerField(min_value=1)
+    chunk_size = serializers.IntegerField(required=False, min_value=1)
@@ -0,0 +1,296 @@
+"""
+Local stand-ins for external services (the inference server, an SMTP server), used by the test
+suite and benchmark commands.
+"""
+
+import io
+import json
+import socketserver
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PREDICTION = {
+    'success': True,
+    'patient_id': 'stub-patient',
+    'predicted_class': 'Benign',
+    'predicted_class_index': 0,
+    'confidence': 0.91,
+    'class_probabilities': {'Benign': 0.91, 'Malignant': 0.09},
+    'prediction_visualization': None,
+    'attention_visualization': None,
+    'feature_focus_visualization': None,
+    'message': 'Prediction completed',
+}
+
+
+def make_dicom_zip(members, compression=zipfile.ZIP_DEFLATED):
+    """Build an in-memory ZIP of fake DICOM files from a {name: body} mapping"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=compression) as archive:
+        for name, body in members.items():
+            archive.writestr(name, b'\0' * 128 + b'DICM' + body)
+    return buffer.getvalue()
+
+
+class _StubInferenceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment so keep-alive clients aren't stalled by delayed ACKs
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    read_chunk_size = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def _drain_body(self):
+        """Read and discard the request body chunk by chunk, returning its length"""
+        remaining = int(self.headers.get('Content-Length') or 0)
+        received = 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(self.read_chunk_size, remaining))
+            if not chunk:
+                break
+            received += len(chunk)
+            remaining -= len(chunk)
+        return received
+
+    def _send_json(self, status_code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        stub = self.server.stub
+        if self.path.rstrip('/') != '/health':
+            self._send_json(404, {'detail': 'Not found'})
+            return
+        if stub.mode == 'failing':
+            self._send_json(503, {'status': 'unhealthy'})
+            return
+        self._send_json(200, {'status': 'ok'})
+
+    def do_POST(self):
+        stub = self.server.stub
+        received = self._drain_body()
+        stub._record(self, received)
+
+        delay = stub.latency + (stub.slow_latency if stub.mode == 'slow' else 0)
+        stub._enter()
+        try:
+            if delay:
+                time.sleep(delay)
+        finally:
+            stub._exit()
+        if stub.mode == 'failing':
+            self._send_json(500, {'detail': 'Model server error'})
+            return
+        payload = dict(stub.payload)
+        payload['bytes_received'] = received
+        self._send_json(200, payload)
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+
+class StubInferenceServer:
+    """
+    Threaded HTTP server that mimics the FastAPI model server.
+
+    Supports POST /predict and GET /health. ``mode`` can be switched at runtime
+    between ``'healthy'``, ``'slow'`` and ``'failing'``.
+
+    Usage:
+        with StubInferenceServer(latency=0.05) as stub:
+            requests.post(stub.predict_url, ...)
+    """
+
+    def __init__(self, mode='healthy', latency=0.0, slow_latency=2.0, payload=None):
+        self.mode = mode
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.payload = payload or DEFAULT_PREDICTION
+        self.request_count = 0
+        self.bytes_received = 0
+        self.connections = set()
+        # Predictions being "computed" right now, and the most seen at once
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def _record(self, handler, received):
+        with self._lock:
+            self.request_count += 1
+            self.bytes_received += received
+            self.connections.add(handler.client_address)
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def predict_url(self):
+        return f'{self.base_url}/predict'
+
+    def start(self):
+        self._server = _StubHTTPServer(('127.0.0.1', 0), _StubInferenceHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _StubSMTPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def handle(self):
+        stub = self.server.stub
+        stub._connected()
+        if stub.connect_latency:
+            time.sleep(stub.connect_latency)
+        self.reply('220 stub ESMTP ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-stub\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n')
+            elif verb in ('HELO', 'NOOP'):
+                self.reply('250 OK')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.partition(':')[2].strip().strip('<>')
+                if address in stub.reject:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while (line := self.rfile.readline()) not in (b'.\r\n', b''):
+                    pass
+                if stub.message_latency:
+                    time.sleep(stub.message_latency)
+                stub._delivered(recipients)
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+class StubSMTPServer:
+    """
+    Threaded SMTP server that accepts and counts mail without delivering it.
+
+    ``connect_latency`` is spent before the greeting of every connection (standing in for the TCP,
+    TLS and AUTH round trips of a real server) and ``message_latency`` after each message's data.
+    Recipients in ``reject`` are refused with a 550.
+
+    Usage:
+        with StubSMTPServer(connect_latency=0.02) as stub:
+            with override_settings(**stub.email_settings()):
+                ...
+    """
+
+    def __init__(self, connect_latency=0.0, message_latency=0.0, reject=()):
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.reject = set(reject)
+        self.connection_count = 0
+        self.message_count = 0
+        self.recipients = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def _connected(self):
+        with self._lock:
+            self.connection_count += 1
+
+    def _delivered(self, recipients):
+        with self._lock:
+            self.message_count += 1
+            self.recipients.extend(recipients)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def email_settings(self):
+        """Settings pointing Django's SMTP backend at this server"""
+        return {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': '127.0.0.1',
+            'EMAIL_PORT': self.port,
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+            'EMAIL_USE_TLS': False,
+            'EMAIL_USE_SSL': False,
+        }
+
+    def start(self):
+        self._server = _StubSMTPServer(('127.0.0.1', 0), _StubSMTPHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,3 +1,1723 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.core import mail
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import OperationalError, connection
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .revocation import IndexedRefreshToken, RevocationIndex, get_revocation_index, prune_expired_tokens
+from .authentication import CachedJWTAuthentication, UserAuthCache, get_user_cache
+from .account_status import bulk_transition
+from .batch import run_batch, split_patient_folders
+from .admission import AdmissionController, AdmissionRejected, get_admission_controller
+from .circuit_breaker import CircuitBreaker, CircuitOpen
+from .email_service import EmailService
+from .email_templates import EmailShells, get_email_template
+from .inference import MultipartFileStream, forward_prediction
+from .jobs import PredictionJobQueue, QueueFull, process_job, start_job_queue
+from .models import AccountStatusEvent, EmailOutbox, Prediction, PredictionJob, UploadSession
+from .outbox import enqueue_account_email, process_outbox
+from .preflight import PreflightError, preflight_archive
+from .progress import get_progress_broker
+from .prediction_cache import PredictionResultCache, archive_digest, get_result_cache
+from .routing import Backend, BackendPool, NoBackendAvailable
+from .testing import DEFAULT_PREDICTION, StubInferenceServer, StubSMTPServer, make_dicom_zip
+from .uploads import UploadError, cleanup_stale_sessions, finalize_session, session_path, write_chunk
+from .user_counts import get_user_counts, rebuild_user_counts
+from .user_search import rebuild_search_index, search_users
+from .upstream import UpstreamClient, get_upstream_client
+
+
+def make_temporary_upload(size, name='scan.zip', block_size=1024 * 1024):
+    """Build a disk-backed upload of ``size`` bytes without holding it in memory"""
+    upload = TemporaryUploadedFile(name, 'application/zip', size, None)
+    block = b'\0' * block_size
+    remaining = size
+    while remaining > 0:
+        upload.write(block[:min(block_size, remaining)])
+        remaining -= block_size
+    upload.flush()
+    upload.seek(0)
+    return upload
+
+
+def wait_until(predicate, timeout=5):
+    """Poll ``predicate`` until it is truthy or the timeout expires"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('Condition not met in time')
+        time.sleep(0.005)
+
+
+def create_doctor(email='doc@example.com', **fields):
+    """An approved doctor with the password 'pass12345'; ``fields`` override the defaults"""
+    fields = {'full_name': 'Doc', 'account_status': 'approved', **fields}
+    return get_user_model().objects.create_user(email, 'pass12345', **fields)
+
+
+def create_admin():
+    """The superuser admin@example.com, password 'pass12345'"""
+    return get_user_model().objects.create_superuser('admin@example.com', 'pass12345', full_name='Admin')
+
+
+class StreamingProxyTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+
+    def test_multipart_stream_length_matches_body(self):
+        upload = SimpleUploadedFile('scan "1".zip', b'x' * 1000, content_type='application/zip')
+        body = MultipartFileStream(upload, upload.name, chunk_size=64)
+        payload = b''.join(body)
+        self.assertEqual(len(payload), len(body))
+        self.assertIn(b'filename="scan %221%22.zip"', payload)
+        # Iterating again replays the same body
+        self.assertEqual(b''.join(body), payload)
+
+    def test_large_upload_streams_with_flat_memory(self):
+        size = 64 * 1024 * 1024
+        chunk_size = 64 * 1024
+        upload = make_temporary_upload(size)
+        try:
+            with StubInferenceServer() as stub:
+                with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                    tracemalloc.start()
+                    try:
+                        status_code, data = forward_prediction(upload, chunk_size=chunk_size)
+                        _, peak = tracemalloc.get_traced_memory()
+                    finally:
+                        tracemalloc.stop()
+        finally:
+            upload.close()
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['bytes_received'], stub.bytes_received)
+        self.assertGreater(stub.bytes_received, size)
+        # Peak memory is a few chunks, not the size of the archive
+        self.assertLess(peak, 4 * 1024 * 1024)
+
+    def test_proxy_view_forwards_upload(self):
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                upload = SimpleUploadedFile('scan.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+                resp = APIClient().post('/api/predict/', {'file': upload}, format='multipart')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['predicted_class'], 'Benign')
+        self.assertEqual(stub.request_count, 1)
+
+    def test_proxy_view_reports_unreachable_upstream(self):
+        with override_settings(INFERENCE_BASE_URL='http://127.0.0.1:1', INFERENCE_RETRIES=0):
+            upload = SimpleUploadedFile('scan.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+            resp = APIClient().post('/api/predict/', {'file': upload}, format='multipart')
+
+        self.assertEqual(resp.status_code, 502)
+
+
+class UpstreamClientTests(TestCase):
+    def test_connections_are_reused_across_requests(self):
+        with StubInferenceServer() as stub:
+            client = UpstreamClient(base_url=stub.base_url, pool_size=2)
+            for _ in range(5):
+                self.assertEqual(client.post('/predict', data=b'ping').status_code, 200)
+            client.close()
+        self.assertEqual(stub.request_count, 5)
+        self.assertEqual(len(stub.connections), 1)
+
+    def test_shared_client_follows_settings(self):
+        with override_settings(INFERENCE_BASE_URL='http://inference.internal:9000/'):
+            self.assertEqual(get_upstream_client().url('/predict'), 'http://inference.internal:9000/predict')
+        self.assertEqual(get_upstream_client().url('predict'), 'http://127.0.0.1:8090/predict')
+
+
+class BackendRoutingTests(TestCase):
+    def make_pool(self, stubs, max_concurrency=4, **kwargs):
+        pool = BackendPool(
+            [Backend(stub.base_url, max_concurrency) for stub in stubs],
+            health_check_interval=0,
+            **kwargs
+        )
+        self.addCleanup(pool.stop)
+        return pool
+
+    def call(self, pool):
+        with pool.lease() as lease:
+            resp = lease.backend.client.post('/predict', data=b'ping')
+            if resp.status_code >= 500:
+                lease.failed = True
+        return resp.status_code
+
+    def test_least_outstanding_prefers_fast_backends(self):
+        with StubInferenceServer(latency=0.0) as fast, StubInferenceServer(latency=0.05) as medium, \
+                StubInferenceServer(latency=0.3) as slow:
+            pool = self.make_pool([fast, medium, slow])
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                results = list(executor.map(lambda _: self.call(pool), range(60)))
+
+        self.assertEqual(results, [200] * 60)
+        self.assertGreater(fast.request_count, medium.request_count)
+        self.assertGreater(medium.request_count, slow.request_count)
+
+    def test_per_backend_concurrency_cap(self):
+        peak = []
+        with StubInferenceServer(latency=0.05) as first, StubInferenceServer(latency=0.05) as second:
+            pool = self.make_pool([first, second], max_concurrency=1, acquire_timeout=5)
+
+            def call(_):
+                with pool.lease() as lease:
+                    peak.append(lease.backend.outstanding)
+                    lease.backend.client.post('/predict', data=b'ping')
+
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                list(executor.map(call, range(12)))
+
+        self.assertEqual(max(peak), 1)
+        self.assertEqual(first.request_count + second.request_count, 12)
+
+    def test_failing_backend_is_ejected_and_readmitted(self):
+        with StubInferenceServer(mode='failing') as stub:
+            pool = self.make_pool([stub], eject_after=3, ejection_seconds=60)
+            for _ in range(3):
+                self.assertEqual(self.call(pool), 500)
+            with self.assertRaises(NoBackendAvailable):
+                pool.acquire(timeout=0)
+
+            stub.mode = 'healthy'
+            pool.check_health()
+            self.assertEqual(self.call(pool), 200)
+
+    def test_health_check_moves_traffic_away(self):
+        with StubInferenceServer() as good, StubInferenceServer(mode='failing') as bad:
+            pool = self.make_pool([good, bad])
+            pool.check_health()
+            for _ in range(4):
+                self.call(pool)
+            self.assertFalse(pool.snapshot()[1]['healthy'])
+
+        self.assertEqual(good.request_count, 4)
+        self.assertEqual(bad.request_count, 0)
+
+
+class AdmissionControlTests(TestCase):
+    def test_per_user_cap_rejects_with_429(self):
+        controller = AdmissionController(max_in_flight=4, max_per_user=1, max_queued=4)
+        controller.acquire('user:1')
+        with self.assertRaises(AdmissionRejected) as ctx:
+            controller.acquire('user:1')
+        self.assertEqual(ctx.exception.status_code, 429)
+        controller.acquire('user:2')
+        self.assertEqual(controller.stats()['rejections']['per_user_limit'], 1)
+
+    def test_full_queue_and_queue_timeout_reject_with_503(self):
+        controller = AdmissionController(max_in_flight=1, max_per_user=5, max_queued=1, queue_timeout=0.05)
+        controller.acquire('a')
+        with self.assertRaises(AdmissionRejected) as ctx:
+            controller.acquire('b')
+        self.assertEqual((ctx.exception.status_code, ctx.exception.reason), (503, 'queue_timeout'))
+
+        waiter = threading.Thread(target=lambda: self.assertRaises(AdmissionRejected, controller.acquire, 'c'))
+        waiter.start()
+        wait_until(lambda: controller.stats()['queue_depth'])
+        with self.assertRaises(AdmissionRejected) as ctx:
+            controller.acquire('d')
+        self.assertEqual(ctx.exception.reason, 'queue_full')
+        waiter.join()
+
+    def test_queued_request_is_admitted_when_a_slot_frees(self):
+        controller = AdmissionController(max_in_flight=1, max_per_user=5, max_queued=2, queue_timeout=5)
+        controller.acquire('a')
+        admitted = threading.Event()
+
+        def wait_for_slot():
+            with controller.slot('b'):
+                admitted.set()
+
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        wait_until(lambda: controller.stats()['queue_depth'])
+        self.assertFalse(admitted.is_set())
+        controller.release('a')
+        waiter.join()
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(controller.stats()['in_flight'], 0)
+        self.assertEqual(controller.stats()['peak_queue_depth'], 1)
+
+    async def test_async_waiters_hold_no_threads(self):
+        controller = AdmissionController(max_in_flight=1, max_per_user=5, max_queued=20, queue_timeout=5)
+        controller.acquire('busy')
+        threads = threading.active_count()
+        waiters = [asyncio.create_task(controller.aacquire(f'user:{i}')) for i in range(20)]
+        await asyncio.sleep(0.05)
+        self.assertEqual(controller.stats()['queue_depth'], 20)
+        self.assertEqual(threading.active_count(), threads)
+
+        # Released from another thread, as the sync view does
+        await asyncio.get_running_loop().run_in_executor(None, controller.release, 'busy')
+        done, pending = await asyncio.wait(waiters, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+        self.assertEqual(len(done), 1)
+        self.assertEqual(controller.stats()['in_flight'], 1)
+        winner = waiters.index(done.pop())
+
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.assertEqual(controller.stats()['queue_depth'], 0)
+        self.assertEqual(controller._per_user, {f'user:{winner}': 1})
+
+    async def test_async_wait_times_out_with_503(self):
+        controller = AdmissionController(max_in_flight=1, max_per_user=5, max_queued=2, queue_timeout=0.05)
+        await controller.aacquire('a')
+        with self.assertRaises(AdmissionRejected) as ctx:
+            await controller.aacquire('b')
+        self.assertEqual((ctx.exception.status_code, ctx.exception.reason), (503, 'queue_timeout'))
+        self.assertEqual((controller.stats()['queue_depth'], controller._per_user), (0, {'a': 1}))
+
+    @override_settings(PREDICT_ADMISSION_MAX_PER_USER=1)
+    def test_predict_view_returns_retry_after_when_saturated(self):
+        controller = get_admission_controller()
+        with controller.slot('ip:127.0.0.1'):
+            upload = SimpleUploadedFile('scan.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+            resp = APIClient().post('/api/predict/', {'file': upload}, format='multipart')
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp['Retry-After'], str(controller.retry_after))
+        self.assertEqual(resp.json()['reason'], 'per_user_limit')
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+
+    def post_archive(self):
+        upload = SimpleUploadedFile('scan.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+        return APIClient().post('/api/predict/', {'file': upload}, format='multipart')
+
+    def test_breaker_trips_fails_fast_and_recovers(self):
+        with StubInferenceServer(mode='failing') as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url, INFERENCE_RETRIES=0,
+                                   INFERENCE_BREAKER_FAILURE_THRESHOLD=2, INFERENCE_BREAKER_RESET_TIMEOUT=0.2,
+                                   INFERENCE_EJECT_AFTER_FAILURES=100, PREDICTION_CACHE_ENABLED=False):
+                self.assertEqual(self.post_archive().status_code, 500)
+                self.assertEqual(self.post_archive().status_code, 500)
+
+                resp = self.post_archive()
+                self.assertEqual(resp.status_code, 503)
+                self.assertIn('Retry-After', resp)
+                self.assertEqual(stub.request_count, 2)
+
+                # Half-open trial against a recovered server closes the circuit
+                stub.mode = 'healthy'
+                time.sleep(0.25)
+                self.assertEqual(self.post_archive().status_code, 200)
+                self.assertEqual(self.post_archive().status_code, 200)
+                self.assertEqual(stub.request_count, 4)
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=0.05, reset_timeout=60)
+        with StubInferenceServer(mode='slow', slow_latency=0.1) as stub:
+            client = UpstreamClient(base_url=stub.base_url)
+            for _ in range(2):
+                with breaker.call():
+                    client.post('/predict', data=b'ping')
+            client.close()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+    def test_failed_trial_reopens_and_trials_are_limited(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01, half_open_calls=1)
+        breaker.record(False)
+        time.sleep(0.02)
+        self.assertTrue(breaker.before_call())
+        self.assertEqual(breaker.state, 'half_open')
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        breaker.record(False, trial=True)
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker.snapshot()['times_opened'], 2)
+
+    def test_cancelled_trial_gives_its_slot_back(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01, half_open_calls=1)
+        breaker.record(False)
+        time.sleep(0.02)
+        with self.assertRaises(asyncio.CancelledError):
+            with breaker.call():
+                raise asyncio.CancelledError()
+        self.assertEqual(breaker.state, 'half_open')
+        with breaker.call():
+            pass
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_only_the_trial_resolves_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01, half_open_calls=1)
+        self.assertFalse(breaker.before_call())
+        breaker.record(False)
+        time.sleep(0.02)
+        self.assertTrue(breaker.before_call())
+        # A call admitted while the breaker was closed finishes during the trial
+        breaker.record(True)
+        self.assertEqual(breaker.state, 'half_open')
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        breaker.record(True, trial=True)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_status_endpoint_is_staff_only(self):
+        client = APIClient()
+        self.assertIn(client.get('/api/internal/inference/status/').status_code, (401, 403))
+
+        admin = create_admin()
+        client.force_authenticate(admin)
+        with override_settings(INFERENCE_HEALTH_CHECK_INTERVAL=0):
+            resp = client.get('/api/internal/inference/status/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['circuit_breaker']['state'], 'closed')
+        self.assertIn('rejections', resp.json()['admission'])
+        self.assertEqual(len(resp.json()['backends']), 1)
+
+
+class PreflightTests(TestCase):
+    def assertRejected(self, content, code):
+        with self.assertRaises(PreflightError) as ctx:
+            preflight_archive(io.BytesIO(content))
+        self.assertEqual(ctx.exception.code, code)
+        return ctx.exception
+
+    def build_zip(self, members):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, body in members.items():
+                archive.writestr(name, body)
+        return buffer.getvalue()
+
+    def test_valid_archive_passes(self):
+        content = self.build_zip({
+            'patient/1.dcm': b'\0' * 128 + b'DICM' + b'data',
+            'patient/IM0002': b'\0' * 128 + b'DICM' + b'data',
+            'patient/notes.txt': b'hello',
+            '__MACOSX/patient/._1.dcm': b'resource fork',
+        })
+        report = preflight_archive(io.BytesIO(content))
+        self.assertEqual((report.entries, report.dicom_entries), (3, 2))
+
+    def test_structural_problems(self):
+        self.assertRejected(b'not a zip at all', 'not_a_zip')
+        self.assertRejected(b'PK\x03\x04' + b'\0' * 64, 'corrupt_zip')
+        self.assertRejected(self.build_zip({'readme.txt': b'hi'}), 'no_dicom_files')
+        self.assertRejected(self.build_zip({'../escape.dcm': b'\0' * 128 + b'DICM'}), 'unsafe_path')
+        error = self.assertRejected(self.build_zip({'a.dcm': b'not dicom'}), 'invalid_dicom')
+        self.assertEqual(error.as_dict()['entries'], ['a.dcm'])
+
+    def test_resource_limits(self):
+        bomb = self.build_zip({'bomb.dcm': b'\0' * 128 + b'DICM' + b'\0' * (8 * 1024 * 1024)})
+        self.assertEqual(self.assertRejected(bomb, 'suspicious_compression_ratio').status_code, 422)
+
+        many = self.build_zip({f'{i}.dcm': b'\0' * 128 + b'DICM' for i in range(5)})
+        with override_settings(PREFLIGHT_MAX_ENTRIES=4):
+            self.assertEqual(self.assertRejected(many, 'too_many_entries').status_code, 413)
+        with override_settings(PREFLIGHT_MAX_UNCOMPRESSED_BYTES=500):
+            self.assertRejected(many, 'uncompressed_too_large')
+
+    def test_proxy_rejects_before_contacting_upstream(self):
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                upload = SimpleUploadedFile('scan.zip', self.build_zip({'x.txt': b'x'}), content_type='application/zip')
+                resp = APIClient().post('/api/predict/', {'file': upload}, format='multipart')
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(resp.json()['code'], 'no_dicom_files')
+        self.assertEqual(stub.request_count, 0)
+
+
+class PredictionJobTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        # No worker threads: jobs are processed explicitly by the test
+        self.queue = PredictionJobQueue(workers=0, maxsize=1)
+        patcher = mock.patch('api.views.get_job_queue', return_value=self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self):
+        upload = SimpleUploadedFile('scan.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+        return APIClient().post('/api/predict/jobs/', {'file': upload}, format='multipart')
+
+    def test_submit_then_poll_result(self):
+        resp = self.submit()
+        self.assertEqual(resp.status_code, 202)
+        job_id = resp.json()['job_id']
+        self.assertEqual(resp.json()['status'], 'queued')
+
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                job = process_job(job_id)
+
+        self.assertEqual(job.status, 'completed')
+        self.assertFalse(job.archive)
+        resp = APIClient().get(f'/api/predict/jobs/{job_id}/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['status'], 'completed')
+        self.assertEqual(resp.json()['result']['predicted_class'], 'Benign')
+        self.assertEqual(job.prediction.source, 'job')
+
+    def test_job_is_claimed_only_once(self):
+        job_id = self.submit().json()['job_id']
+        PredictionJob.objects.filter(pk=job_id).update(status='running')
+        self.assertIsNone(process_job(job_id))
+
+    def test_full_queue_rejects_submission(self):
+        self.assertEqual(self.submit().status_code, 202)
+        resp = self.submit()
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('Retry-After', resp)
+        self.assertEqual(PredictionJob.objects.count(), 1)
+
+    def test_restart_resumes_jobs_without_a_new_submit(self):
+        queued_id = self.submit().json()['job_id']
+        # Well inside the upstream timeout, but its worker stopped sending heartbeats
+        lost = timezone.now() - timedelta(minutes=1)
+        interrupted = PredictionJob.objects.create(original_filename='old.zip', status='running',
+                                                   started_at=lost, heartbeat_at=lost)
+        interrupted.archive.save(f'{interrupted.id}.zip', ContentFile(make_dicom_zip({'a.dcm': b'slice'})))
+
+        # A new process boots; nobody submits anything
+        restarted = PredictionJobQueue(workers=0, maxsize=5)
+        with mock.patch('api.jobs.get_job_queue', return_value=restarted):
+            start_job_queue()
+        recovered = [restarted._queue.get(timeout=5) for _ in range(2)]
+        self.assertEqual([str(job_id) for job_id in recovered], [str(queued_id), str(interrupted.pk)])
+
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                for job_id in recovered:
+                    process_job(job_id)
+        for job_id in recovered:
+            self.assertEqual(APIClient().get(f'/api/predict/jobs/{job_id}/').json()['status'], 'completed')
+
+    def test_heartbeat_reclaims_only_jobs_whose_worker_is_gone(self):
+        lost = timezone.now() - timedelta(minutes=1)
+        orphaned = PredictionJob.objects.create(original_filename='a.zip', status='running', started_at=lost, heartbeat_at=lost)
+        mine = PredictionJob.objects.create(original_filename='b.zip', status='running', started_at=lost, heartbeat_at=lost)
+        fresh = PredictionJob.objects.create(original_filename='c.zip', status='running', started_at=lost, heartbeat_at=timezone.now())
+
+        # Sweeping without a restart: one worker here is still on `mine`
+        queue = PredictionJobQueue(workers=0, maxsize=5)
+        queue._running.add(mine.pk)
+        self.assertEqual(queue.beat(), [orphaned.pk])
+        self.assertEqual(queue._queue.get(timeout=5), orphaned.pk)
+
+        statuses = dict(PredictionJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {orphaned.pk: 'queued', mine.pk: 'running', fresh.pk: 'running'})
+        mine.refresh_from_db()
+        self.assertGreater(mine.heartbeat_at, lost)
+        self.assertEqual(queue.beat(), [])
+
+    def test_upstream_failure_marks_job_failed(self):
+        job_id = self.submit().json()['job_id']
+        with override_settings(INFERENCE_BASE_URL='http://127.0.0.1:1', INFERENCE_RETRIES=0):
+            job = process_job(job_id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.upstream_status, 502)
+
+
+class PredictionHistoryTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+        self.user = create_doctor()
+        self.other = create_doctor('other@example.com', full_name='Other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make(self, user, count, start, **fields):
+        rows = [
+            Prediction(user=user, predicted_class=fields.get('predicted_class', 'Benign'),
+                       patient_id=fields.get('patient_id', 'p1'), created_at=start + timedelta(minutes=i))
+            for i in range(count)
+        ]
+        return Prediction.objects.bulk_create(rows)
+
+    def test_completed_prediction_is_recorded(self):
+        upload = SimpleUploadedFile('study.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                self.client.post('/api/predict/', {'file': upload}, format='multipart')
+
+        prediction = Prediction.objects.get()
+        self.assertEqual(prediction.user, self.user)
+        self.assertEqual(prediction.patient_id, 'stub-patient')
+        self.assertEqual(prediction.predicted_class, 'Benign')
+        self.assertTrue(prediction.archive_hash.startswith('dcm:'))
+        self.assertEqual(prediction.class_probabilities['Malignant'], 0.09)
+        self.assertIsNotNone(prediction.duration_ms)
+
+    def test_keyset_pagination_walks_every_row_once(self):
+        start = timezone.now() - timedelta(days=1)
+        self.make(self.user, 7, start)
+        # Identical timestamps must not be skipped or repeated across pages
+        Prediction.objects.bulk_create([Prediction(user=self.user, predicted_class='Benign', created_at=start) for _ in range(3)])
+        self.make(self.other, 2, start)
+
+        seen = []
+        url = '/api/predictions/?page_size=4'
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            seen.extend(row['id'] for row in resp.json()['results'])
+            url = resp.json()['next']
+        expected = list(Prediction.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_filters(self):
+        start = timezone.localtime().replace(hour=12) - timedelta(days=3)
+        self.make(self.user, 2, start, patient_id='p1')
+        self.make(self.user, 1, start, patient_id='p2', predicted_class='Malignant')
+        self.make(self.user, 1, timezone.now(), patient_id='p2')
+
+        def ids(query):
+            return len(self.client.get(f'/api/predictions/?{query}').json()['results'])
+
+        self.assertEqual(ids('patient_id=p2'), 2)
+        self.assertEqual(ids('predicted_class=Malignant'), 1)
+        self.assertEqual(ids(f'created_before={start.date().isoformat()}'), 3)
+        self.assertEqual(ids(f'created_after={timezone.localdate().isoformat()}'), 1)
+        self.assertEqual(self.client.get('/api/predictions/?created_after=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/predictions/?cursor=bogus').status_code, 400)
+        self.assertEqual(APIClient().get('/api/predictions/').status_code, 401)
+
+
+class PredictionProgressTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.queue = PredictionJobQueue(workers=0, maxsize=5)
+        patcher = mock.patch('api.views.get_job_queue', return_value=self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    async def next_event(stream):
+        """Read frames until the next named event, skipping keepalives"""
+        async for frame in stream:
+            lines = frame.decode('utf-8').strip().splitlines()
+            fields = dict(line.split(': ', 1) for line in lines if not line.startswith(':'))
+            if 'event' in fields:
+                return fields['event'], json.loads(fields['data'])
+
+    async def test_stream_reports_every_stage(self):
+        # A job already waiting puts ours second in line
+        await sync_to_async(self.queue.submit)(
+            SimpleUploadedFile('first.zip', make_dicom_zip({'a.dcm': b'first'})),
+        )
+        upload = SimpleUploadedFile('scan.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+        response = await AsyncClient().post('/api/predict/stream/', {'file': upload})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+
+        self.assertEqual((await self.next_event(stream))[0], 'upload_received')
+        stage, data = await self.next_event(stream)
+        self.assertEqual((stage, data['dicom_entries']), ('preflight_done', 1))
+        stage, data = await self.next_event(stream)
+        self.assertEqual((stage, data['position']), ('queued', 2))
+        job_id = data['job_id']
+
+        first = await PredictionJob.objects.exclude(pk=job_id).aget()
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                await sync_to_async(process_job)(first.pk)
+                stage, data = await self.next_event(stream)
+                self.assertEqual((stage, data['position']), ('queued', 1))
+
+                await PredictionJob.objects.filter(pk=job_id).aupdate(status='running', started_at=timezone.now())
+                get_progress_broker().publish(job_id)
+                self.assertEqual((await self.next_event(stream))[0], 'upstream_started')
+
+                await PredictionJob.objects.filter(pk=job_id).aupdate(status='queued')
+                await sync_to_async(process_job)(job_id)
+        stage, data = await self.next_event(stream)
+        self.assertEqual(stage, 'completed')
+        self.assertEqual(data['result']['predicted_class'], 'Benign')
+        self.assertIsNone(await self.next_event(stream))
+        self.assertEqual(get_progress_broker().subscriber_count(), 0)
+
+    async def test_rejected_archive_ends_with_error_event(self):
+        upload = SimpleUploadedFile('scan.zip', b'not a zip', content_type='application/zip')
+        response = await AsyncClient().post('/api/predict/stream/', {'file': upload})
+        frames = [frame async for frame in response.streaming_content]
+        self.assertIn(b'event: error', frames[-1])
+        self.assertIn(b'not_a_zip', frames[-1])
+        self.assertEqual(await PredictionJob.objects.acount(), 0)
+
+
+class AsyncPredictProxyTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+
+    async def post_archive(self, content):
+        upload = SimpleUploadedFile('study.zip', content, content_type='application/zip')
+        return await AsyncClient().post('/api/predict/async/', {'file': upload})
+
+    async def test_streams_archive_upstream(self):
+        content = make_dicom_zip({'a.dcm': os.urandom(300 * 1024)}, compression=zipfile.ZIP_STORED)
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url, INFERENCE_STREAM_CHUNK_SIZE=64 * 1024):
+                first = await self.post_archive(content)
+                second = await self.post_archive(content)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['predicted_class'], 'Benign')
+        self.assertGreater(first.json()['bytes_received'], len(content))
+        self.assertEqual((first['X-Prediction-Cache'], second['X-Prediction-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(stub.request_count, 1)
+        self.assertEqual(await Prediction.objects.acount(), 2)
+
+    async def test_upstream_errors_map_like_the_sync_view(self):
+        content = make_dicom_zip({'a.dcm': b'slice'})
+        with override_settings(INFERENCE_BASE_URL='http://127.0.0.1:1', INFERENCE_RETRIES=0):
+            resp = await self.post_archive(content)
+        self.assertEqual(resp.status_code, 502)
+
+        with StubInferenceServer(mode='failing') as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url, INFERENCE_BREAKER_FAILURE_THRESHOLD=1):
+                self.assertEqual((await self.post_archive(content)).status_code, 500)
+                resp = await self.post_archive(content)
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('Retry-After', resp)
+        self.assertEqual(stub.request_count, 1)
+
+        resp = await self.post_archive(b'not a zip')
+        self.assertEqual(resp.json()['code'], 'not_a_zip')
+
+
+class PredictionCacheTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+
+    def post_archive(self, content):
+        upload = SimpleUploadedFile('study.zip', content, content_type='application/zip')
+        return APIClient().post('/api/predict/', {'file': upload}, format='multipart')
+
+    def test_digest_ignores_member_names_and_compression(self):
+        original = make_dicom_zip({'p1/a.dcm': b'slice-a', 'p1/b.dcm': b'slice-b'})
+        rezipped = make_dicom_zip({'b.DCM': b'slice-b', 'other/a.dcm': b'slice-a'}, compression=zipfile.ZIP_STORED)
+        different = make_dicom_zip({'p1/a.dcm': b'slice-a', 'p1/b.dcm': b'slice-c'})
+
+        self.assertEqual(archive_digest(io.BytesIO(original)), archive_digest(io.BytesIO(rezipped)))
+        self.assertNotEqual(archive_digest(io.BytesIO(original)), archive_digest(io.BytesIO(different)))
+        self.assertTrue(archive_digest(io.BytesIO(b'not a zip')).startswith('raw:'))
+
+    def test_digest_covers_extensionless_dicom_members(self):
+        first = make_dicom_zip({'x.dcm': b'slice-a', 'IM0001': b'patient-1'})
+        second = make_dicom_zip({'x.dcm': b'slice-a', 'IM0001': b'patient-2'})
+        rezipped = make_dicom_zip({'scan/IM0002': b'patient-1'}, compression=zipfile.ZIP_STORED)
+
+        self.assertNotEqual(archive_digest(io.BytesIO(first)), archive_digest(io.BytesIO(second)))
+        self.assertEqual(
+            archive_digest(io.BytesIO(make_dicom_zip({'IM0001': b'patient-1'}))),
+            archive_digest(io.BytesIO(rezipped)),
+        )
+        self.assertTrue(archive_digest(io.BytesIO(rezipped)).startswith('dcm:'))
+
+    def test_repeated_upload_is_served_from_cache(self):
+        content = make_dicom_zip({'a.dcm': b'slice-a'})
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                first = self.post_archive(content)
+                second = self.post_archive(content)
+                with override_settings(INFERENCE_MODEL_VERSION='2'):
+                    upgraded = self.post_archive(content)
+
+        self.assertEqual(first['X-Prediction-Cache'], 'MISS')
+        self.assertEqual(second['X-Prediction-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(upgraded['X-Prediction-Cache'], 'MISS')
+        self.assertEqual(stub.request_count, 2)
+        stats = get_result_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_failed_predictions_are_not_cached(self):
+        content = make_dicom_zip({'a.dcm': b'slice-a'})
+        with StubInferenceServer(mode='failing') as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                self.post_archive(content)
+                resp = self.post_archive(content)
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(stub.request_count, 2)
+
+    def test_lru_and_ttl_bounds(self):
+        cache = PredictionResultCache(max_entries=2, max_bytes=1024, ttl=60)
+        cache.set('a', {'v': 1})
+        cache.set('b', {'v': 2})
+        cache.get('a')
+        cache.set('c', {'v': 3})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'v': 1})
+        cache.set('big', {'v': 'x' * 2048})
+        self.assertIsNone(cache.get('big'))
+
+        expired = PredictionResultCache(max_entries=2, max_bytes=1024, ttl=-1)
+        expired.set('a', {'v': 1})
+        self.assertIsNone(expired.get('a'))
+
+
+class VisualizationOffloadTests(TestCase):
+    png = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+    def setUp(self):
+        get_result_cache().clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def predict(self, path='/api/predict/'):
+        payload = dict(DEFAULT_PREDICTION, prediction_visualization=base64.b64encode(self.png).decode('ascii'))
+        upload = SimpleUploadedFile('study.zip', make_dicom_zip({'a.dcm': b'slice'}), content_type='application/zip')
+        with StubInferenceServer(payload=payload) as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                return APIClient().post(path, {'file': upload}, format='multipart')
+
+    def test_visualizations_are_served_by_url(self):
+        data = self.predict().json()
+        digest = hashlib.sha256(self.png).hexdigest()
+        self.assertIsNone(data['prediction_visualization'])
+        url = data['prediction_visualization_url']
+        self.assertTrue(url.startswith(f'http://testserver/api/visualizations/{digest}/?expires='))
+        self.assertNotIn('attention_visualization_url', data)
+
+        client = APIClient()
+        resp = client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'image/png')
+        self.assertEqual(resp['ETag'], f'"{digest}"')
+        self.assertTrue(resp['Cache-Control'].startswith('private, '))
+        self.assertIn('immutable', resp['Cache-Control'])
+        self.assertEqual(b''.join(resp.streaming_content), self.png)
+
+        cached = client.get(url, HTTP_IF_NONE_MATCH=f'"{digest}"')
+        self.assertEqual(cached.status_code, 304)
+        # A later response links to the same URL, so the browser's copy is reused
+        self.assertEqual(self.predict().json()['prediction_visualization_url'], url)
+
+    def test_visualizations_need_a_valid_signature(self):
+        url = self.predict().json()['prediction_visualization_url']
+        digest = hashlib.sha256(self.png).hexdigest()
+        client = APIClient()
+        self.assertEqual(client.get(f'/api/visualizations/{digest}/').status_code, 403)
+        self.assertEqual(client.get(f'/api/visualizations/{digest}/', HTTP_IF_NONE_MATCH=f'"{digest}"').status_code, 403)
+        self.assertEqual(client.get(url.replace(digest, '0' * 64)).status_code, 403)
+        self.assertEqual(client.get(url[:-1] + ('0' if url[-1] != '0' else '1')).status_code, 403)
+        with mock.patch('api.visualizations.time.time', return_value=time.time() + 30 * 24 * 60 * 60):
+            self.assertEqual(client.get(url).status_code, 403)
+
+    def test_inline_flag_restores_legacy_payload(self):
+        data = self.predict('/api/predict/?inline_visualizations=1').json()
+        self.assertEqual(base64.b64decode(data['prediction_visualization']), self.png)
+        self.assertNotIn('prediction_visualization_url', data)
+
+        with override_settings(PREDICTION_INLINE_VISUALIZATIONS=True):
+            # Served from the result cache, which holds the offloaded form
+            data = self.predict().json()
+        self.assertEqual(base64.b64decode(data['prediction_visualization']), self.png)
+
+
+class ChunkedUploadTests(TestCase):
+    chunk_size = 256 * 1024
+
+    def setUp(self):
+        get_result_cache().clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.queue = PredictionJobQueue(workers=0, maxsize=2)
+        patcher = mock.patch('api.uploads.get_job_queue', return_value=self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.archive = make_dicom_zip({'a.dcm': os.urandom(300 * 1024), 'b.dcm': os.urandom(300 * 1024)},
+                                      compression=zipfile.ZIP_STORED)
+
+    def create(self):
+        resp = self.client.post('/api/uploads/', {
+            'filename': 'study.zip', 'total_size': len(self.archive), 'chunk_size': self.chunk_size,
+        }, format='json')
+        self.assertEqual(resp.status_code, 201)
+        return resp.json()
+
+    def put_chunk(self, upload_id, index, body=None, checksum=None):
+        if body is None:
+            body = self.archive[index * self.chunk_size:(index + 1) * self.chunk_size]
+        return self.client.put(
+            f'/api/uploads/{upload_id}/chunks/{index}/', body, content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(body).hexdigest(),
+        )
+
+    def test_out_of_order_chunks_resume_and_finalize(self):
+        session = self.create()
+        upload_id = session['upload_id']
+        self.assertEqual(session['total_chunks'], 3)
+        self.assertEqual(session['missing_ranges'], [[0, 2]])
+
+        self.assertEqual(self.put_chunk(upload_id, 2).status_code, 200)
+        resp = self.client.get(f'/api/uploads/{upload_id}/')
+        self.assertEqual(resp.json()['missing_ranges'], [[0, 1]])
+
+        resp = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.json()['missing_ranges'], [[0, 1]])
+
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 200)
+        self.assertEqual(self.put_chunk(upload_id, 1).status_code, 200)
+        self.assertEqual(self.put_chunk(upload_id, 1).status_code, 200)  # retried chunk is idempotent
+
+        resp = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(resp.status_code, 202)
+        job = PredictionJob.objects.get(pk=resp.json()['job_id'])
+        with open(job.archive.path, 'rb') as f:
+            self.assertEqual(f.read(), self.archive)
+        self.assertFalse(os.path.exists(session_path(UploadSession.objects.get(pk=upload_id))))
+
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                job = process_job(job.pk)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/finalize/').status_code, 409)
+
+    def test_bad_chunks_are_rejected(self):
+        upload_id = self.create()['upload_id']
+        resp = self.put_chunk(upload_id, 0, checksum='0' * 64)
+        self.assertEqual(resp.status_code, 400)
+        resp = self.put_chunk(upload_id, 0, body=b'short')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.put_chunk(upload_id, 3).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').json()['missing_ranges'], [[0, 2]])
+
+    def test_bad_retry_keeps_an_accepted_chunk(self):
+        upload_id = self.create()['upload_id']
+        for index in range(3):
+            self.assertEqual(self.put_chunk(upload_id, index).status_code, 200)
+        good = self.archive[:self.chunk_size]
+        self.assertEqual(self.put_chunk(upload_id, 0, body=good[:1000], checksum=hashlib.sha256(good).hexdigest()).status_code, 400)
+        self.assertEqual(self.put_chunk(upload_id, 0, body=bytes(len(good)), checksum=hashlib.sha256(good).hexdigest()).status_code, 400)
+
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').json()['missing_ranges'], [])
+        with open(session_path(UploadSession.objects.get(pk=upload_id)), 'rb') as f:
+            self.assertEqual(f.read(), self.archive)
+
+    def test_racing_finalizes_and_late_chunks_get_409(self):
+        upload_id = self.create()['upload_id']
+        for index in range(3):
+            self.assertEqual(self.put_chunk(upload_id, index).status_code, 200)
+
+        with mock.patch.object(self.queue, 'submit_file', side_effect=QueueFull):
+            self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/finalize/').status_code, 503)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, 'open')
+
+        # Three requests that all read the session while it was still open
+        first, second, late = (UploadSession.objects.get(pk=upload_id) for _ in range(3))
+        finalize_session(first)
+        with self.assertRaises(UploadError) as caught:
+            finalize_session(second)
+        self.assertEqual(caught.exception.status_code, 409)
+        self.assertEqual(PredictionJob.objects.count(), 1)
+
+        body = self.archive[:self.chunk_size]
+        with self.assertRaises(UploadError) as caught:
+            write_chunk(late, 0, io.BytesIO(body), hashlib.sha256(body).hexdigest())
+        self.assertEqual(caught.exception.status_code, 409)
+
+    def test_stale_sessions_are_garbage_collected(self):
+        upload_id = self.create()['upload_id']
+        session = UploadSession.objects.get(pk=upload_id)
+        path = session_path(session)
+        self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(cleanup_stale_sessions(max_age=3600), 0)
+        self.assertEqual(cleanup_stale_sessions(max_age=-1), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(UploadSession.objects.filter(pk=upload_id).exists())
+
+
+class BatchPredictionTests(TestCase):
+    def setUp(self):
+        get_result_cache().clear()
+        self.user = create_doctor()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, data, query=''):
+        with StubInferenceServer() as stub:
+            with override_settings(INFERENCE_BASE_URL=stub.base_url):
+                resp = self.client.post(f'/api/predict/batch/{query}', data, format='multipart')
+                body = b''.join(resp.streaming_content).decode() if resp.status_code == 200 else None
+        return resp, body
+
+    def test_archive_of_patient_folders(self):
+        content = make_dicom_zip({
+            'batch/P002/a.dcm': b'two-a',
+            'batch/P001/a.dcm': b'one-a',
+            'batch/P001/series/b.dcm': b'one-b',
+            'batch/P003/notes.txt': b'no slices here',
+        })
+        resp, body = self.post({'file': SimpleUploadedFile('batch.zip', content)})
+
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in body.splitlines()]
+        rows = {row['patient_id']: row for row in lines[:-1]}
+        self.assertEqual(set(rows), {'P001', 'P002', 'P003'})
+        self.assertEqual(rows['P001']['status'], 'completed')
+        self.assertEqual(rows['P001']['predicted_class'], 'Benign')
+        self.assertEqual(rows['P003']['status'], 'failed')
+        self.assertEqual(lines[-1], {'summary': {'total': 3, 'completed': 2, 'failed': 1}})
+        self.assertEqual(set(Prediction.objects.filter(user=self.user).values_list('source', flat=True)), {'sync'})
+        self.assertEqual(Prediction.objects.count(), 2)
+
+    def test_manifest_with_csv_export(self):
+        manifest = json.dumps([{'patient_id': 'A', 'file': 'a.zip'}, {'patient_id': 'B', 'file': 'b.zip'}])
+        files = [
+            SimpleUploadedFile('a.zip', make_dicom_zip({'a.dcm': b'a'})),
+            SimpleUploadedFile('b.zip', make_dicom_zip({'b.dcm': b'b'})),
+        ]
+        resp, body = self.post({'manifest': manifest, 'files': files}, query='?export=csv')
+
+        self.assertEqual(resp['Content-Type'], 'text/csv')
+        self.assertIn('attachment', resp['Content-Disposition'])
+        lines = body.splitlines()
+        self.assertTrue(lines[0].startswith('patient_id,status,predicted_class'))
+        self.assertEqual(sorted(line.split(',')[:2] for line in lines[1:]), [['A', 'completed'], ['B', 'completed']])
+
+    def test_rejected_batches(self):
+        resp, _ = self.post({'manifest': json.dumps([{'patient_id': 'A', 'file': 'missing.zip'}])})
+        self.assertEqual(resp.status_code, 400)
+        resp, _ = self.post({'file': SimpleUploadedFile('flat.zip', make_dicom_zip({'a.dcm': b'a'}))})
+        self.assertEqual(resp.status_code, 400)
+
+        content = make_dicom_zip({f'P{i}/a.dcm': b'slice' for i in range(3)})
+        with override_settings(BATCH_PREDICT_MAX_PATIENTS=2):
+            resp, _ = self.post({'file': SimpleUploadedFile('batch.zip', content)})
+        self.assertEqual(resp.status_code, 413)
+        self.assertEqual(APIClient().post('/api/predict/batch/').status_code, 401)
+
+    def test_patients_are_extracted_only_as_they_run(self):
+        content = make_dicom_zip({f'P{i}/a.dcm': b'slice' for i in range(4)})
+        with mock.patch('api.batch.tempfile.SpooledTemporaryFile', wraps=tempfile.SpooledTemporaryFile) as spool:
+            patients = split_patient_folders(io.BytesIO(content))
+            self.assertEqual(spool.call_count, 0)
+            with StubInferenceServer() as stub, override_settings(INFERENCE_BASE_URL=stub.base_url):
+                rows = run_batch(patients, 'user:test', concurrency=1)
+                next(rows)
+                # The one running patient, and at most the next one starting
+                self.assertLessEqual(spool.call_count, 2)
+                self.assertEqual(len(list(rows)), 3)
+        self.assertEqual(spool.call_count, 4)
+        self.assertTrue(all(patient.file.closed for patient in patients))
+
+    @override_settings(PREDICT_ADMISSION_MAX_PER_USER=2, BATCH_PREDICT_CONCURRENCY=4)
+    def test_every_patient_takes_its_own_admission_slot(self):
+        content = make_dicom_zip({f'P{i}/a.dcm': b'slice' for i in range(4)})
+        controller = get_admission_controller()
+        with StubInferenceServer(latency=0.1) as stub, override_settings(INFERENCE_BASE_URL=stub.base_url):
+            resp = self.client.post('/api/predict/batch/', {'file': SimpleUploadedFile('batch.zip', content)}, format='multipart')
+            body = b''.join(resp.streaming_content).decode()
+        self.assertEqual(json.loads(body.splitlines()[-1])['summary']['completed'], 4)
+        # Never more predictions upstream than the user may have in flight
+        self.assertLessEqual(stub.peak_active, 2)
+        self.assertEqual((controller.stats()['in_flight'], controller.stats()['admitted']), (0, 4))
+
+        # The user's other predictions count against the same cap
+        user_key = f'user:{self.user.pk}'
+        with controller.slot(user_key), controller.slot(user_key):
+            resp, body = self.post({'file': SimpleUploadedFile('batch.zip', content)})
+        rows = [json.loads(line) for line in body.splitlines()[:-1]]
+        self.assertEqual({(row['status'], row['reason']) for row in rows}, {('failed', 'per_user_limit')})
+        self.assertEqual(controller.stats()['in_flight'], 0)
+
+    @override_settings(BATCH_PREDICT_CONCURRENCY=1)
+    def test_closing_the_stream_drops_patients_not_yet_started(self):
+        content = make_dicom_zip({f'P{i}/a.dcm': b'slice' for i in range(4)})
+        with StubInferenceServer(latency=0.05) as stub, override_settings(INFERENCE_BASE_URL=stub.base_url):
+            resp = self.client.post('/api/predict/batch/', {'file': SimpleUploadedFile('batch.zip', content)}, format='multipart')
+            next(iter(resp.streaming_content))
+            resp.close()
+            self.assertLess(stub.request_count, 4)
+        self.assertEqual(get_admission_controller().stats()['in_flight'], 0)
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = create_doctor()
+        self.header = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def authenticate(self):
+        request = RequestFactory().get('/api/user/me/', HTTP_AUTHORIZATION=self.header)
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_repeat_requests_skip_the_user_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.email, 'doc@example.com')
+        # Callers get their own copy, so mutating request.user never leaks into the cache
+        user.full_name = 'Changed'
+        self.assertEqual(self.authenticate().full_name, 'Doc')
+
+        resp = APIClient().get('/api/user/me/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_user_changes_invalidate_the_cache(self):
+        self.authenticate()
+        self.user.reject(reason='Incomplete', send_email=False)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().account_status, 'rejected')
+        self.user.approve(send_email=False)
+        self.assertEqual(self.authenticate().account_status, 'approved')
+
+        self.user.set_password('new-pass-123')
+        self.user.save()
+        self.assertTrue(self.authenticate().check_password('new-pass-123'))
+
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_local_stamps_pick_up_other_workers_changes_when_the_copy_expires(self):
+        self.authenticate()
+        # Saved by another process: no signal reaches this one
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertNumQueries(0):
+            self.authenticate()
+        expired = time.monotonic() + get_user_cache().local_ttl + 1
+        with mock.patch('api.authentication.time.monotonic', return_value=expired):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+    def test_stale_read_during_the_transaction_is_dropped_on_commit(self):
+        stale = self.authenticate()
+        cache = get_user_cache()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request missed the cache and re-read the still-committed row
+            cache.set(str(self.user.pk), cache.version(str(self.user.pk)), stale)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_shared_cache_carries_stamps_across_processes(self):
+        with override_settings(AUTH_USER_CACHE_ALIAS='default'):
+            first, second = UserAuthCache(), UserAuthCache()
+            first.set('7', first.version('7'), self.user)
+            with self.assertNumQueries(0):
+                self.assertEqual(second.get('7', second.version('7')).pk, self.user.pk)
+            second.invalidate('7')
+            self.assertIsNone(first.get('7', first.version('7')))
+
+
+@override_settings(TOKEN_REVOCATION_SYNC_INTERVAL=60)
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = create_doctor()
+        self.client = APIClient()
+
+    def test_rotated_and_logged_out_tokens_are_rejected(self):
+        refresh = self.client.post('/api/login/', {'email': 'doc@example.com', 'password': 'pass12345'}).json()['refresh']
+        resp = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(resp.status_code, 200)
+        rotated = resp.json()['refresh']
+
+        with self.assertNumQueries(0):
+            resp = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(self.client.post('/api/token/verify/', {'token': refresh}).status_code, 400)
+
+        self.assertEqual(self.client.post('/api/token/logout/', {'refresh': rotated}).status_code, 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': rotated}).status_code, 401)
+
+    def test_refresh_rotated_by_another_worker_cannot_be_replayed(self):
+        refresh = self.client.post('/api/login/', {'email': 'doc@example.com', 'password': 'pass12345'}).json()['refresh']
+        get_revocation_index().sync()
+        # Rotated by another worker after this process's last sync
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=RefreshToken(refresh)['jti']))
+
+        resp = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(self.client.post('/api/token/verify/', {'token': refresh}).status_code, 400)
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+
+    def test_concurrent_refreshes_rotate_a_token_once(self):
+        refresh = RefreshToken.for_user(self.user)
+        # Both requests passed the blacklist check before either rotated the token
+        first, second = IndexedRefreshToken(str(refresh)), IndexedRefreshToken(str(refresh))
+        first.blacklist()
+        with self.assertRaises(TokenError):
+            second.blacklist()
+
+    def test_index_picks_up_other_processes_revocations(self):
+        index = RevocationIndex(sync_interval=0)
+        token = RefreshToken.for_user(self.user)
+        self.assertFalse(index.is_revoked(token['jti']))
+        # Blacklisted directly in the database, as another worker would
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        self.assertTrue(index.is_revoked(token['jti']))
+
+    def test_index_drops_expired_buckets(self):
+        index = RevocationIndex(bucket_seconds=60, sync_interval=3600)
+        index.sync()
+        now = time.time()
+        index.add('soon', now + 30)
+        index.add('later', now + 600)
+        index.add('expired', now - 1)
+        self.assertEqual(len(index), 2)
+        with mock.patch('api.revocation.time.time', return_value=now + 120):
+            self.assertFalse(index.is_revoked('soon'))
+            self.assertTrue(index.is_revoked('later'))
+            self.assertEqual(len(index), 1)
+
+    def test_expired_tokens_are_pruned_in_batches(self):
+        past = timezone.now() - timedelta(days=2)
+        for i in range(5):
+            token = OutstandingToken.objects.create(user=self.user, jti=f'old-{i}', token='x', expires_at=past)
+            if i % 2:
+                BlacklistedToken.objects.create(token=token)
+        RefreshToken.for_user(self.user)
+
+        self.assertEqual(prune_expired_tokens(batch_size=2), 5)
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+        out = io.StringIO()
+        call_command('prune_tokens', stdout=out)
+        self.assertIn('Removed 0 expired token(s)', out.getvalue())
+
+    def test_prune_loop_survives_database_errors(self):
+        out = io.StringIO()
+        with mock.patch('api.management.commands.prune_tokens.prune_expired_tokens', side_effect=[OperationalError('locked'), 3]), \
+                mock.patch('api.management.commands.prune_tokens.time.sleep', side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt), self.assertLogs('api.management.commands.prune_tokens', 'ERROR'):
+                call_command('prune_tokens', '--loop', stdout=out)
+        self.assertIn('Removed 3 expired token(s)', out.getvalue())
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = create_doctor(medical_license_number='LIC-1', specialization='radiologist')
+        self.client = APIClient()
+
+    def login(self, email='doc@example.com', password='pass12345'):
+        return self.client.post('/api/login/', {'email': email, 'password': password})
+
+    def test_login_reads_the_user_once_and_writes_one_token(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.login()
+        self.assertEqual(resp.status_code, 200)
+        statements = [q['sql'].split()[0] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(statements, ['SELECT', 'INSERT'])
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+
+        payload = resp.json()['user']
+        self.assertEqual(payload['account_status'], 'approved')
+        self.assertEqual(payload['medical_license_number'], 'LIC-1')
+        # Login seeded the user and profile caches under the same stamp
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {resp.json()['access']}")
+        with self.assertNumQueries(0), mock.patch('api.profiles.build_profile_payload', side_effect=AssertionError('re-rendered')):
+            self.assertEqual(self.client.get('/api/user/me/').json(), payload)
+
+    def test_unapproved_users_get_no_tokens(self):
+        self.user.account_status = 'pending'
+        self.user.save()
+        resp = self.login()
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('pending approval', str(resp.json()))
+        self.assertEqual(self.login(password='wrong-pass').status_code, 401)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+    def test_profile_payload_is_cached_until_the_user_changes(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(self.client.get('/api/user/me/').json()['full_name'], 'Doc')
+        with self.assertNumQueries(0):
+            self.client.get('/api/user/me/')
+
+        self.user.full_name = 'Dr Doc'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user/me/').json()['full_name'], 'Dr Doc')
+
+
+class ProfileConditionalGetTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = create_doctor()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_revalidation_is_answered_without_rendering(self):
+        resp = self.client.get('/api/user/me/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', resp['Vary'])
+        etag, last_modified = resp['ETag'], resp['Last-Modified']
+
+        with mock.patch('api.profiles.build_profile_payload', side_effect=AssertionError('re-rendered')):
+            with self.assertNumQueries(0):
+                resp = self.client.get('/api/user/me/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.content, b'')
+            self.assertEqual(resp['ETag'], etag)
+            resp = self.client.get('/api/user/me/', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(resp.status_code, 304)
+
+    def test_profile_and_approval_updates_change_the_etag(self):
+        etag = self.client.get('/api/user/me/')['ETag']
+        self.user.reject(reason='Incomplete', send_email=False)
+        resp = self.client.get('/api/user/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['account_status'], 'rejected')
+        self.assertNotEqual(resp['ETag'], etag)
+
+        etag = resp['ETag']
+        self.user.phone_number = '555-0100'
+        self.user.save(update_fields=['phone_number'])
+        self.user.refresh_from_db()
+        resp = self.client.get('/api/user/me/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.json()['phone_number'], '555-0100')
+        self.assertEqual(resp['Last-Modified'], http_date(self.user.updated_at.timestamp()))
+
+    def test_logins_and_empty_saves_leave_last_modified_alone(self):
+        resp = self.client.get('/api/user/me/')
+        updated_at = get_user_model().objects.get(pk=self.user.pk).updated_at
+
+        with self.assertNumQueries(0):
+            self.user.save(update_fields=[])
+        update_last_login(None, self.user)
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).updated_at, updated_at)
+        cached = self.client.get('/api/user/me/', HTTP_IF_MODIFIED_SINCE=resp['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.admin = create_admin()
+        self.user = create_doctor(account_status='pending')
+
+    def test_approval_queues_instead_of_sending(self):
+        self.user.approve(approved_by_user=self.admin)
+        self.assertEqual(len(mail.outbox), 0)
+        message = EmailOutbox.objects.get()
+        self.assertEqual((message.kind, message.status, message.to_email), ('account_approved', 'pending', 'doc@example.com'))
+
+        # The same state change never queues a second message
+        enqueue_account_email('account_approved', self.user, actor=self.admin)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+        out = io.StringIO()
+        call_command('send_emails', stdout=out)
+        self.assertIn('Sent 1 email(s)', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Approved', mail.outbox[0].subject)
+        self.assertTrue(mail.outbox[0].extra_headers['Message-ID'].endswith('@lungvision>'))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('sent', 1))
+        self.assertEqual(process_outbox(), {'sent': 0, 'retrying': 0, 'dead': 0})
+
+    def test_failed_enqueue_rolls_back_the_state_change(self):
+        with mock.patch('api.outbox.EmailOutbox.objects.bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.user.reject(reason='Incomplete')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.account_status, 'pending')
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_dead_letter(self):
+        self.user.reject(reason='Incomplete', rejected_by_user=self.admin)
+        message = EmailOutbox.objects.get()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('refused')):
+            self.assertEqual(process_outbox(), {'sent': 0, 'retrying': 1, 'dead': 0})
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts, message.last_error), ('pending', 1, 'refused'))
+            self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=20))
+            # Not due yet
+            self.assertEqual(process_outbox(), {'sent': 0, 'retrying': 0, 'dead': 0})
+
+            EmailOutbox.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(process_outbox(), {'sent': 0, 'retrying': 0, 'dead': 1})
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'dead')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_retry_now_leaves_claimed_messages_alone(self):
+        for state in ('dead', 'sending', 'sent'):
+            EmailOutbox.objects.create(kind='account_approved', user=self.user, to_email='doc@example.com',
+                                       idempotency_key=state, status=state, attempts=5)
+        client = APIClient()
+        client.force_login(self.admin)
+        ids = [str(pk) for pk in EmailOutbox.objects.values_list('pk', flat=True)]
+        client.post('/admin/api/emailoutbox/', {'action': 'retry_now', '_selected_action': ids}, follow=True)
+        self.assertEqual(
+            dict(EmailOutbox.objects.values_list('idempotency_key', 'status')),
+            {'dead': 'pending', 'sending': 'sending', 'sent': 'sent'},
+        )
+
+    def test_worker_loop_survives_database_errors(self):
+        empty = {'sent': 0, 'retrying': 0, 'dead': 0}
+        outcomes = [OperationalError('database is locked'), dict(empty, sent=1), empty]
+        with mock.patch('api.management.commands.send_emails.process_outbox', side_effect=outcomes) as passes, \
+                mock.patch('api.management.commands.send_emails.time.sleep', side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt), self.assertLogs('api.management.commands.send_emails', 'ERROR'):
+                call_command('send_emails', '--loop', stdout=io.StringIO())
+        self.assertEqual(passes.call_count, 3)
+
+        with mock.patch('api.management.commands.send_emails.process_outbox', side_effect=OperationalError('locked')):
+            with self.assertRaises(OperationalError):
+                call_command('send_emails', stdout=io.StringIO())
+
+
+class BulkEmailTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.users = [
+            User(pk=i, email=f'user{i}@example.com', full_name=f'User {i}', role='doctor') for i in range(1, 6)
+        ]
+
+    @override_settings(EMAIL_BULK_CHUNK_SIZE=2)
+    def test_reuses_one_smtp_connection_per_chunk(self):
+        with StubSMTPServer() as stub, override_settings(**stub.email_settings()):
+            results = EmailService.send_bulk_approval_emails(self.users)
+        self.assertEqual((results['success_count'], results['failure_count']), (5, 0))
+        self.assertEqual(stub.message_count, 5)
+        self.assertEqual(stub.connection_count, 3)
+
+    def test_tracks_failures_per_message(self):
+        with StubSMTPServer(reject={'user2@example.com'}) as stub, override_settings(**stub.email_settings()):
+            results = EmailService.send_bulk_rejection_emails(self.users, rejection_reason='Incomplete')
+        self.assertEqual((results['success_count'], results['failure_count']), (4, 1))
+        self.assertEqual(results['failed_emails'], ['user2@example.com'])
+        self.assertIn('user2@example.com', results['errors'])
+        # A refused recipient doesn't cost the rest of the chunk its session
+        self.assertEqual(stub.connection_count, 1)
+        self.assertNotIn('user2@example.com', stub.recipients)
+
+    def test_render_failures_are_reported(self):
+        with mock.patch('api.email_service.EmailShells.render', side_effect=[ValueError('bad template')] + [('<p>Hi</p>', 'Hi')] * 4):
+            results = EmailService.send_bulk_approval_emails(self.users)
+        self.assertEqual((results['success_count'], results['failure_count']), (4, 1))
+        self.assertEqual(results['errors'], {'user1@example.com': 'bad template'})
+        self.assertEqual(len(mail.outbox), 4)
+
+
+class EmailTemplateTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User(pk=100, email='admin@example.com', full_name='Admin <Ops>')
+        now = timezone.now()
+        self.users = [
+            User(pk=1, email='doc@example.com', full_name='Dr. O\'Brien', role='doctor', specialization='radiologist',
+                 hospital_affiliation='St. Mary & Co', country='IE', approved_date=now),
+            User(pk=2, email='res@example.com', full_name='Res <b>', role='researcher', research_institution='MIT',
+                 affiliation_type='academic', country='US', approved_date=now),
+            User(pk=3, email='doc2@example.com', full_name='Dr. Two', role='doctor', specialization='oncologist',
+                 hospital_affiliation='General', country='PK', approved_date=now),
+        ]
+
+    def test_templates_compile_once_per_process(self):
+        self.assertIs(get_email_template('account_approved'), get_email_template('account_approved'))
+
+    def test_render_matches_render_to_string(self):
+        from django.template.loader import render_to_string
+        context = {'user': self.users[0], 'approved_by': self.admin, 'approved_on': 'May 01, 2025 at 9:00 AM', 'login_url': 'http://x'}
+        self.assertEqual(
+            get_email_template('account_approved').render(context),
+            (render_to_string('emails/account_approved.html', context), render_to_string('emails/account_approved.txt', context)),
+        )
+
+    def test_shells_render_the_same_emails(self):
+        for name, shared in (
+            ('account_approved', {'approved_by': self.admin, 'login_url': 'http://x'}),
+            ('account_rejected', {'rejected_by': None, 'rejection_reason': 'Missing <license>'}),
+        ):
+            template = get_email_template(name)
+            date_key = 'approved_on' if name == 'account_approved' else 'reviewed_on'
+            shells = EmailShells(template, per_recipient=(date_key,))
+            for user in self.users * 2:
+                context = dict(shared, user=user, **{date_key: EmailService.format_timestamp(user.approved_date)})
+                self.assertEqual(shells.render(context), template.render(context))
+            # One shell per role
+            self.assertEqual(len(shells._shells), 2)
+
+    def test_bulk_send_reuses_shells_across_approval_dates(self):
+        now = timezone.now()
+        for i, user in enumerate(self.users):
+            user.approved_date = now - timedelta(days=i) if i else None
+        with mock.patch.object(EmailShells, '_build', autospec=True, side_effect=EmailShells._build) as build:
+            results = EmailService.send_bulk_approval_emails(self.users * 4)
+        self.assertEqual(results['success_count'], 12)
+        self.assertEqual(build.call_count, 2)
+        self.assertIn(EmailService.format_timestamp(now - timedelta(days=2)), mail.outbox[2].body)
+        self.assertIn(EmailService.format_timestamp(now - timedelta(days=1)), mail.outbox[1].alternatives[0][0])
+
+    def test_shells_fall_back_when_placeholders_cannot_reproduce_the_email(self):
+        template = get_email_template('account_approved')
+        shells = EmailShells(template)
+        context = {'user': self.users[0], 'approved_by': None, 'approved_on': 'May 01, 2025 at 9:00 AM', 'login_url': 'http://x'}
+        with mock.patch.object(EmailShells, '_fill', return_value=('', '')):
+            shells.render(context)
+        self.assertEqual(list(shells._shells.values()), [None])
+        self.assertEqual(shells.render(dict(context, user=self.users[2])), template.render(dict(context, user=self.users[2])))
+
+
+class BulkTransitionTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = create_admin()
+        self.pending = [
+            User.objects.create_user(f'user{i}@example.com', 'pass12345', full_name=f'User {i}') for i in range(5)
+        ]
+        self.rejected = User.objects.create_user('rej@example.com', 'pass12345', full_name='Rej', account_status='rejected')
+        self.approved = User.objects.create_user('ok@example.com', 'pass12345', full_name='Ok', account_status='approved')
+
+    def test_approves_in_one_update(self):
+        User = get_user_model()
+        queryset = User.objects.exclude(pk=self.admin.pk)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            user_ids = bulk_transition(queryset, 'approved', actor=self.admin)
+        self.assertCountEqual(user_ids, [u.pk for u in self.pending] + [self.rejected.pk])
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "api_user"')]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(User.objects.filter(account_status='approved', approved_by=self.admin).count(), 6)
+        events = AccountStatusEvent.objects.filter(to_status='approved')
+        self.assertEqual(events.count(), 6)
+        self.assertEqual(events.get(user=self.rejected).from_status, 'rejected')
+        self.assertEqual(EmailOutbox.objects.filter(kind='account_approved').count(), 6)
+        # Already approved users are left alone
+        self.approved.refresh_from_db()
+        self.assertIsNone(self.approved.approved_by)
+
+    def test_invalidates_cached_users(self):
+        user = self.pending[0]
+        token = AccessToken.for_user(user)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(CachedJWTAuthentication().authenticate(request)[0].account_status, 'pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_transition(get_user_model().objects.filter(pk=user.pk), 'rejected', actor=self.admin, reason='Incomplete')
+        cached = CachedJWTAuthentication().authenticate(request)[0]
+        self.assertEqual((cached.account_status, cached.rejection_reason), ('rejected', 'Incomplete'))
+
+    def test_admin_actions(self):
+        client = APIClient()
+        client.force_login(self.admin)
+        ids = [str(u.pk) for u in self.pending[:3]]
+        resp = client.post('/admin/api/user/', {'action': 'reject_users', '_selected_action': ids}, follow=True)
+        self.assertContains(resp, '3 user(s) have been rejected. 3 rejection email(s) queued for delivery.')
+        self.assertEqual(EmailOutbox.objects.filter(kind='account_rejected').count(), 3)
+
+        resp = client.post('/admin/api/user/', {'action': 'mark_pending', '_selected_action': ids}, follow=True)
+        self.assertContains(resp, '3 user(s) marked as pending approval.')
+        self.assertEqual(AccountStatusEvent.objects.filter(to_status='pending', actor=self.admin).count(), 3)
+        self.assertFalse(get_user_model().objects.filter(pk__in=ids).exclude(account_status='pending').exists())
+
+    def test_single_approval_is_audited(self):
+        self.rejected.approve(approved_by_user=self.admin)
+        event = AccountStatusEvent.objects.get()
+        self.assertEqual((event.from_status, event.to_status, event.actor), ('rejected', 'approved', self.admin))
+
+
+class DirtyFieldTests(TestCase):
+    def setUp(self):
+        self.admin = create_admin()
+        create_doctor(account_status='pending', country='PK')
+        self.user = get_user_model().objects.get(email='doc@example.com')
+
+    def test_saves_only_changed_columns(self):
+        self.user.full_name = 'Dr. Doc'
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        # The rest keep the search index in step with full_name
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "api_user"')]
+        self.assertEqual(len(updates), 1)
+        sql = updates[0]
+        self.assertIn('"full_name"', sql)
+        self.assertIn('"updated_at"', sql)
+        self.assertNotIn('"country"', sql)
+        self.assertNotIn('"password"', sql)
+
+        # Nothing changed since that save
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        self.assertEqual(len(queries), 0)
+
+        self.user.country = 'IE'
+        self.assertEqual(self.user.get_dirty_fields(), {'country': 'PK'})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.get_dirty_fields(), {})
+
+    def test_deferred_fields_are_tracked_once_assigned(self):
+        user = get_user_model().objects.only('email').get(pk=self.user.pk)
+        user.country = 'IE'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.country, self.user.full_name), ('IE', 'Doc'))
+
+    def test_admin_status_change_without_reloading_the_user(self):
+        from django.contrib.admin.sites import site
+        from .admin import UserAdmin
+
+        request = RequestFactory().post('/admin/')
+        request.user = self.admin
+        self.user.account_status = 'approved'
+        with CaptureQueriesContext(connection) as queries:
+            UserAdmin(get_user_model(), site).save_model(request, self.user, None, change=True)
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'FROM "api_user"' in q['sql']])
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE "api_user"'))
+        self.assertNotIn('"full_name"', update)
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.account_status, self.user.approved_by), ('approved', self.admin))
+        event = AccountStatusEvent.objects.get()
+        self.assertEqual((event.from_status, event.to_status), ('pending', 'approved'))
+
+
+class UserCountsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = create_admin()
+        start = timezone.now() - timedelta(days=10)
+        self.doctors = [
+            User.objects.create_user(f'doc{i}@example.com', 'pass12345', full_name=f'Doc {i}', role='doctor',
+                                     date_joined=start + timedelta(days=i))
+            for i in range(3)
+        ]
+        self.researcher = User.objects.create_user('res@example.com', 'pass12345', full_name='Res', role='researcher',
+                                                   date_joined=start + timedelta(days=5))
+
+    def assertCountsMatch(self):
+        counts = get_user_counts()
+        rebuild_user_counts()
+        self.assertEqual(counts, get_user_counts())
+        return counts
+
+    def test_counts_follow_user_changes(self):
+        counts = self.assertCountsMatch()
+        self.assertEqual(counts['by_status'], {'pending': 4, 'approved': 1, 'rejected': 0})
+        self.assertEqual(counts['by_role']['doctor'], {'pending': 3, 'approved': 0, 'rejected': 0})
+
+        self.doctors[0].approve(approved_by_user=self.admin)
+        self.doctors[1].reject(reason='Incomplete')
+        researcher = get_user_model().objects.get(pk=self.researcher.pk)
+        researcher.role = 'doctor'
+        researcher.save()
+        self.doctors[2].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_transition(get_user_model().objects.filter(pk=self.doctors[1].pk), 'approved', actor=self.admin)
+
+        counts = self.assertCountsMatch()
+        self.assertEqual(counts['by_status'], {'pending': 1, 'approved': 3, 'rejected': 0})
+        self.assertEqual(counts['by_role']['doctor'], {'pending': 1, 'approved': 2, 'rejected': 0})
+
+    def test_pending_queue(self):
+        client = APIClient()
+        client.force_authenticate(self.doctors[0])
+        self.assertEqual(client.get('/api/admin/users/pending/').status_code, 403)
+
+        client.force_authenticate(self.admin)
+        resp = client.get('/api/admin/users/pending/', {'page_size': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([u['email'] for u in resp.data['results']], ['doc0@example.com', 'doc1@example.com'])
+        self.assertEqual(resp.data['counts'], {'pending': 4, 'by_role': {'doctor': 3, 'researcher': 1, 'admin': 0}})
+        resp = client.get(resp.data['next'])
+        self.assertEqual([u['email'] for u in resp.data['results']], ['doc2@example.com', 'res@example.com'])
+        self.assertIsNone(resp.data['next'])
+
+        resp = client.get('/api/admin/users/pending/', {'role': 'researcher'})
+        self.assertEqual([u['email'] for u in resp.data['results']], ['res@example.com'])
+        self.assertEqual(resp.data['results'][0]['research_institution'], None)
+
+    def test_admin_changelist_shows_counts(self):
+        self.client.force_login(self.admin)
+        resp = self.client.get('/admin/api/user/')
+        self.assertContains(resp, '5 users: 4 pending approval, 1 approved, 0 rejected')
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = create_admin()
+        self.doctor = User.objects.create_user(
+            'house@example.com', 'pass12345', full_name='Gregory House', role='doctor', medical_license_number='NJ-4477',
+        )
+        self.researcher = User.objects.create_user(
+            'curie@example.org', 'pass12345', full_name='Marie Curie', role='researcher', research_institution='Sorbonne',
+        )
+
+    def search(self, term):
+        return set(search_users(get_user_model().objects.all(), term).values_list('email', flat=True))
+
+    def test_index_follows_user_changes(self):
+        self.assertEqual(self.search('gory'), {'house@example.com'})
+        self.assertEqual(self.search('nj-44'), {'house@example.com'})
+        self.assertEqual(self.search('example.org'), {'curie@example.org'})
+        self.assertEqual(self.search('curie sorbonne'), {'curie@example.org'})
+        self.assertEqual(self.search('curie house'), set())
+        self.assertEqual(self.search('"say ""hi"""'), set())
+
+        researcher = get_user_model().objects.get(pk=self.researcher.pk)
+        researcher.research_institution = 'Institut Pasteur'
+        researcher.save()
+        self.assertEqual(self.search('sorbonne'), set())
+        self.assertEqual(self.search('pasteur'), {'curie@example.org'})
+
+        self.doctor.delete()
+        self.assertEqual(self.search('gory'), set())
+        rebuild_search_index()
+        self.assertEqual(self.search('pasteur'), {'curie@example.org'})
+
+    def test_short_terms_are_left_to_the_admin(self):
+        self.assertIsNone(search_users(get_user_model().objects.all(), 'ho'))
+
+    def test_admin_search(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/admin/api/user/', {'q': 'HOUSE'})
+        self.assertContains(resp, 'house@example.com')
+        self.assertNotContains(resp, 'curie@example.org')
+        self.assertTrue(any('MATCH' in q['sql'] for q in queries))
+
+        resp = self.client.get('/admin/api/user/', {'q': 'ie'})
+        self.assertContains(resp, 'curie@example.org')
+        self.assertNotContains(resp, 'house@example.com')
@@ -0,0 +1,250 @@
+"""
+Resumable chunked uploads for large CT archives.
+Each chunk is checksummed and then written to its offset in a preallocated file under
+MEDIA_ROOT/uploads/, so a dropped connection only costs the chunks in flight and the finished
+archive never has to be re-read or copied to be assembled.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .jobs import get_job_queue
+from .models import UploadChunk, UploadSession
+from .preflight import preflight_archive
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
+DEFAULT_SESSION_TTL = 24 * 60 * 60
+READ_BLOCK_SIZE = 64 * 1024
+# Chunks are held in memory up to this size while they are verified, then spooled to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A rejected upload operation, with the HTTP status to report"""
+
+    def __init__(self, detail, status_code=400, **extra):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.extra = extra
+
+    def as_dict(self):
+        return {'detail': self.detail, **self.extra}
+
+
+def session_path(session):
+    """Absolute path of the file a session's chunks are written into"""
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{session.pk}.part')
+
+
+def create_session(filename, total_size, chunk_size=None, user=None):
+    """
+    Start a chunked upload and preallocate its file
+
+    Args:
+        filename: Original archive filename
+        total_size: Size of the complete archive in bytes
+        chunk_size: Requested chunk size (defaults to UPLOAD_CHUNK_SIZE)
+        user: Uploading user (optional)
+
+    Returns:
+        UploadSession: The new session
+
+    Raises:
+        UploadError: If the sizes are out of bounds
+    """
+    max_size = getattr(settings, 'UPLOAD_MAX_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+    chunk_size = chunk_size or getattr(settings, 'UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    if not 0 < total_size <= max_size:
+        raise UploadError(f'total_size must be between 1 and {max_size} bytes.', status_code=413 if total_size > max_size else 400)
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise UploadError(f'chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes.')
+
+    # Opportunistically reclaim disk from abandoned uploads
+    cleanup_stale_sessions()
+
+    session = UploadSession.objects.create(
+        user=user if user is not None and user.is_authenticated else None,
+        filename=filename,
+        total_size=total_size,
+        chunk_size=chunk_size,
+    )
+    path = session_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.truncate(total_size)
+    return session
+
+
+def write_chunk(session, index, stream, expected_sha256):
+    """
+    Verify and store one chunk at its offset in the session file
+
+    The body is streamed from ``stream`` in small blocks while it is hashed, so memory use does
+    not depend on the chunk size. It is only written into the session file once its size and
+    checksum match, so a chunk that fails verification changes nothing: a bad retry of a chunk
+    that was already accepted leaves the stored bytes and their record intact.
+
+    Args:
+        session: Open UploadSession
+        index: Zero-based chunk number
+        stream: File-like object yielding the chunk body
+        expected_sha256: Hex SHA-256 the client computed for the chunk
+
+    Returns:
+        UploadChunk: The stored chunk record
+
+    Raises:
+        UploadError: On a finalized or expired session, bad index, size or checksum mismatch
+    """
+    if session.status != 'open':
+        raise UploadError('This upload has already been finalized.', status_code=409)
+    if not 0 <= index < session.total_chunks:
+        raise UploadError(f'Chunk index must be between 0 and {session.total_chunks - 1}.')
+    if not expected_sha256:
+        raise UploadError('Missing X-Chunk-SHA256 header.')
+
+    expected_size = session.expected_chunk_size(index)
+    digest = hashlib.sha256()
+    written = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+        while True:
+            block = stream.read(READ_BLOCK_SIZE) if stream else b''
+            if not block:
+                break
+            written += len(block)
+            if written > expected_size:
+                break
+            digest.update(block)
+            spool.write(block)
+
+        if written != expected_size:
+            raise UploadError(f'Chunk {index} must be exactly {expected_size} bytes.', received=written)
+        if digest.hexdigest() != expected_sha256.lower():
+            raise UploadError(f'Checksum mismatch for chunk {index}.', index=index)
+
+        spool.seek(0)
+        try:
+            f = open(session_path(session), 'r+b')
+        except FileNotFoundError:
+            # Finalized (the file moved to job storage) or cleaned up since the session was read
+            raise UploadError('This upload has already been finalized or has expired.', status_code=409)
+        with f:
+            f.seek(index * session.chunk_size)
+            shutil.copyfileobj(spool, f, READ_BLOCK_SIZE)
+
+    now = timezone.now()
+    try:
+        chunk, _ = UploadChunk.objects.update_or_create(
+            session=session, index=index,
+            defaults={'size': written, 'sha256': digest.hexdigest(), 'received_at': now},
+        )
+    except IntegrityError:
+        # A concurrent retry of the same chunk won the insert; the bytes are identical
+        chunk = UploadChunk.objects.get(session=session, index=index)
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=now)
+    return chunk
+
+
+def missing_ranges(session):
+    """
+    Chunk indices not yet received, collapsed into inclusive ``[start, end]`` ranges
+
+    Returns:
+        list: e.g. ``[[0, 0], [3, 7]]``
+    """
+    received = session.chunks.values_list('index', flat=True).order_by('index')
+    ranges = []
+    expected = 0
+    for index in received:
+        if index > expected:
+            ranges.append([expected, index - 1])
+        expected = index + 1
+    if expected < session.total_chunks:
+        ranges.append([expected, session.total_chunks - 1])
+    return ranges
+
+
+def finalize_session(session):
+    """
+    Check that every chunk arrived, preflight the assembled archive and queue it for prediction
+
+    The session is claimed with a conditional update first, so of two concurrent finalizes only
+    one goes ahead; if anything fails after the claim the session is reopened. The archive file
+    is moved into job storage rather than copied or re-read.
+
+    Args:
+        session: Open UploadSession
+
+    Returns:
+        PredictionJob: The queued prediction job
+
+    Raises:
+        UploadError: If chunks are missing or the session is already finalized or expired
+        PreflightError: If the assembled archive fails validation
+        QueueFull: If the prediction queue is at capacity (the session stays open)
+    """
+    missing = missing_ranges(session)
+    if missing:
+        raise UploadError('Some chunks have not been received yet.', status_code=409, missing_ranges=missing)
+
+    claimed = UploadSession.objects.filter(pk=session.pk, status='open').update(status='finalizing', updated_at=timezone.now())
+    if not claimed:
+        raise UploadError('This upload has already been finalized.', status_code=409)
+    session.status = 'finalizing'
+
+    path = session_path(session)
+    try:
+        try:
+            archive = open(path, 'rb')
+        except FileNotFoundError:
+            raise UploadError('This upload has expired.', status_code=409)
+        with archive:
+            preflight_archive(archive)
+        job = get_job_queue().submit_file(path, session.filename, user=session.user)
+    except BaseException:
+        UploadSession.objects.filter(pk=session.pk, status='finalizing').update(status='open')
+        session.status = 'open'
+        raise
+
+    session.status = 'finalized'
+    session.job = job
+    session.updated_at = timezone.now()
+    session.save(update_fields=['status', 'job', 'updated_at'])
+    session.chunks.all().delete()
+    return job
+
+
+def cleanup_stale_sessions(max_age=None):
+    """
+    Delete unfinished sessions with no activity for ``max_age`` seconds, and their files
+
+    Returns:
+        int: Number of sessions removed
+    """
+    max_age = max_age if max_age is not None else getattr(settings, 'UPLOAD_SESSION_TTL', DEFAULT_SESSION_TTL)
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    # A session left "finalizing" that long belonged to a process that died mid-finalize
+    stale = list(UploadSession.objects.filter(status__in=('open', 'finalizing'), updated_at__lt=cutoff))
+    for session in stale:
+        try:
+            os.remove(session_path(session))
+        except FileNotFoundError:
+            pass
+    if stale:
+        UploadSession.objects.filter(pk__in=[session.pk for session in stale]).delete()
+        logger.info(f"Removed {len(stale)} stale upload session(s)")
+    return len(stale)
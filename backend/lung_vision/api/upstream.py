@@ -0,0 +1,114 @@
+"""
+Shared HTTP client for the FastAPI inference upstream.
+Keeps a bounded pool of keep-alive connections that every view and worker thread reuses,
+instead of opening a new TCP connection per request.
+"""
+
+import logging
+import threading
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'http://127.0.0.1:8090'
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 300
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.2
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+
+class UpstreamClient:
+    """
+    Thread-safe, pooled HTTP client bound to one upstream base URL.
+
+    Retry policy: connection failures are retried for every method, since the request never
+    reached the server and streamed bodies rewind on replay. Read timeouts and 502/503/504
+    responses are only retried for idempotent methods, so a prediction is never run twice.
+    """
+
+    def __init__(self, base_url=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 retries=None, backoff_factor=None):
+        self.base_url = (base_url or getattr(settings, 'INFERENCE_BASE_URL', DEFAULT_BASE_URL)).rstrip('/')
+        self.pool_size = pool_size or getattr(settings, 'INFERENCE_POOL_SIZE', DEFAULT_POOL_SIZE)
+        self.connect_timeout = connect_timeout or getattr(settings, 'INFERENCE_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = read_timeout or getattr(settings, 'INFERENCE_TIMEOUT', DEFAULT_READ_TIMEOUT)
+        retries = getattr(settings, 'INFERENCE_RETRIES', DEFAULT_RETRIES) if retries is None else retries
+        backoff_factor = getattr(settings, 'INFERENCE_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF) if backoff_factor is None else backoff_factor
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            other=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def url(self, path):
+        """Resolve a path against the base URL (absolute URLs are used as-is)"""
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, self.url(path), **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_upstream_client():
+    """Get the process-wide inference upstream client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = UpstreamClient()
+        return _client
+
+
+@receiver(setting_changed)
+def _reset_upstream_client(*, setting, **kwargs):
+    """Rebuild the shared client when inference settings are overridden (e.g. in tests)"""
+    global _client
+    if not setting.startswith('INFERENCE_'):
+        return
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     RegisterView, 
@@ -6,6 +7,20 @@ from .views import (
     CustomTokenObtainPairView, 
     UserProfileView,
     FastPredictProxyView,
+    BatchPredictView,
+    PredictionJobCreateView,
+    PredictionJobDetailView,
+    InferenceStatusView,
+    PendingUsersView,
+    PredictionHistoryView,
+    UploadSessionCreateView,
+    UploadSessionDetailView,
+    UploadChunkView,
+    UploadSessionFinalizeView,
+    visualization_view,
+    predict_stream_view,
+    async_predict_view,
+    prediction_job_events_view,
 )
 from rest_framework_simplejwt.views import (
     TokenRefreshView,
@@ -32,5 +47,33 @@ urlpatterns = [
     
     # User profile
     path('user/me/', UserProfileView.as_view(), name='user_profile'),
-    path('predict/', FastPredictProxyView.as_view(), name='fastapi_predict_proxy'),
+    path(
+        'predict/',
+        async_predict_view if getattr(settings, 'PREDICT_ASYNC_PROXY', False) else FastPredictProxyView.as_view(),
+        name='fastapi_predict_proxy',
+    ),
+    path('predict/async/', async_predict_view, name='fastapi_predict_proxy_async'),
+    path('predict/batch/', BatchPredictView.as_view(), name='batch_predict'),
+
+    # Asynchronous prediction jobs
+    path('predict/jobs/', PredictionJobCreateView.as_view(), name='prediction_job_create'),
+    path('predict/jobs/<uuid:job_id>/', PredictionJobDetailView.as_view(), name='prediction_job_detail'),
+
+    # Progress as Server-Sent Events (best served through lung_vision.asgi)
+    path('predict/stream/', predict_stream_view, name='predict_stream'),
+    path('predict/jobs/<uuid:job_id>/events/', prediction_job_events_view, name='prediction_job_events'),
+    path('predictions/', PredictionHistoryView.as_view(), name='prediction_history'),
+    path('visualizations/<str:digest>/', visualization_view, name='prediction_visualization'),
+
+    # Resumable chunked uploads (finalizing queues a prediction job)
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload_session_create'),
+    path('uploads/<uuid:upload_id>/', UploadSessionDetailView.as_view(), name='upload_session_detail'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', UploadChunkView.as_view(), name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/finalize/', UploadSessionFinalizeView.as_view(), name='upload_session_finalize'),
+
+    # Approval queue (staff only)
+    path('admin/users/pending/', PendingUsersView.as_view(), name='pending_users'),
+
+    # Internal monitoring (staff only)
+    path('internal/inference/status/', InferenceStatusView.as_view(), name='inference_status'),
 ]
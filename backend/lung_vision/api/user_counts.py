@@ -0,0 +1,93 @@
+"""
+Per-role, per-status user counts.
+UserStatusCount holds one row per (role, account_status) pair, adjusted as users are created,
+change role or status, or are deleted, so the admin and the approval queue can show totals
+without counting the user table. ``manage.py rebuild_user_counts`` recomputes them from scratch
+should they ever drift (e.g. after users are changed by raw SQL).
+"""
+
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserStatusCount
+
+logger = logging.getLogger(__name__)
+
+
+def adjust_counts(deltas):
+    """
+    Apply count changes
+
+    Args:
+        deltas: Mapping of (role, account_status) to the change in its count
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        UserStatusCount.objects.bulk_create(
+            [UserStatusCount(role=role, account_status=status) for role, status in deltas],
+            ignore_conflicts=True,
+        )
+        for (role, status), delta in deltas.items():
+            UserStatusCount.objects.filter(role=role, account_status=status).update(count=F('count') + delta)
+
+
+def get_user_counts():
+    """
+    Current user counts
+
+    Returns:
+        dict: ``total``, ``by_status`` ({status: n}) and ``by_role`` ({role: {status: n}})
+    """
+    User = get_user_model()
+    by_status = {status: 0 for status, _ in User.ACCOUNT_STATUS_CHOICES}
+    by_role = {role: dict(by_status) for role, _ in User.ROLE_CHOICES}
+    for role, status, count in UserStatusCount.objects.values_list('role', 'account_status', 'count'):
+        by_status[status] = by_status.get(status, 0) + count
+        by_role.setdefault(role, {})[status] = count
+    return {'total': sum(by_status.values()), 'by_status': by_status, 'by_role': by_role}
+
+
+def rebuild_user_counts():
+    """Recompute every count from the user table"""
+    rows = get_user_model().objects.values('role', 'account_status').annotate(n=Count('pk')).order_by()
+    with transaction.atomic():
+        UserStatusCount.objects.all().delete()
+        UserStatusCount.objects.bulk_create(
+            UserStatusCount(role=row['role'], account_status=row['account_status'], count=row['n']) for row in rows
+        )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _count_saved_user(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        adjust_counts({(instance.role, instance.account_status): 1})
+        return
+    # Still the values loaded before this save: the snapshot is refreshed once save() returns
+    dirty = {
+        name: value for name, value in instance.get_dirty_fields().items()
+        if name in ('role', 'account_status') and (update_fields is None or name in update_fields)
+    }
+    if not dirty:
+        return
+    previous = (dirty.get('role', instance.role), dirty.get('account_status', instance.account_status))
+    if None in previous:
+        logger.warning(f"Can't tell the previous role/status of user {instance.pk}; run rebuild_user_counts")
+        return
+    deltas = Counter()
+    deltas[previous] -= 1
+    deltas[(instance.role, instance.account_status)] += 1
+    adjust_counts(deltas)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _count_deleted_user(sender, instance, **kwargs):
+    adjust_counts({(instance.role, instance.account_status): -1})
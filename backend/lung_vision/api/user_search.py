@@ -0,0 +1,98 @@
+"""
+Substring search over users for the admin.
+On SQLite the searchable columns are mirrored into an FTS5 table using the trigram tokenizer,
+kept in sync by signal receivers, so a search is an index lookup rather than a LIKE '%q%' scan
+of every column of every user. On PostgreSQL the admin's own icontains search is kept and served
+by pg_trgm GIN indexes on the same columns (created by migration 0012).
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.text import smart_split, unescape_string_literal
+
+SEARCH_FIELDS = ('email', 'full_name', 'medical_license_number', 'research_institution')
+SEARCH_TABLE = 'api_user_search'
+# The trigram tokenizer can only match substrings of at least three characters
+MIN_TERM_LENGTH = 3
+
+
+def search_index_enabled():
+    return connection.vendor == 'sqlite' and getattr(settings, 'USER_SEARCH_INDEX_ENABLED', True)
+
+
+def rebuild_search_index():
+    """Refill the search table from the user table"""
+    columns = ', '.join(SEARCH_FIELDS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) SELECT id, {columns} FROM api_user")
+
+
+def index_user(user):
+    """Write a user's searchable columns to the search table"""
+    columns = ', '.join(SEARCH_FIELDS)
+    placeholders = ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [user.pk])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES ({placeholders})",
+            [user.pk, *(getattr(user, field) for field in SEARCH_FIELDS)],
+        )
+
+
+def match_expression(search_term):
+    """
+    Translate an admin search into an FTS5 query: every term must appear in some column
+
+    Returns:
+        str or None: The MATCH expression, or None if a term is too short for the index
+    """
+    terms = []
+    for bit in smart_split(search_term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        if len(bit) < MIN_TERM_LENGTH:
+            return None
+        terms.append('"{}"'.format(bit.replace('"', '""')))
+    return ' AND '.join(terms) or None
+
+
+def search_users(queryset, search_term):
+    """
+    Filter users by the admin search term through the search index
+
+    Returns:
+        QuerySet or None: The filtered queryset, or None when the index can't answer the search
+            (not SQLite, index disabled, or a term shorter than three characters)
+    """
+    if not search_index_enabled():
+        return None
+    expression = match_expression(search_term)
+    if expression is None:
+        return None
+    return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [expression]))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _index_saved_user(sender, instance, created, update_fields=None, **kwargs):
+    if not search_index_enabled():
+        return
+    # Users saved without having been loaded have nothing to compare against; always reindex them
+    if not created and hasattr(instance, '_loaded_values'):
+        changed = set(instance.get_dirty_fields())
+        if update_fields is not None:
+            changed &= set(update_fields)
+        if not changed & set(SEARCH_FIELDS):
+            return
+    index_user(instance)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _unindex_deleted_user(sender, instance, **kwargs):
+    if not search_index_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [instance.pk])
@@ -1,17 +1,56 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .serializers import (
     RegisterSerializer, 
     DoctorRegistrationSerializer, 
     ResearcherRegistrationSerializer,
-    CustomTokenObtainPairSerializer
+    CustomTokenObtainPairSerializer,
+    PredictionJobSerializer,
+    PendingUserSerializer,
+    PredictionSerializer,
+    UploadSessionCreateSerializer,
 )
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.urls import reverse
 from rest_framework.views import APIView
+from django.shortcuts import get_object_or_404
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag, require_GET, require_POST
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import ValidationError
+import httpx
 import requests
+import time
+from datetime import datetime, timedelta
+from django.utils import timezone
+from .authentication import CachedJWTAuthentication
+from .batch import BatchError, csv_lines, ndjson_lines, patients_from_manifest, run_batch, split_patient_folders
+from .admission import AdmissionRejected, get_admission_controller, get_user_key
+from .circuit_breaker import CircuitOpen, get_circuit_breaker
+from .history import record_prediction
+from .inference import arun_prediction, run_prediction
+from .jobs import QueueFull, get_job_queue
+from .models import Prediction, PredictionJob, UploadSession
+from .pagination import JoinedQueuePagination, KeysetPagination
+from .prediction_cache import get_result_cache
+from .profiles import get_rendered_profile
+from . import progress
+from .preflight import PreflightError, preflight_archive
+from .routing import NoBackendAvailable, get_backend_pool
+from .visualizations import (
+    DIGEST_PATTERN, check_visualization_signature, present_prediction, sniff_content_type, visualization_path,
+)
+from .user_counts import get_user_counts
+from .uploads import UploadError, create_session, finalize_session, missing_ranges, write_chunk
 
 User = get_user_model()
 
@@ -84,33 +123,18 @@ class UserProfileView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, *args, **kwargs):
-        user = request.user
-        user_data = {
-            'id': user.id,
-            'email': user.email,
-            'full_name': user.full_name,
-            'role': user.role,
-            'country': user.country,
-            'phone_number': user.phone_number,
-            'date_joined': user.date_joined,
-        }
-        
-        # Add role-specific data
-        if user.role == 'doctor':
-            user_data.update({
-                'medical_license_number': user.medical_license_number,
-                'specialization': user.specialization,
-                'hospital_affiliation': user.hospital_affiliation,
-            })
-        elif user.role == 'researcher':
-            user_data.update({
-                'research_institution': user.research_institution,
-                'affiliation_type': user.affiliation_type,
-                'purpose_of_use': user.purpose_of_use,
-                'orcid_id': user.orcid_id,
-            })
-        
-        return Response(user_data)
+        # Same payload as the login response, rendered once and cached until the user is next saved
+        profile = get_rendered_profile(request.user)
+        last_modified = int(profile.last_modified.timestamp())
+        response = get_conditional_response(request, etag=profile.etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(profile.body, content_type='application/json')
+        response['ETag'] = profile.etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Per-user data: browsers may keep it but must revalidate, shared caches must not store it
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Authorization'])
+        return response
 
 
 class FastPredictProxyView(APIView):
@@ -122,20 +146,444 @@ class FastPredictProxyView(APIView):
             return Response({'detail': 'Missing file. Field name should be "file".'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            files = {
-                'file': (upload.name, upload.read(), 'application/zip')
-            }
-            resp = requests.post(
-                'http://127.0.0.1:8090/predict',
-                files=files,
-                timeout=300
-            )
-
-            try:
-                data = resp.json()
-            except ValueError:
-                data = {'detail': resp.text}
+            preflight_archive(upload)
+        except PreflightError as e:
+            return Response(e.as_dict(), status=e.status_code)
 
-            return Response(data, status=resp.status_code)
+        try:
+            started = time.monotonic()
+            with get_admission_controller().slot(get_user_key(request)):
+                outcome = run_prediction(upload)
+            record_prediction(outcome, user=request.user, duration=time.monotonic() - started)
+            return Response(
+                present_prediction(outcome.data, request),
+                status=outcome.status_code,
+                headers={'X-Prediction-Cache': outcome.cache_status},
+            )
+        except AdmissionRejected as e:
+            return Response(
+                {'detail': e.detail, 'reason': e.reason},
+                status=e.status_code,
+                headers={'Retry-After': str(e.retry_after)},
+            )
+        except CircuitOpen as e:
+            return Response(
+                {'detail': 'The inference service is currently unavailable. Please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(e.retry_after)},
+            )
+        except NoBackendAvailable:
+            return Response(
+                {'detail': 'No inference backend is available. Please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '10'},
+            )
         except requests.RequestException as e:
             return Response({'detail': f'Upstream error contacting FastAPI: {str(e)}'}, status=status.HTTP_502_BAD_GATEWAY)
+
+
+class BatchPredictView(APIView):
+    """
+    Run predictions for many patients in one request
+
+    Accepts either ``file``: one ZIP with a folder per patient, or ``manifest``: JSON
+    ``[{"patient_id": ..., "file": ...}]`` plus the per-patient archives it names as ``files``.
+    Results stream back as each patient finishes, as NDJSON (default, ending in a summary line)
+    or CSV with ``?export=csv``. Every patient's prediction takes its own admission slot; a
+    patient turned away by admission control comes back as a failed row with a ``reason``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        export = request.query_params.get('export') or request.data.get('export') or 'ndjson'
+        if export not in ('ndjson', 'csv'):
+            return Response({'detail': 'export must be "ndjson" or "csv".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if request.data.get('manifest'):
+                files = {upload.name: upload for upload in request.FILES.getlist('files')}
+                patients = patients_from_manifest(request.data['manifest'], files)
+            elif request.FILES.get('file'):
+                upload = request.FILES['file']
+                preflight_archive(upload)
+                patients = split_patient_folders(upload)
+            else:
+                return Response(
+                    {'detail': 'Send either "file" (an archive of patient folders) or "manifest" with "files".'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        except BatchError as e:
+            return Response(e.as_dict(), status=e.status_code)
+        except PreflightError as e:
+            return Response(e.as_dict(), status=e.status_code)
+
+        user_key = get_user_key(request)
+
+        def rows():
+            for row in run_batch(patients, user_key, user=request.user):
+                if row.get('result'):
+                    row['result'] = present_prediction(row['result'], request)
+                yield row
+
+        if export == 'csv':
+            response = StreamingHttpResponse(csv_lines(rows()), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="predictions.csv"'
+        else:
+            response = StreamingHttpResponse(ndjson_lines(rows()), content_type='application/x-ndjson')
+        response['X-Batch-Patients'] = str(len(patients))
+        # Flush every row as it arrives rather than when the batch finishes
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class PredictionJobCreateView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'detail': 'Missing file. Field name should be "file".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            preflight_archive(upload)
+        except PreflightError as e:
+            return Response(e.as_dict(), status=e.status_code)
+
+        try:
+            job = get_job_queue().submit(upload, user=request.user)
+        except QueueFull:
+            return Response(
+                {'detail': 'Prediction queue is full. Please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '30'},
+            )
+
+        data = PredictionJobSerializer(job).data
+        data['status_url'] = request.build_absolute_uri(reverse('prediction_job_detail', args=[job.pk]))
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class PredictionJobDetailView(generics.RetrieveAPIView):
+    permission_classes = [AllowAny]
+    serializer_class = PredictionJobSerializer
+    queryset = PredictionJob.objects.all()
+    lookup_url_kwarg = 'job_id'
+
+
+class PredictionHistoryView(generics.ListAPIView):
+    """
+    The requesting user's past predictions, newest first (staff see everyone's)
+
+    Filters: ``patient_id``, ``predicted_class``, ``created_after`` and ``created_before``
+    (ISO dates or datetimes). Paginated by cursor; follow ``next`` for older results.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = PredictionSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = Prediction.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+
+        params = self.request.query_params
+        if params.get('patient_id'):
+            queryset = queryset.filter(patient_id=params['patient_id'])
+        if params.get('predicted_class'):
+            queryset = queryset.filter(predicted_class=params['predicted_class'])
+        if params.get('created_after'):
+            queryset = queryset.filter(created_at__gte=self._parse_bound('created_after'))
+        if params.get('created_before'):
+            queryset = queryset.filter(created_at__lt=self._parse_bound('created_before', end_of_day=True))
+        return queryset
+
+    def _parse_bound(self, name, end_of_day=False):
+        value = self.request.query_params[name]
+        try:
+            day = parse_date(value)
+            parsed = None if day else parse_datetime(value)
+        except ValueError:
+            day = parsed = None
+        if day:
+            # A bare date covers the whole day
+            parsed = datetime.combine(day + timedelta(days=1) if end_of_day else day, datetime.min.time())
+        elif parsed is None:
+            raise ValidationError({name: 'Expected an ISO 8601 date or datetime.'})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+
+class InferenceStatusView(APIView):
+    """Internal view of the prediction path: circuit breaker, backends, admission and cache"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'circuit_breaker': get_circuit_breaker().snapshot(),
+            'backends': get_backend_pool().snapshot(),
+            'admission': get_admission_controller().stats(),
+            'result_cache': get_result_cache().stats(),
+            'job_queue': {'depth': get_job_queue().depth()},
+        })
+
+
+class PendingUsersView(generics.ListAPIView):
+    """
+    The approval queue: registrations waiting for approval, oldest first (staff only)
+
+    Filter: ``role``. Paginated by cursor; follow ``next`` for newer registrations. ``counts``
+    gives the pending total overall and per role, from the maintained user counts.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = PendingUserSerializer
+    pagination_class = JoinedQueuePagination
+
+    def get_queryset(self):
+        queryset = get_user_model().objects.filter(account_status='pending')
+        if self.request.query_params.get('role'):
+            queryset = queryset.filter(role=self.request.query_params['role'])
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        counts = get_user_counts()
+        response.data['counts'] = {
+            'pending': counts['by_status']['pending'],
+            'by_role': {role: statuses.get('pending', 0) for role, statuses in counts['by_role'].items()},
+        }
+        return response
+
+
+def upload_session_payload(request, session):
+    """Describe an upload session and the chunks it is still waiting for"""
+    data = {
+        'upload_id': session.pk,
+        'filename': session.filename,
+        'status': session.status,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': session.total_chunks,
+        'created_at': session.created_at,
+        'updated_at': session.updated_at,
+    }
+    if session.status == 'open':
+        data['missing_ranges'] = missing_ranges(session)
+    if session.job_id:
+        data['job_id'] = session.job_id
+        data['status_url'] = request.build_absolute_uri(reverse('prediction_job_detail', args=[session.job_id]))
+    return data
+
+
+class UploadSessionCreateView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = create_session(user=request.user, **serializer.validated_data)
+        except UploadError as e:
+            return Response(e.as_dict(), status=e.status_code)
+        return Response(upload_session_payload(request, session), status=status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, upload_id, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        return Response(upload_session_payload(request, session))
+
+
+class UploadChunkView(APIView):
+    permission_classes = [AllowAny]
+
+    def put(self, request, upload_id, index, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        try:
+            chunk = write_chunk(session, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+        except UploadError as e:
+            return Response(e.as_dict(), status=e.status_code)
+        return Response({'index': chunk.index, 'size': chunk.size, 'sha256': chunk.sha256})
+
+
+class UploadSessionFinalizeView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request, upload_id, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=upload_id)
+        try:
+            finalize_session(session)
+        except UploadError as e:
+            return Response(e.as_dict(), status=e.status_code)
+        except PreflightError as e:
+            return Response(e.as_dict(), status=e.status_code)
+        except QueueFull:
+            return Response(
+                {'detail': 'Prediction queue is full. Please try finalizing again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '30'},
+            )
+        return Response(upload_session_payload(request, session), status=status.HTTP_202_ACCEPTED)
+
+
+def _visualization_etag(request, digest, max_age):
+    return digest
+
+
+@require_GET
+def visualization_view(request, digest):
+    """Serve a stored visualization to holders of a signed URL"""
+    if not DIGEST_PATTERN.match(digest):
+        raise Http404()
+    max_age = check_visualization_signature(digest, request.GET.get('expires'), request.GET.get('signature'))
+    if max_age is None:
+        return JsonResponse({'detail': 'Invalid or expired visualization link.'}, status=403)
+    return _serve_visualization(request, digest, max_age)
+
+
+@etag(_visualization_etag)
+def _serve_visualization(request, digest, max_age):
+    try:
+        f = open(visualization_path(digest), 'rb')
+    except FileNotFoundError:
+        raise Http404()
+    content_type = sniff_content_type(f.read(16))
+    f.seek(0)
+    response = FileResponse(f, content_type=content_type)
+    # Content-addressed, so the browser can keep it until the link expires; patient images must
+    # never be stored by shared caches
+    response['Cache-Control'] = f'private, max-age={min(max_age, 31536000)}, immutable'
+    return response
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _present_job(request):
+    def present(job):
+        data = PredictionJobSerializer(job, context={'request': request}).data
+        data['status_url'] = request.build_absolute_uri(reverse('prediction_job_detail', args=[job.pk]))
+        return data
+    return present
+
+
+def _authenticate(request):
+    """Optional JWT authentication for the plain Django views below (DRF views do this themselves)"""
+    result = CachedJWTAuthentication().authenticate(request)
+    return result[0] if result else None
+
+
+@csrf_exempt
+@require_POST
+async def predict_stream_view(request):
+    """
+    Accept an archive and stream its progress as Server-Sent Events
+
+    Emits ``upload_received``, ``preflight_done``, ``queued`` (with the queue position, again
+    whenever it changes), ``upstream_started`` and finally ``completed`` or ``failed`` with the
+    job payload. Problems before a job exists are reported as a single ``error`` event. Clients
+    that lose the connection can resume from ``/api/predict/jobs/<job_id>/events/``.
+    """
+    try:
+        user = await sync_to_async(_authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=401)
+
+    upload = await sync_to_async(lambda: request.FILES.get('file'))()
+    if not upload:
+        return JsonResponse({'detail': 'Missing file. Field name should be "file".'}, status=400)
+
+    async def events():
+        yield progress.format_event(progress.UPLOAD_RECEIVED, {'filename': upload.name, 'size': upload.size})
+        try:
+            report = await sync_to_async(preflight_archive)(upload)
+        except PreflightError as e:
+            yield progress.format_event(progress.ERROR, {'status': e.status_code, **e.as_dict()})
+            return
+        yield progress.format_event(progress.PREFLIGHT_DONE, report._asdict())
+
+        try:
+            job = await sync_to_async(get_job_queue().submit)(upload, user=user)
+        except QueueFull:
+            yield progress.format_event(progress.ERROR, {
+                'status': 503, 'detail': 'Prediction queue is full. Please try again shortly.', 'retry_after': 30,
+            })
+            return
+
+        async for frame in progress.job_events(job.pk, _present_job(request)):
+            yield frame
+
+    return event_stream_response(events())
+
+
+@csrf_exempt
+@require_POST
+async def async_predict_view(request):
+    """
+    Native async variant of FastPredictProxyView for ASGI deployments
+
+    Same request, response and error contract, but the upstream call is awaited over httpx, so
+    a waiting prediction costs a coroutine instead of a thread.
+    """
+    try:
+        request.user = await sync_to_async(_authenticate)(request) or AnonymousUser()
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=401)
+
+    upload = await sync_to_async(lambda: request.FILES.get('file'))()
+    if not upload:
+        return JsonResponse({'detail': 'Missing file. Field name should be "file".'}, status=400)
+
+    try:
+        await sync_to_async(preflight_archive, thread_sensitive=False)(upload)
+    except PreflightError as e:
+        return JsonResponse(e.as_dict(), status=e.status_code)
+
+    controller = get_admission_controller()
+    user_key = get_user_key(request)
+    try:
+        started = time.monotonic()
+        await controller.aacquire(user_key)
+        try:
+            outcome = await arun_prediction(upload)
+        finally:
+            controller.release(user_key)
+        await sync_to_async(record_prediction)(outcome, user=request.user, duration=time.monotonic() - started)
+        response = JsonResponse(present_prediction(outcome.data, request), status=outcome.status_code, safe=False)
+        response['X-Prediction-Cache'] = outcome.cache_status
+        return response
+    except AdmissionRejected as e:
+        response = JsonResponse({'detail': e.detail, 'reason': e.reason}, status=e.status_code)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    except CircuitOpen as e:
+        response = JsonResponse(
+            {'detail': 'The inference service is currently unavailable. Please try again shortly.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    except NoBackendAvailable:
+        response = JsonResponse(
+            {'detail': 'No inference backend is available. Please try again shortly.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+        response['Retry-After'] = '10'
+        return response
+    except httpx.HTTPError as e:
+        return JsonResponse({'detail': f'Upstream error contacting FastAPI: {str(e)}'}, status=status.HTTP_502_BAD_GATEWAY)
+
+
+@require_GET
+async def prediction_job_events_view(request, job_id):
+    """Stream the remaining progress of an existing job as Server-Sent Events"""
+    return event_stream_response(progress.job_events(job_id, _present_job(request)))
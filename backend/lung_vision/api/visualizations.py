@@ -0,0 +1,176 @@
+"""
+Content-addressed storage for prediction visualizations.
+The inference service returns its images as inline base64 strings; these are moved to files named
+by their SHA-256 and replaced in the payload by URLs. The URLs handed to clients are signed and
+expire, so only someone who was shown the prediction can fetch its images, and only the browser
+(never a shared cache) keeps them.
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.signing import Signer
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+VISUALIZATION_FIELDS = (
+    'prediction_visualization',
+    'attention_visualization',
+    'feature_focus_visualization',
+)
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+)
+DEFAULT_URL_TTL = 7 * 24 * 60 * 60
+
+
+def visualization_path(digest):
+    """Absolute path of a stored visualization"""
+    return os.path.join(settings.MEDIA_ROOT, 'visualizations', digest[:2], digest)
+
+
+def sniff_content_type(header):
+    for signature, content_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    return 'application/octet-stream'
+
+
+def _url_signature(digest, expires):
+    return Signer(salt='api.visualizations').signature(f'{digest}:{expires}')
+
+
+def sign_visualization_url(url, digest):
+    """
+    Add an expiry and signature to a visualization URL
+
+    The expiry is rounded to VISUALIZATION_URL_TTL, so the same image keeps the same URL (and
+    browser cache entry) for at least one TTL and at most two.
+    """
+    ttl = getattr(settings, 'VISUALIZATION_URL_TTL', DEFAULT_URL_TTL)
+    expires = (int(time.time()) // ttl + 2) * ttl
+    return f"{url}?{urlencode({'expires': expires, 'signature': _url_signature(digest, expires)})}"
+
+
+def check_visualization_signature(digest, expires, signature):
+    """
+    Verify a signed visualization URL
+
+    Returns:
+        int or None: Seconds until the URL expires, or None if it is unsigned, forged or expired
+    """
+    try:
+        remaining = int(expires) - int(time.time())
+    except (TypeError, ValueError):
+        return None
+    if remaining <= 0 or not signature or not constant_time_compare(signature, _url_signature(digest, int(expires))):
+        return None
+    return remaining
+
+
+def store_visualization(encoded):
+    """
+    Decode a base64 image and store it under its content digest
+
+    Args:
+        encoded: Base64 string, optionally prefixed with a ``data:`` URI header
+
+    Returns:
+        str or None: Hex SHA-256 of the image bytes, or None if the string is not valid base64
+    """
+    if encoded.startswith('data:'):
+        encoded = encoded.partition(',')[2]
+    try:
+        raw = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+    digest = hashlib.sha256(raw).hexdigest()
+    path = visualization_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so concurrent requests never serve a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def offload_visualizations(data):
+    """
+    Replace inline base64 visualizations with ``<field>_url`` references
+
+    The inline fields are kept but set to None, and the URLs are site-relative so the payload
+    can be cached and persisted independently of the request host.
+
+    Args:
+        data: Prediction payload from the inference service
+
+    Returns:
+        dict: The payload with visualizations offloaded (``data`` itself is not modified)
+    """
+    if not isinstance(data, dict):
+        return data
+    result = dict(data)
+    for field in VISUALIZATION_FIELDS:
+        value = result.get(field)
+        if not isinstance(value, str) or not value:
+            continue
+        digest = store_visualization(value)
+        if digest is None:
+            logger.warning(f"Leaving undecodable {field} inline")
+            continue
+        result[field] = None
+        result[f'{field}_url'] = reverse('prediction_visualization', args=[digest])
+    return result
+
+
+def wants_inline_visualizations(request):
+    """Check whether the client asked for the legacy inline base64 format"""
+    flag = getattr(request, 'query_params', request.GET).get('inline_visualizations', '')
+    if flag:
+        return flag.lower() in ('1', 'true', 'yes')
+    return getattr(settings, 'PREDICTION_INLINE_VISUALIZATIONS', False)
+
+
+def present_prediction(data, request):
+    """
+    Shape an offloaded prediction payload for a response
+
+    Makes visualization URLs absolute and signed, or re-inlines the images as base64 when the
+    client opted into the legacy format.
+    """
+    if not isinstance(data, dict):
+        return data
+    result = dict(data)
+    inline = wants_inline_visualizations(request)
+    for field in VISUALIZATION_FIELDS:
+        url = result.get(f'{field}_url')
+        if not url:
+            continue
+        digest = url.rstrip('/').rsplit('/', 1)[-1]
+        if inline:
+            try:
+                with open(visualization_path(digest), 'rb') as f:
+                    result[field] = base64.b64encode(f.read()).decode('ascii')
+            except OSError:
+                logger.error(f"Visualization {digest} is missing from storage")
+            del result[f'{field}_url']
+        else:
+            result[f'{field}_url'] = sign_visualization_url(request.build_absolute_uri(url), digest)
+    return result
@@ -30,7 +30,7 @@ ALLOWED_HOSTS = ['*']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     # 'DEFAULT_THROTTLE_CLASSES': [
     #     'rest_framework.throttling.UserRateThrottle',
@@ -68,6 +68,9 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_BLACKLIST_ENABLED': True,
     'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.CustomTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.IndexedTokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'api.serializers.IndexedTokenVerifySerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'api.serializers.IndexedTokenBlacklistSerializer',
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -115,6 +118,9 @@ DATABASES = {
     }
 }
 
+# Admin user search through the SQLite FTS5 trigram index (api.user_search); PostgreSQL uses pg_trgm
+USER_SEARCH_INDEX_ENABLED = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -152,11 +158,102 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files (license scans, queued prediction archives)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Inference service (FastAPI model server)
+INFERENCE_BASE_URL = 'http://127.0.0.1:8090'
+INFERENCE_PREDICT_PATH = '/predict'
+INFERENCE_POOL_SIZE = 10  # keep-alive connections shared by all threads in a process
+INFERENCE_CONNECT_TIMEOUT = 5  # seconds
+INFERENCE_TIMEOUT = 300  # seconds to wait for the model's response
+INFERENCE_RETRIES = 2  # connection failures (any method) and idempotent request failures
+INFERENCE_RETRY_BACKOFF = 0.2  # seconds, doubled per retry
+
+# Inference backends, balanced by least outstanding requests. Empty means INFERENCE_BASE_URL only.
+# e.g. [{'url': 'http://10.0.0.11:8090', 'max_concurrency': 4}, {'url': 'http://10.0.0.12:8090', 'max_concurrency': 2}]
+INFERENCE_BACKENDS = []
+INFERENCE_HEALTH_CHECK_PATH = '/health'
+INFERENCE_HEALTH_CHECK_INTERVAL = 10  # seconds between active health checks (0 disables them)
+INFERENCE_HEALTH_CHECK_TIMEOUT = 2  # seconds
+INFERENCE_EJECT_AFTER_FAILURES = 3  # consecutive failed requests before a backend is ejected
+INFERENCE_EJECTION_SECONDS = 30  # how long a passively ejected backend stays out of rotation
+INFERENCE_BACKEND_ACQUIRE_TIMEOUT = 5  # seconds to wait for a free backend slot
+
+# Circuit breaker around the inference upstream (state at /api/internal/inference/status/)
+INFERENCE_BREAKER_FAILURE_THRESHOLD = 5  # consecutive failures or slow calls before opening
+INFERENCE_BREAKER_SLOW_CALL_SECONDS = 120  # responses slower than this count as failures
+INFERENCE_BREAKER_RESET_TIMEOUT = 30  # seconds open before a half-open trial request
+INFERENCE_BREAKER_HALF_OPEN_CALLS = 1  # concurrent trial requests while half-open
+INFERENCE_STREAM_CHUNK_SIZE = 64 * 1024  # bytes read from the upload per forwarded chunk
+INFERENCE_MODEL_VERSION = '1'  # bump when the model changes to invalidate cached predictions
+INFERENCE_ASYNC_POOL_SIZE = 100  # upstream connections per backend for the async (ASGI) predict path
+
+# Serve /api/predict/ with the native async view; only worthwhile when deployed through lung_vision.asgi.
+# /api/predict/async/ is always available.
+PREDICT_ASYNC_PROXY = False
+
+# Prediction result cache, keyed on the SHA-256 of the archive's DICOM contents
+PREDICTION_CACHE_ENABLED = True
+PREDICTION_CACHE_MAX_ENTRIES = 512
+PREDICTION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PREDICTION_CACHE_TTL = 24 * 60 * 60  # seconds
+
+# Visualizations are stored under MEDIA_ROOT/visualizations/ and returned as *_url references.
+# Clients can still ask for inline base64 per request with ?inline_visualizations=1.
+PREDICTION_INLINE_VISUALIZATIONS = False
+VISUALIZATION_URL_TTL = 7 * 24 * 60 * 60  # signed *_url links stay valid for one to two TTLs
+
+# Upload preflight: archives are checked from the ZIP central directory before forwarding
+PREFLIGHT_MAX_ENTRIES = 10000  # files per archive
+PREFLIGHT_MAX_UNCOMPRESSED_BYTES = 4 * 1024 * 1024 * 1024  # total expanded size
+PREFLIGHT_MAX_COMPRESSION_RATIO = 100  # expanded/compressed, per entry and overall
+
+# Resumable chunked uploads (/api/uploads/), assembled under MEDIA_ROOT/uploads/
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # default chunk size offered to clients
+UPLOAD_MAX_SIZE = 1024 * 1024 * 1024  # matches the 1 GB limit in the frontend
+UPLOAD_SESSION_TTL = 24 * 60 * 60  # seconds of inactivity before a session is garbage collected
+
+# Admission control for the synchronous /api/predict/ endpoint
+PREDICT_ADMISSION_MAX_IN_FLIGHT = 8  # predictions forwarded at once per process
+PREDICT_ADMISSION_MAX_PER_USER = 2  # running + queued predictions per user (or client IP)
+PREDICT_ADMISSION_MAX_QUEUED = 8  # requests allowed to wait for a slot; beyond this 503
+PREDICT_ADMISSION_QUEUE_TIMEOUT = 10  # seconds a request may wait before 503
+PREDICT_ADMISSION_RETRY_AFTER = 15  # seconds, sent in Retry-After on 429/503
+
+# Asynchronous prediction jobs (/api/predict/jobs/)
+PREDICTION_JOB_WORKERS = 2  # background threads forwarding jobs per process
+PREDICTION_JOB_QUEUE_SIZE = 20  # jobs waiting beyond this are rejected with 503
+PREDICTION_JOB_HEARTBEAT_INTERVAL = 10  # seconds; a running job that misses 3 heartbeats is re-queued
+PREDICTION_EVENTS_POLL_INTERVAL = 5  # seconds between job re-checks/keepalives on SSE streams
+
+# Batch predictions (/api/predict/batch/)
+BATCH_PREDICT_CONCURRENCY = 2  # patients of one batch forwarded in parallel
+BATCH_PREDICT_MAX_PATIENTS = 100
+
+# Authenticated user cache (api.authentication.CachedJWTAuthentication)
+AUTH_USER_CACHE_MAX_ENTRIES = 10000
+AUTH_USER_CACHE_TTL = 5 * 60  # seconds
+# Name of a CACHES alias shared by all workers (e.g. Redis). With one set, a change saved by any
+# worker applies everywhere on the next request; with None the cache is per process, and a change
+# saved by another worker (a deactivation, rejection or new password) applies here only after
+# AUTH_USER_CACHE_LOCAL_TTL. Cache hits make no database query in either mode.
+AUTH_USER_CACHE_ALIAS = None
+AUTH_USER_CACHE_LOCAL_TTL = 30  # seconds
+
+# Refresh token revocation index and pruning (api.revocation)
+TOKEN_REVOCATION_BUCKET_SECONDS = 5 * 60
+# How often a process picks up tokens blacklisted by other processes
+TOKEN_REVOCATION_SYNC_INTERVAL = 1  # seconds
+TOKEN_PRUNE_BATCH_SIZE = 1000
+TOKEN_PRUNE_INTERVAL = 60 * 60  # seconds between runs of `prune_tokens --loop`
+
 # Email Configuration
 # For development, we'll use console backend to print emails to console
 # For production, configure SMTP settings
@@ -175,6 +272,17 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Development
 DEFAULT_FROM_EMAIL = 'LungVision <ahmaraamir33@gmail.com>'
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
 
+# Messages sent per SMTP connection by EmailService's bulk methods
+EMAIL_BULK_CHUNK_SIZE = 100
+
+# Email outbox (api.outbox): approvals/rejections queue their emails, `manage.py send_emails --loop` sends them
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8  # then the message is dead-lettered
+EMAIL_OUTBOX_BACKOFF_BASE = 30  # seconds before the first retry, doubling per attempt
+EMAIL_OUTBOX_BACKOFF_MAX = 60 * 60
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 5 * 60  # reclaim messages from a worker that died mid-batch
+EMAIL_OUTBOX_POLL_INTERVAL = 5
+
 # Frontend URL (for email links)
 FRONTEND_LOGIN_URL = 'http://localhost:3000/role-selection'
 
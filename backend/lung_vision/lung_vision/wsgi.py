@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lung_vision.settings')
 
 application = get_wsgi_application()
+
+# Imported after the application so the app registry is ready
+from api.jobs import start_job_queue  # noqa: E402
+
+start_job_queue()
@@ -14,10 +14,17 @@ type PredictionResponse = {
   prediction_visualization?: string | null;
   attention_visualization?: string | null;
   feature_focus_visualization?: string | null;
+  prediction_visualization_url?: string | null;
+  attention_visualization_url?: string | null;
+  feature_focus_visualization_url?: string | null;
   message: string;
   processing_info?: Record<string, any>;
 };
 
+// Visualizations are served as cacheable URLs; older responses carry them inline as base64
+const visualizationSrc = (url?: string | null, inline?: string | null) =>
+  url || (inline ? `data:image/png;base64,${inline}` : null);
+
 export function ZipUploadCard() {
   const inputRef = useRef<HTMLInputElement | null>(null);
   const [isDragging, setIsDragging] = useState(false);
@@ -103,6 +110,9 @@ export function ZipUploadCard() {
     }
   };
 
+  const predictionSrc = visualizationSrc(result?.prediction_visualization_url, result?.prediction_visualization);
+  const featureFocusSrc = visualizationSrc(result?.feature_focus_visualization_url, result?.feature_focus_visualization);
+
   return (
     <Card className="border-blue-200 bg-gradient-to-b from-white to-blue-50/40">
       <CardHeader>
@@ -251,10 +261,10 @@ export function ZipUploadCard() {
               </div>
             )}
 
-            {(result.prediction_visualization || result.feature_focus_visualization) && (
+            {(predictionSrc || featureFocusSrc) && (
               <div className="grid grid-cols-1 gap-4">
                 <div className="grid md:grid-cols-2 gap-4">
-                  {result.prediction_visualization && (
+                  {predictionSrc && (
                     <div className="rounded-md border bg-white p-2">
                       <div className="flex items-center justify-between mb-2 text-sm text-gray-700">
                         <div className="flex items-center gap-2">
@@ -262,7 +272,7 @@ export function ZipUploadCard() {
                         </div>
                         <button
                           type="button"
-                          onClick={() => setLightbox({ open: true, src: `data:image/png;base64,${result.prediction_visualization}`, title: 'Prediction Summary' })}
+                          onClick={() => setLightbox({ open: true, src: predictionSrc, title: 'Prediction Summary' })}
                           className="inline-flex items-center gap-1 text-blue-600 hover:text-blue-700"
                         >
                           <Maximize2 className="w-4 h-4" /> View larger
@@ -270,14 +280,14 @@ export function ZipUploadCard() {
                       </div>
                       <div className="bg-gray-50 rounded overflow-hidden flex items-center justify-center">
                         <img
-                          src={`data:image/png;base64,${result.prediction_visualization}`}
+                          src={predictionSrc}
                           alt="Prediction Visualization"
                           className="w-full max-h-[22rem] object-contain"
                         />
                       </div>
                     </div>
                   )}
-                  {result.feature_focus_visualization && (
+                  {featureFocusSrc && (
                     <div className="rounded-md border bg-white p-2">
                       <div className="flex items-center justify-between mb-2 text-sm text-gray-700">
                         <div className="flex items-center gap-2">
@@ -285,7 +295,7 @@ export function ZipUploadCard() {
                         </div>
                         <button
                           type="button"
-                          onClick={() => setLightbox({ open: true, src: `data:image/png;base64,${result.feature_focus_visualization}`, title: 'Model Focus (Grad-CAM)' })}
+                          onClick={() => setLightbox({ open: true, src: featureFocusSrc, title: 'Model Focus (Grad-CAM)' })}
                           className="inline-flex items-center gap-1 text-blue-600 hover:text-blue-700"
                         >
                           <Maximize2 className="w-4 h-4" /> View larger
@@ -293,7 +303,7 @@ export function ZipUploadCard() {
                       </div>
                       <div className="bg-gray-50 rounded overflow-hidden flex items-center justify-center">
                         <img
-                          src={`data:image/png;base64,${result.feature_focus_visualization}`}
+                          src={featureFocusSrc}
                           alt="Feature Focus Visualization"
                           className="w-full max-h-[22rem] object-contain"
                         />